@@ -0,0 +1,75 @@
+"""
+Throughput of `on_message` at N concurrent users, with a stub chat model.
+
+Each user sends one message; the stub model sleeps `--latency` seconds per call,
+standing in for an OpenAI round-trip. "sequential" awaits users one after another
+(what a blocking handler degrades to), "concurrent" lets all turns overlap on one loop.
+
+    python benchmarks/bench_async_turns.py --users 1 10 50 --latency 0.2
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import sys
+import time
+
+# Allow running as a script: `python benchmarks/bench_async_turns.py`
+if __package__ is None and __name__ == "__main__":
+    sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from benchmarks.stubs import StubChatModel, fake_update, install_stub_llm, prepare_offline_env
+
+prepare_offline_env()
+
+import src.bot as bot
+
+MESSAGES = [
+    "I want to book a buggy",
+    "How much is the Burj Khalifa jet ski tour?",
+    "Hi",
+]
+
+
+def _reset() -> None:
+    bot.sessions.clear()
+
+
+async def _run(users: int, concurrent: bool) -> float:
+    _reset()
+    updates = [fake_update(10_000 + i, MESSAGES[i % len(MESSAGES)]) for i in range(users)]
+    start = time.perf_counter()
+    # The water executor is verbose; keep its chain logging out of the results table
+    with contextlib.redirect_stdout(io.StringIO()):
+        if concurrent:
+            await asyncio.gather(*(bot.on_message(u, None) for u in updates))
+        else:
+            for u in updates:
+                await bot.on_message(u, None)
+    elapsed = time.perf_counter() - start
+    assert all(u.message.replies for u in updates), "every user should get a reply"
+    return elapsed
+
+
+async def main_async(user_counts, latency: float) -> None:
+    install_stub_llm(bot, StubChatModel(latency_s=latency))
+    print(f"stub latency per LLM call: {latency * 1000:.0f} ms")
+    print(f"{'users':>6} {'mode':>11} {'wall s':>8} {'msgs/s':>8}")
+    for users in user_counts:
+        for concurrent in (False, True):
+            elapsed = await _run(users, concurrent)
+            mode = "concurrent" if concurrent else "sequential"
+            print(f"{users:>6} {mode:>11} {elapsed:>8.2f} {users / elapsed:>8.1f}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark concurrent on_message throughput with a stub LLM.")
+    parser.add_argument("--users", type=int, nargs="+", default=[1, 10, 50])
+    parser.add_argument("--latency", type=float, default=0.2, help="Stub LLM latency per call, in seconds.")
+    args = parser.parse_args()
+    asyncio.run(main_async(args.users, args.latency))
+
+
+if __name__ == "__main__":
+    main()
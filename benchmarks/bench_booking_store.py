@@ -0,0 +1,116 @@
+"""
+Booking store throughput: in-memory dict vs SQLite (WAL, write-through).
+
+Two workloads per backend:
+  * raw: get + in-place edit + save on the store itself;
+  * tool: `booking_update` calls through the LangChain tool, as the agent does,
+    cycling through draft fields so every call really writes.
+Runs with --threads > 1 spread users over worker threads, like the sync tools
+running on the executor.
+
+    python benchmarks/bench_booking_store.py --updates 20000 --users 500 --threads 1 8
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Allow running as a script: `python benchmarks/bench_booking_store.py`
+if __package__ is None and __name__ == "__main__":
+    sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from benchmarks.stubs import prepare_offline_env
+
+prepare_offline_env()
+
+import src.tools as tools
+from src.booking_store import BookingStore, make_booking_store
+
+PATCHES = [
+    {"activity": "buggy", "vehicle_model": "4-seater"},
+    {"quantity": 2},
+    {"duration_min": 60},
+    {"date_time_iso": "2026-01-20T10:00:00+04:00"},
+    {"pickup_required": True},
+    {"payment_method": "card"},
+    {"customer_name": "Bench"},
+    {"quantity": 3},
+]
+
+
+def _raw_worker(store: BookingStore, users: range, updates: int) -> None:
+    for i in range(updates):
+        uid = str(users[i % len(users)])
+        draft = store.get(uid) or {"status": "collecting", "quantity": 0, "notes": []}
+        draft["quantity"] = i
+        store[uid] = draft
+
+
+def _tool_worker(users: range, updates: int) -> None:
+    for i in range(updates):
+        uid = str(users[i % len(users)])
+        tools.booking_update.invoke({"user_id": uid, "patch": PATCHES[i % len(PATCHES)]})
+
+
+def _run(threads: int, updates: int, users: int, work) -> float:
+    per_thread = updates // threads
+    slices = [range(t * users // threads, (t + 1) * users // threads) for t in range(threads)]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(lambda s: work(s, per_thread), slices))
+    return per_thread * threads / (time.perf_counter() - start)
+
+
+def _worker_main(args) -> None:
+    """Child process: BOOKING_STORE is set, so src.tools already uses that backend."""
+    # Same session slot as the tools' desert store, but a separate SQLite file; cleared before the tool run
+    store = make_booking_store("desert", path=os.environ["BOOKING_DB_PATH"] + ".raw")
+    rates = {}
+    for threads in args.threads:
+        rates[f"raw:{threads}"] = _run(threads, args.updates, args.users, lambda s, n: _raw_worker(store, s, n))
+        tools.BOOKINGS.clear()
+        rates[f"tool:{threads}"] = _run(threads, args.updates, args.users, _tool_worker)
+    print(json.dumps(rates))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compare booking store backends.")
+    parser.add_argument("--updates", type=int, default=20000)
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 8])
+    parser.add_argument("--min-sqlite-rate", type=float, default=500.0,
+                        help="Fail if SQLite tool updates/s drop below this.")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.worker:
+        _worker_main(args)
+        return
+
+    tmpdir = tempfile.mkdtemp(prefix="bench_bookings_")
+    print(f"{'backend':>8} {'workload':>8} {'threads':>7} {'updates/s':>11}")
+    slowest_sqlite_tool = float("inf")
+    for backend in ("memory", "sqlite"):
+        # The tools pick their backend at import, so each one runs in its own process
+        env = dict(os.environ, BOOKING_STORE=backend, BOOKING_DB_PATH=os.path.join(tmpdir, f"{backend}.sqlite3"))
+        cmd = [sys.executable, os.path.abspath(__file__), "--worker", "--updates", str(args.updates),
+               "--users", str(args.users), "--threads", *map(str, args.threads)]
+        out = subprocess.run(cmd, env=env, capture_output=True, text=True, check=True).stdout
+        rates = json.loads(out.strip().splitlines()[-1])
+        for key, rate in rates.items():
+            workload, threads = key.split(":")
+            print(f"{backend:>8} {workload:>8} {threads:>7} {rate:>11,.0f}")
+            if backend == "sqlite" and workload == "tool":
+                slowest_sqlite_tool = min(slowest_sqlite_tool, rate)
+
+    ok = slowest_sqlite_tool >= args.min_sqlite_rate
+    print(f"\nslowest SQLite tool path: {slowest_sqlite_tool:,.0f} updates/s (floor {args.min_sqlite_rate:,.0f})")
+    print("OK" if ok else "FAIL")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
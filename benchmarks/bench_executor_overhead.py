@@ -0,0 +1,101 @@
+"""
+Per-turn Python overhead of a tool-agent call, outside the LLM.
+
+A zero-latency fake chat model answers instantly, so the time per turn is all
+ours: building the executor (before), loading/saving memory, prompt formatting,
+output parsing and callback setup. Compares:
+
+  * per-message: a fresh AgentExecutor(memory=...) for every turn, as
+    make_desert_executor / make_water_executor used to do;
+  * shared: `bot.run_agent` with the executor built once (bot.get_executor),
+    memory passed per call.
+
+Both get the same callbacks (bot.agent_callbacks) and usage/metrics context,
+so the difference is executor reuse alone.
+
+    python benchmarks/bench_executor_overhead.py --turns 2000
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import sys
+import time
+from statistics import median
+from typing import List
+
+# Allow running as a script: `python benchmarks/bench_executor_overhead.py`
+if __package__ is None and __name__ == "__main__":
+    sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from langchain.agents import AgentExecutor
+
+from benchmarks.stubs import StubChatModel, install_stub_llm, prepare_offline_env
+
+prepare_offline_env()
+
+import src.bot as bot
+from src import metrics, usage
+from src.sessions import Session
+
+
+async def _per_message(session: Session, agent_input: str) -> None:
+    # The old make_desert_executor: a new executor, with the memory attached, on every message
+    executor = AgentExecutor(
+        agent=bot.get_executor("desert").agent,
+        tools=bot.desert_tool_list,
+        memory=bot.get_memory(session, "desert"),
+        verbose=False,
+        handle_parsing_errors=True,
+        max_iterations=12,
+        early_stopping_method="force",
+    )
+    config = {"callbacks": bot.agent_callbacks("desert")}
+    with usage.route("desert"), metrics.span("agent", route="desert"), metrics.agent_run("desert"):
+        await executor.ainvoke({"input": agent_input}, config=config)
+
+
+async def _shared(session: Session, agent_input: str) -> None:
+    await bot.run_agent(session, "desert", agent_input)
+
+
+async def _measure(runner, turns: int, users: int) -> List[float]:
+    sessions = [Session(f"bench{i}") for i in range(users)]
+    timings = []
+    for i in range(turns):
+        session = sessions[i % users]
+        start = time.perf_counter()
+        await runner(session, f"[user_id={session.user_id}] Which buggy models do you have? ({i})")
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+async def main_async(turns: int, users: int, rounds: int) -> None:
+    install_stub_llm(bot, StubChatModel(latency_s=0.0, reply="We have 2-seat and 4-seat buggies."))
+    runners = {"per-message": _per_message, "shared": _shared}
+    best = {name: float("inf") for name in runners}
+    with contextlib.redirect_stdout(io.StringIO()):
+        await _measure(_shared, 50, users)  # warm imports and caches before timing either
+        for _ in range(rounds):
+            # Interleave the rounds so machine noise hits both the same way
+            for name, runner in runners.items():
+                best[name] = min(best[name], median(await _measure(runner, turns, users)))
+    print(f"{'executor':>12} {'median us/turn':>15}")
+    for name, value in best.items():
+        print(f"{name:>12} {value * 1e6:>15.0f}")
+    saved = best["per-message"] - best["shared"]
+    print(f"\nsaved per turn: {saved * 1e6:.0f} us ({saved / best['per-message']:.0%} of the non-LLM overhead)")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Measure per-turn executor overhead with a fake chat model.")
+    parser.add_argument("--turns", type=int, default=1000)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+    asyncio.run(main_async(args.turns, args.users, args.rounds))
+
+
+if __name__ == "__main__":
+    main()
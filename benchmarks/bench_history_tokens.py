@@ -0,0 +1,148 @@
+"""
+Prompt tokens per turn: ConversationBufferWindowMemory(k=20) vs TokenBudgetMemory.
+
+Replays the transcripts in docs/test_output.md through both memories, the way
+`on_message` feeds them (user_id prefix, [BOOKING_CONTEXT] block, route system
+prompt), and counts system + history + input tokens for every agent call.
+Tool calls inside a turn aren't in the transcript, so the numbers are a floor;
+the difference between the two columns is what the budget saves.
+
+Summaries are stand-ins of a fixed size, produced when the old code would call
+the LLM (every 20th message) or when the new memory folds turns out.
+
+    python benchmarks/bench_history_tokens.py            # one user per case
+    python benchmarks/bench_history_tokens.py --concat   # all cases as one long conversation
+"""
+import argparse
+import os
+import re
+import sys
+import warnings
+from statistics import mean
+from typing import List, Tuple
+
+# Allow running as a script: `python benchmarks/bench_history_tokens.py`
+if __package__ is None and __name__ == "__main__":
+    sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from langchain.memory import ConversationBufferWindowMemory
+
+warnings.filterwarnings("ignore", message=".*migration guide.*")  # the old memory is the baseline
+
+from benchmarks.stubs import prepare_offline_env
+
+prepare_offline_env()
+
+import src.bot as bot
+from src.history import TokenBudgetMemory, count_tokens, message_tokens, tokenizer_name
+from src.prompts import DESERT_SYSTEM_PROMPT, GENERAL_SYSTEM_PROMPT, WATER_SYSTEM_PROMPT
+
+TRANSCRIPT_PATH = os.path.join("docs", "test_output.md")
+STUB_SUMMARY = (
+    "Customer is booking 2 jet skis for the Burj Khalifa 20 minutes tour on 20-01-2026 at 4pm, "
+    "high season, regular price 250 AED each, no discount, paying by card with 5% VAT; "
+    "details confirmed up to the payment step."
+)
+_TURN_RE = re.compile(r"^\*\*(User|Bot) \d+:\*\* ?(.*)$")
+
+Turn = Tuple[str, str]
+
+
+def load_transcripts(path: str = TRANSCRIPT_PATH) -> List[List[Turn]]:
+    cases: List[List[Turn]] = []
+    user, bot_lines, in_bot = None, [], False
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.rstrip("\n")
+            if line.startswith("## "):
+                cases.append([])
+                in_bot = False
+                continue
+            match = _TURN_RE.match(line)
+            if match and match.group(1) == "User":
+                user, in_bot = match.group(2), False
+            elif match:
+                bot_lines, in_bot = [match.group(2)], True
+                cases[-1].append((user, "\n".join(bot_lines)))
+            elif in_bot and line and not line.startswith("#"):
+                bot_lines.append(line)
+                cases[-1][-1] = (user, "\n".join(bot_lines))
+            elif line.startswith("#"):
+                in_bot = False
+    return [c for c in cases if c]
+
+
+def _route(text: str, last: str) -> str:
+    if bot._WATER_KEYWORDS.search(text):
+        return "water"
+    if bot._DESERT_KEYWORDS.search(text):
+        return "desert"
+    return last
+
+
+def replay(conversations: List[List[Turn]], budgeted: bool) -> Tuple[List[int], List[int]]:
+    """Prompt tokens per turn, and the part of them that is history + summary."""
+    system = {
+        "desert": count_tokens(DESERT_SYSTEM_PROMPT),
+        "water": count_tokens(WATER_SYSTEM_PROMPT),
+        "general": count_tokens(GENERAL_SYSTEM_PROMPT),
+    }
+    per_turn: List[int] = []
+    history_part: List[int] = []
+    for turns in conversations:
+        if budgeted:
+            mem = TokenBudgetMemory()
+        else:
+            mem = ConversationBufferWindowMemory(k=20, return_messages=True, memory_key="chat_history")
+        summary, route, count = "", "general", 0
+        for user_text, reply in turns:
+            count += 1
+            if budgeted and mem.pop_folded():
+                summary = f"{summary}\n{STUB_SUMMARY}".strip()
+            elif not budgeted and count % 20 == 0:
+                summary = f"{summary}\n{STUB_SUMMARY}".strip()
+            route = _route(user_text, route)
+            agent_input = f"[user_id=1] {user_text}"
+            if summary:
+                agent_input = f"[BOOKING_CONTEXT]\n{summary}\n[/BOOKING_CONTEXT]\n\n{agent_input}"
+            if budgeted:
+                mem.use_route(route)
+            history = mem.load_memory_variables({})["chat_history"]
+            history_tokens = sum(message_tokens(m) for m in history) + count_tokens(summary)
+            per_turn.append(system[route] + history_tokens + count_tokens(agent_input) - count_tokens(summary))
+            history_part.append(history_tokens)
+            mem.save_context({"input": agent_input}, {"output": reply})
+    return per_turn, history_part
+
+
+def _pct(values: List[int], q: float) -> int:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compare prompt tokens per turn before/after the history budget.")
+    parser.add_argument("--path", default=TRANSCRIPT_PATH)
+    parser.add_argument("--concat", action="store_true", help="Replay every case as one user's conversation")
+    parser.add_argument("--repeat", type=int, default=1, help="Replay the transcripts N times back to back (with --concat)")
+    args = parser.parse_args()
+
+    conversations = load_transcripts(args.path)
+    if args.concat:
+        conversations = [[turn for case in conversations for turn in case] * args.repeat]
+    turns = sum(len(c) for c in conversations)
+    print(f"{turns} turns in {len(conversations)} conversation(s); tokens counted with {tokenizer_name()}")
+    print(f"{'memory':>14} {'avg':>7} {'p95':>7} {'max':>7} {'history avg':>12} {'history max':>12}")
+    results = {}
+    for label, budgeted in (("window k=20", False), ("token budget", True)):
+        per_turn, history = replay(conversations, budgeted)
+        results[label] = (mean(per_turn), mean(history))
+        print(f"{label:>14} {mean(per_turn):>7.0f} {_pct(per_turn, 0.95):>7} {max(per_turn):>7} "
+              f"{mean(history):>12.0f} {max(history):>12}")
+    (before, before_hist), (after, after_hist) = results["window k=20"], results["token budget"]
+    print(f"\naverage prompt tokens per turn: {before:.0f} -> {after:.0f} ({(after - before) / before:+.1%}); "
+          f"history + summary: {before_hist:.0f} -> {after_hist:.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""
+Cold import time of the bot modules, measured with `python -X importtime`.
+
+Every run is a fresh interpreter, so each number is a cold start as a CLI, test
+or worker sees it. Importing must not load the heavy clients that are now built
+on first use (chromadb, langchain_openai, langchain.agents); the check fails if
+one sneaks back in. `warmup()` is timed separately: that cost moved, not vanished.
+
+    python benchmarks/bench_import_time.py                    # this tree
+    python benchmarks/bench_import_time.py --baseline HEAD~1  # and a git ref, side by side
+"""
+import argparse
+import os
+import re
+import subprocess
+import sys
+import tempfile
+from statistics import median
+from typing import Dict, List, Optional, Tuple
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODULES = ["src.tools", "src.water_tools", "src.bot"]
+LAZY = ("chromadb", "langchain_openai", "langchain.agents")
+_LINE_RE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)$")
+
+_PROBE = f"""
+import sys
+import {{module}}
+print(",".join(m for m in {LAZY!r} if m in sys.modules))
+"""
+_WARMUP = """
+import time
+import src.bot
+start = time.perf_counter()
+src.bot.warmup()
+print(time.perf_counter() - start)
+"""
+
+
+def _env() -> Dict[str, str]:
+    env = dict(os.environ, PYTHONDONTWRITEBYTECODE="1")
+    env.setdefault("TELEGRAM_BOT_TOKEN", "offline-benchmark-token")
+    env.setdefault("OPENAI_API_KEY", "sk-offline-benchmark")
+    return env
+
+
+def _import_once(root: str, module: str) -> Tuple[float, List[Tuple[int, str]], List[str]]:
+    """Seconds to import `module` cold, its top-level dependencies by cumulative us, and LAZY modules loaded."""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", _PROBE.format(module=module)],
+        cwd=root, env=dict(_env(), PYTHONPATH=root), capture_output=True, text=True, check=True,
+    )
+    total, children = 0, []
+    for line in proc.stderr.splitlines():
+        match = _LINE_RE.match(line)
+        if not match:
+            continue
+        cumulative, depth, name = int(match.group(2)), len(match.group(3)) // 2, match.group(4)
+        if name == module:
+            total = cumulative
+        elif depth == 1:
+            children.append((cumulative, name))
+    loaded = [m for m in proc.stdout.strip().splitlines()[-1].split(",") if m] if proc.stdout.strip() else []
+    return total / 1e6, sorted(children, reverse=True), loaded
+
+
+def measure(root: str, runs: int) -> Dict[str, Tuple[float, List[Tuple[int, str]], List[str]]]:
+    results = {}
+    for module in MODULES:
+        samples = [_import_once(root, module) for _ in range(runs)]
+        results[module] = (median(s[0] for s in samples), samples[-1][1], samples[-1][2])
+    return results
+
+
+def _warmup_s(root: str) -> Optional[float]:
+    proc = subprocess.run([sys.executable, "-c", _WARMUP], cwd=root, env=dict(_env(), PYTHONPATH=root),
+                          capture_output=True, text=True)
+    if proc.returncode != 0:
+        return None
+    return float(proc.stdout.strip().splitlines()[-1])
+
+
+def _checkout(ref: str) -> str:
+    """Export `ref` into a temp dir (data/ is linked in, so both trees open the same KB)."""
+    tmp = tempfile.mkdtemp(prefix="bench_import_")
+    archive = subprocess.run(["git", "archive", ref], cwd=REPO, capture_output=True, check=True).stdout
+    subprocess.run(["tar", "-x", "-C", tmp], input=archive, check=True)
+    data = os.path.join(tmp, "data")
+    if not os.path.exists(data):
+        os.symlink(os.path.join(REPO, "data"), data)
+    return tmp
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Measure cold import time of the bot modules.")
+    parser.add_argument("--runs", type=int, default=5, help="Fresh interpreters per module (median is reported)")
+    parser.add_argument("--baseline", help="Git ref to measure side by side, e.g. HEAD~1")
+    parser.add_argument("--top", type=int, default=6, help="Heaviest direct imports to list per module")
+    args = parser.parse_args()
+
+    current = measure(REPO, args.runs)
+    baseline = measure(_checkout(args.baseline), args.runs) if args.baseline else None
+
+    print(f"cold import, median of {args.runs} fresh interpreters")
+    header = f"{'module':>16} {'this tree s':>12}"
+    if baseline:
+        header += f" {args.baseline + ' s':>14} {'change':>8}"
+    print(header)
+    for module in MODULES:
+        row = f"{module:>16} {current[module][0]:>12.3f}"
+        if baseline:
+            before = baseline[module][0]
+            row += f" {before:>14.3f} {(current[module][0] - before) / before:>+8.0%}"
+        print(row)
+
+    for module in MODULES:
+        heaviest = ", ".join(f"{name} {us / 1000:.0f}ms" for us, name in current[module][1][:args.top])
+        print(f"\n{module} heaviest imports: {heaviest}")
+
+    warmup = _warmup_s(REPO)
+    if warmup is not None:
+        print(f"\nsrc.bot.warmup() (LLM client, agents, both KBs): {warmup:.3f}s")
+
+    failures = [f"importing {m} loads {', '.join(current[m][2])}" for m in MODULES if current[m][2]]
+    for failure in failures:
+        print(f"FAIL {failure}")
+    print("OK" if not failures else "FAIL")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,249 @@
+"""
+Offline load test: how many concurrent users one bot process sustains.
+
+Virtual users each play one scripted conversation from test_cases.py TEST_CASES
+(user i plays case i mod N), turn by turn, with an exponential think time
+between messages. Their updates are real `telegram.Update` objects handed to
+`src.bot.on_message`, at most MAX_CONCURRENT_UPDATES at a time like PTB's
+concurrent_updates; replies go through the real `Message.reply_text` / `edit_text`
+to a bot object that only sleeps. Nothing touches the network:
+
+  * chat model: lognormal latency (--llm-median / --llm-p95) before the first
+    token, then a word every --token-delay; the agents look the question up in
+    their KB (a retrieval tool call) and then answer;
+  * embeddings: lognormal latency (--embed-median / --embed-p95), behind a cold
+    embedding cache in a temp dir;
+  * Telegram Bot API: lognormal latency (--tg-median / --tg-p95).
+
+Users arrive evenly over --ramp-up seconds. Reported per user count: messages/s,
+per-message latency p50/p95/p99 (update created -> handler done, queueing
+included), reply TTFB, peak RSS and event-loop lag (how late a 10 ms timer
+fires). Fails on any handler error; --max-p95 only marks rows over the SLO.
+The stage table (--stages) shows whether the time goes to queue_wait, i.e. to
+too few turn slots (--max-turns), or to the stubs' latencies.
+
+    python benchmarks/bench_load.py --users 100 500 1000 2000
+    python benchmarks/bench_load.py --users 1000 --max-turns 256
+    python benchmarks/bench_load.py --users 1000 --llm-median 1.2 --llm-p95 4 --stages
+"""
+import argparse
+import asyncio
+import contextlib
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+from statistics import median
+from typing import Any, Dict, List
+
+# Allow running as a script: `python benchmarks/bench_load.py`
+if __package__ is None and __name__ == "__main__":
+    sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, ToolMessage
+
+from benchmarks.stubs import (
+    RecordingBot,
+    ScriptedChatModel,
+    StubEmbeddings,
+    install_stub_embeddings,
+    install_stub_llm,
+    lognormal_latency,
+    prepare_offline_env,
+)
+
+prepare_offline_env()
+# Percentiles over the whole run, not just the last 2048 turns
+os.environ.setdefault("METRICS_WINDOW", "1000000")
+
+import src.bot as bot
+import src.metrics as metrics
+import src.streaming as streaming
+from src.prompts import DESERT_SYSTEM_PROMPT, WATER_SYSTEM_PROMPT
+from src.tools import EMBEDDING_MODEL
+from test_cases import TEST_CASES
+
+LAG_INTERVAL_S = 0.01
+_ANSWER = (
+    "Thanks for your message. Here is what I found for you: our activities run every day "
+    "from 9am to 9pm, prices depend on the package and duration, and pickup is available "
+    "from most Dubai hotels. Which date and time would you like?"
+)
+_TOOLS = {DESERT_SYSTEM_PROMPT: "retrieval_tool", WATER_SYSTEM_PROMPT: "water_retrieval_tool"}
+
+
+def _script(messages: List[BaseMessage]) -> AIMessage:
+    prompt = str(messages[-1].content)
+    if "UPDATED SUMMARY:" in prompt:
+        return AIMessage(content="Customer is asking about activities and has not booked yet.")
+    if "last_agent=" in prompt:
+        return AIMessage(content="general")
+    tool = _TOOLS.get(str(messages[0].content))
+    if tool is None:
+        return AIMessage(content=_ANSWER)
+    last_human = max(i for i, m in enumerate(messages) if isinstance(m, HumanMessage))
+    if any(isinstance(m, ToolMessage) for m in messages[last_human:]):
+        return AIMessage(content=_ANSWER)
+    query = str(messages[last_human].content).rsplit("] ", 1)[-1]
+    return AIMessage(content="", tool_calls=[{"name": tool, "args": {"query": query}, "id": "call_kb"}])
+
+
+def _pct(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))] if ordered else 0.0
+
+
+def _rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # KB on Linux
+
+
+async def _watch_loop(lags: List[float], stop: asyncio.Event) -> None:
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(LAG_INTERVAL_S)
+        lags.append(time.perf_counter() - start - LAG_INTERVAL_S)
+
+
+async def _run(users: int, args: argparse.Namespace, telegram_bot: RecordingBot) -> Dict[str, Any]:
+    bot.sessions.clear()
+    metrics.reset()
+    streaming.reset_stats()
+    updates = asyncio.Semaphore(bot.MAX_CONCURRENT_UPDATES)  # PTB's concurrent_updates
+    latencies: List[float] = []
+    errors: List[str] = []
+
+    async def virtual_user(i: int) -> None:
+        await asyncio.sleep(args.ramp_up * i / users)
+        turns = TEST_CASES[i % len(TEST_CASES)]["turns"]
+        for n, text in enumerate(turns):
+            if n:
+                await asyncio.sleep(random.expovariate(1 / args.think_time) if args.think_time else 0)
+            update = telegram_bot.update(1_000_000 + i, text)
+            start = time.perf_counter()
+            try:
+                async with updates:
+                    await bot.on_message(update, None)
+            except Exception as e:
+                errors.append(f"{type(e).__name__}: {e}")
+                continue
+            latencies.append(time.perf_counter() - start)
+
+    lags: List[float] = []
+    stop = asyncio.Event()
+    watcher = asyncio.create_task(_watch_loop(lags, stop))
+    start = time.perf_counter()
+    await asyncio.gather(*(virtual_user(i) for i in range(users)))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await watcher
+    await bot.drain_summaries()
+    return {
+        "users": users,
+        "messages": len(latencies),
+        "elapsed": elapsed,
+        "msgs_per_s": len(latencies) / elapsed,
+        "p50": _pct(latencies, 0.50),
+        "p95": _pct(latencies, 0.95),
+        "p99": _pct(latencies, 0.99),
+        "ttfb_p95_ms": streaming.stats()["ttfb_p95_ms"],
+        "rss_mb": _rss_mb(),
+        "lag_p50_ms": median(lags) * 1000 if lags else 0.0,
+        "lag_p99_ms": _pct(lags, 0.99) * 1000,
+        "lag_max_ms": max(lags, default=0.0) * 1000,
+        "errors": errors,
+    }
+
+
+class _LoadBot(RecordingBot):
+    """Also counts the replies on_message sends when a turn failed inside the handler."""
+
+    def __init__(self, *args: Any, **kwargs: Any):
+        super().__init__(*args, **kwargs)
+        self.failed_replies = 0
+
+    def _message(self, chat_id: int, text: str):
+        if text.startswith("Sorry, something went wrong"):
+            self.failed_replies += 1
+        return super()._message(chat_id, text)
+
+
+async def main_async(args: argparse.Namespace) -> int:
+    install_stub_llm(bot, ScriptedChatModel(
+        script=_script,
+        latency_fn=lognormal_latency(args.llm_median, args.llm_p95),
+        token_delay_s=args.token_delay,
+    ))
+    cache_dir = tempfile.mkdtemp(prefix="bench_load_")
+    embeddings = StubEmbeddings(latency_fn=lognormal_latency(args.embed_median, args.embed_p95))
+    install_stub_embeddings(EMBEDDING_MODEL, embeddings, os.path.join(cache_dir, "embedding_cache.sqlite3"))
+    telegram_bot = _LoadBot(latency_fn=lognormal_latency(args.tg_median, args.tg_p95))
+    bot.USAGE_LOG = False
+    if args.max_turns:
+        bot.MAX_CONCURRENT_TURNS = args.max_turns
+        bot._turn_slots = asyncio.Semaphore(args.max_turns)
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        bot.warmup()  # as main() does before polling
+
+    turns = sum(len(c["turns"]) for c in TEST_CASES) / len(TEST_CASES)
+    print(f"{len(TEST_CASES)} scripted conversations, {turns:.1f} messages each; think time {args.think_time}s, "
+          f"ramp-up {args.ramp_up}s")
+    print(f"latency median/p95: LLM {args.llm_median}/{args.llm_p95}s (+{args.token_delay * 1000:.0f} ms/word), "
+          f"embeddings {args.embed_median}/{args.embed_p95}s, Telegram {args.tg_median}/{args.tg_p95}s")
+    print(f"MAX_CONCURRENT_UPDATES={bot.MAX_CONCURRENT_UPDATES}, MAX_CONCURRENT_TURNS={bot.MAX_CONCURRENT_TURNS}, "
+          f"STREAM_REPLIES={int(streaming.STREAM_REPLIES)}\n")
+    print(f"{'users':>6} {'msgs':>6} {'msgs/s':>7} {'p50 s':>6} {'p95 s':>6} {'p99 s':>6} {'TTFB p95':>9} "
+          f"{'RSS MB':>7} {'lag p50':>8} {'lag p99':>8} {'lag max':>8} {'errors':>6}")
+
+    failures: List[str] = []
+    sustained = 0
+    for users in args.users:
+        failed_before = telegram_bot.failed_replies
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            r = await _run(users, args, telegram_bot)
+        errors = len(r["errors"]) + telegram_bot.failed_replies - failed_before
+        slo = "" if r["p95"] <= args.max_p95 else "  > SLO"
+        ttfb = f"{r['ttfb_p95_ms'] / 1000:.2f}s" if r["ttfb_p95_ms"] is not None else "-"
+        print(f"{users:>6} {r['messages']:>6} {r['msgs_per_s']:>7.1f} {r['p50']:>6.2f} {r['p95']:>6.2f} "
+              f"{r['p99']:>6.2f} {ttfb:>9} {r['rss_mb']:>7.0f} {r['lag_p50_ms']:>6.1f}ms "
+              f"{r['lag_p99_ms']:>6.1f}ms {r['lag_max_ms']:>6.0f}ms {errors:>6}{slo}")
+        if errors:
+            failures.append(f"{users} users: {errors} failed messages, e.g. {(r['errors'] or ['a Sorry reply'])[0]}")
+        elif not slo:
+            sustained = max(sustained, users)
+
+    print(f"\nTelegram API calls: {telegram_bot.calls}; embedding API calls: {embeddings.calls}")
+    print(f"largest user count with p95 <= {args.max_p95}s: {sustained or 'none'}")
+    if args.stages:
+        print()
+        print(metrics.format_table(metrics.snapshot()))
+    for failure in failures:
+        print(f"FAIL {failure}")
+    print("OK" if not failures else "FAIL")
+    return 1 if failures else 0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Offline load test of on_message with stub OpenAI and Telegram.")
+    parser.add_argument("--users", type=int, nargs="+", default=[50, 200, 500])
+    parser.add_argument("--ramp-up", type=float, default=10.0, help="Seconds over which users arrive")
+    parser.add_argument("--think-time", type=float, default=2.0, help="Mean pause between a user's messages (s)")
+    parser.add_argument("--llm-median", type=float, default=0.6)
+    parser.add_argument("--llm-p95", type=float, default=1.5)
+    parser.add_argument("--token-delay", type=float, default=0.015, help="Delay between streamed words (s)")
+    parser.add_argument("--embed-median", type=float, default=0.1)
+    parser.add_argument("--embed-p95", type=float, default=0.3)
+    parser.add_argument("--tg-median", type=float, default=0.05)
+    parser.add_argument("--tg-p95", type=float, default=0.15)
+    parser.add_argument("--max-p95", type=float, default=4.0, help="Per-message p95 SLO (s); speed_latency's best band")
+    parser.add_argument("--max-turns", type=int, help="Override MAX_CONCURRENT_TURNS (the bot's turn slots)")
+    parser.add_argument("--stages", action="store_true", help="Print the per-stage latency table of the last run")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    random.seed(args.seed)
+    sys.exit(asyncio.run(main_async(args)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""
+Cost and coverage of the per-stage latency metrics (src/metrics.py).
+
+Half the users send desert booking turns (a scripted stub agent calls
+booking_update, then answers), the other half general questions routed by the
+stub LLM router. The model has zero latency, so the per-turn time is our own
+code. Runs the same traffic with METRICS_ENABLED off and on and reports the
+difference, then prints the stage table and fetches /metrics from the built-in
+HTTP exporter.
+
+Checks: every stage of the hot path shows up, the exporter serves it, and
+instrumentation costs less than --max-overhead of a turn.
+
+    python benchmarks/bench_metrics_overhead.py --users 50 --messages 10
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import sys
+import time
+import urllib.request
+from statistics import median
+from typing import List
+
+# Allow running as a script: `python benchmarks/bench_metrics_overhead.py`
+if __package__ is None and __name__ == "__main__":
+    sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, ToolMessage
+
+from benchmarks.stubs import ScriptedChatModel, fake_update, install_stub_llm, prepare_offline_env
+
+prepare_offline_env()
+
+import src.bot as bot
+import src.metrics as metrics
+import src.streaming as streaming
+
+EXPECTED_STAGES = {
+    "queue_wait", "turn", "prechecks", "route", "agent", "agent_llm", "tool", "telegram_send",
+}
+
+
+def _script(messages: List[BaseMessage]) -> AIMessage:
+    prompt = str(messages[-1].content)
+    if "last_agent=" in prompt:
+        return AIMessage(content="general")
+    last_human = max(i for i, m in enumerate(messages) if isinstance(m, HumanMessage))
+    text = str(messages[last_human].content)
+    if "buggy" not in text or any(isinstance(m, ToolMessage) for m in messages[last_human:]):
+        return AIMessage(content="Noted. Which date works for you?")
+    user_id = text.split("[user_id=", 1)[1].split("]", 1)[0]
+    return AIMessage(content="", tool_calls=[{
+        "name": "booking_update",
+        "args": {"user_id": user_id, "add_item": {"activity": "buggy", "quantity": 1}},
+        "id": "call_update",
+    }])
+
+
+async def _run(users: int, messages: int, enabled: bool) -> float:
+    """Median seconds per turn."""
+    metrics.METRICS_ENABLED = enabled
+    metrics.reset()
+    bot.sessions.clear()
+    per_turn: List[float] = []
+
+    async def conversation(uid: int) -> None:
+        text = "I want a buggy" if uid % 2 == 0 else "what else do you offer"
+        for _ in range(messages):
+            start = time.perf_counter()
+            await bot.on_message(fake_update(uid, text), None)
+            per_turn.append(time.perf_counter() - start)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        await asyncio.gather(*(conversation(30_000 + i) for i in range(users)))
+    return median(per_turn)
+
+
+async def main_async(users: int, messages: int, rounds: int, max_overhead: float) -> int:
+    install_stub_llm(bot, ScriptedChatModel(script=_script, latency_s=0.0))
+    bot.intent_classifier = None  # general turns go through the stub LLM router
+    streaming.STREAM_REPLIES = False  # one send per turn; streaming has its own benchmark
+
+    await _run(users, 2, True)  # warm imports and caches
+    best = {False: float("inf"), True: float("inf")}
+    for _ in range(rounds):
+        for enabled in (False, True):  # interleaved so machine noise hits both
+            best[enabled] = min(best[enabled], await _run(users, messages, enabled))
+    # The last run had metrics on; its data is what gets shown and exported
+    overhead = (best[True] - best[False]) / best[False]
+
+    print(f"{users} users x {messages} messages, zero-latency stub model")
+    print(f"median turn: {best[False] * 1e6:.0f} us without metrics, {best[True] * 1e6:.0f} us with ({overhead:+.1%})\n")
+    print(metrics.format_table(metrics.snapshot()))
+
+    server = metrics.start_http_server(0, host="127.0.0.1")
+    try:
+        url = f"http://127.0.0.1:{server.server_address[1]}/metrics"
+        exported = urllib.request.urlopen(url, timeout=5).read().decode()
+    finally:
+        server.shutdown()
+    seen = {s["labels"]["stage"] for s in metrics.STAGE_SECONDS.snapshot()}
+    print(f"\n/metrics: {len(exported.splitlines())} lines")
+
+    failures = []
+    if EXPECTED_STAGES - seen:
+        failures.append(f"stages never recorded: {sorted(EXPECTED_STAGES - seen)}")
+    if 'jetset_stage_seconds_bucket{stage="turn",le="+Inf"}' not in exported:
+        failures.append("exporter did not serve the turn histogram")
+    if overhead > max_overhead:
+        failures.append(f"instrumentation overhead {overhead:.1%} > {max_overhead:.0%}")
+    for failure in failures:
+        print(f"FAIL {failure}")
+    print("OK" if not failures else "FAIL")
+    return 1 if failures else 0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Measure what the per-stage metrics cost and check what they cover.")
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--messages", type=int, default=10)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--max-overhead", type=float, default=0.10, help="Allowed slowdown of a zero-latency turn")
+    args = parser.parse_args()
+    sys.exit(asyncio.run(main_async(args.users, args.messages, args.rounds, args.max_overhead)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Session store memory check: RSS after many one-off users, unbounded vs capped.
+
+Each simulated user sends one message through `on_message` (stub LLM, general
+agent) and never comes back, which is what most Telegram traffic looks like.
+With the session cap, resident sessions must stay at or below the cap, and a
+user evicted to the spill file must get their history back on the next message.
+
+    python benchmarks/bench_sessions.py --users 5000 --cap 500
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+# Allow running as a script: `python benchmarks/bench_sessions.py`
+if __package__ is None and __name__ == "__main__":
+    sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from langchain_core.messages import HumanMessage
+
+from benchmarks.stubs import StubChatModel, fake_update, install_stub_llm, prepare_offline_env
+
+prepare_offline_env()
+
+
+def _rss_mb() -> float:
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+
+
+async def _worker_async(users: int) -> dict:
+    # SESSION_MAX_RESIDENT / SESSION_SPILL_PATH come from the parent process
+    import src.bot as bot
+
+    install_stub_llm(bot, StubChatModel(latency_s=0.0, reply="Hello! How can I help you today?"))
+    rss_before = _rss_mb()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        for i in range(users):
+            await bot.on_message(fake_update(i, "Hi there, what can you do?"), None)
+        # The first user has long been evicted; a second message must see the first one
+        await bot.on_message(fake_update(0, "Hi again"), None)
+    elapsed = time.perf_counter() - start
+
+    humans = [m.content for m in bot.sessions.peek("0").memory.chat_memory.messages if isinstance(m, HumanMessage)]
+    return {
+        "rss_mb": _rss_mb() - rss_before,
+        "msgs_per_s": (users + 1) / elapsed,
+        "restored_history": len(humans),
+        **bot.sessions.stats(),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compare session memory with and without eviction.")
+    parser.add_argument("--users", type=int, default=5000)
+    parser.add_argument("--cap", type=int, default=500)
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.worker:
+        print(json.dumps(asyncio.run(_worker_async(args.users))))
+        return
+
+    tmpdir = tempfile.mkdtemp(prefix="bench_sessions_")
+    runs = {
+        "unbounded": (args.users + 1, ""),
+        "capped": (args.cap, ""),
+        "capped+spill": (args.cap, os.path.join(tmpdir, "sessions.sqlite3")),
+    }
+    results = {}
+    print(f"{'mode':>13} {'resident':>9} {'evicted':>8} {'restored':>9} {'RSS +MB':>8} {'msgs/s':>8}")
+    for mode, (cap, spill) in runs.items():
+        # Separate processes so freed memory from one run can't hide growth in the next
+        env = dict(os.environ, SESSION_MAX_RESIDENT=str(cap), SESSION_SPILL_PATH=spill)
+        cmd = [sys.executable, os.path.abspath(__file__), "--users", str(args.users), "--worker"]
+        out = subprocess.run(cmd, env=env, capture_output=True, text=True, check=True).stdout
+        r = results[mode] = json.loads(out.strip().splitlines()[-1])
+        evicted = r["evicted_lru"] + r["evicted_ttl"]
+        print(f"{mode:>13} {r['resident']:>9} {evicted:>8} {r['restored']:>9} {r['rss_mb']:>8.1f} {r['msgs_per_s']:>8.0f}")
+
+    failures = []
+    for mode in ("capped", "capped+spill"):
+        if results[mode]["resident"] > args.cap:
+            failures.append(f"{mode}: {results[mode]['resident']} resident sessions > cap {args.cap}")
+    if results["capped+spill"]["restored_history"] != 2:
+        failures.append("capped+spill: evicted user's history was not restored")
+    if results["capped"]["restored_history"] != 1:
+        failures.append("capped: evicted user unexpectedly kept their history")
+    for failure in failures:
+        print(f"FAIL {failure}")
+    print("OK" if not failures else "FAIL")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""
+Time to first byte of a reply, one reply_text at the end vs streamed edits.
+
+A scripted stub model answers the agents after `--latency` seconds, then word
+by word `--token-delay` apart, like an OpenAI stream (unstreamed calls take as
+long in total). Routing is local, so TTFB is the agent's alone. Users send
+either a general question or a desert one whose answer asks two questions, so
+_enforce_single_question cuts it.
+
+Checks:
+  * streaming lowers the median TTFB (update in -> first answer text shown);
+  * the final text of every reply is the same with and without streaming;
+  * no preview ever shows text the single-question filter cuts;
+  * edits of one message are at least STREAM_EDIT_INTERVAL_S apart (the final one excepted).
+
+    python benchmarks/bench_streaming_replies.py --users 20 --latency 0.8 --token-delay 0.05
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import sys
+import time
+from statistics import median
+from typing import Dict, List
+
+# Allow running as a script: `python benchmarks/bench_streaming_replies.py`
+if __package__ is None and __name__ == "__main__":
+    sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from langchain_core.messages import AIMessage, BaseMessage
+
+from benchmarks.stubs import ScriptedChatModel, fake_update, install_stub_llm, prepare_offline_env
+
+prepare_offline_env()
+
+import src.bot as bot
+import src.streaming as streaming
+
+MESSAGES = ["What can you help me with?", "Tell me about the buggy tours"]
+GENERAL_REPLY = (
+    "I can help you with desert activities such as dune buggies, quad bikes and safaris, "
+    "and with water activities such as jet skis, flyboards and jet cars. I can share prices, "
+    "pickup details, locations and rules, and guide you through a booking step by step."
+)
+DESERT_REPLY = (
+    "Our buggy tours run every day from 9am to 9pm, with 2-seat and 4-seat buggies and "
+    "pickup from most Dubai hotels. Which date works for you? Also, how many people? "
+    "If yes, I can start the booking right away."
+)
+_CUT = "Also, how many people?"  # after the first question: must never be on screen
+
+
+class _GeneralIntent:
+    """Stands in for src.intent.IntentClassifier: anything the keyword rules don't route is general."""
+
+    def predict(self, text: str, last_agent: str):
+        return "general", 1.0
+
+
+def _script(messages: List[BaseMessage]) -> AIMessage:
+    prompt = str(messages[-1].content) if messages else ""
+    if "buggy" in prompt:
+        return AIMessage(content=DESERT_REPLY)
+    return AIMessage(content=GENERAL_REPLY)
+
+
+async def _run(users: int, stream: bool) -> Dict[str, object]:
+    streaming.STREAM_REPLIES = stream
+    streaming.reset_stats()
+    bot.sessions.clear()
+    updates = [fake_update(20_000 + i, MESSAGES[i % len(MESSAGES)]) for i in range(users)]
+    turn_s = []
+
+    async def one(update) -> None:
+        t0 = time.perf_counter()
+        await bot.on_message(update, None)
+        turn_s.append(time.perf_counter() - t0)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        await asyncio.gather(*(one(u) for u in updates))
+
+    min_gap = float("inf")
+    leaked = 0
+    for u in updates:
+        preview_times = [t for t, _ in u.message.edits[:-1]]
+        for a, b in zip(preview_times, preview_times[1:]):
+            min_gap = min(min_gap, b - a)
+        leaked += sum(1 for _, text in u.message.edits if _CUT in text)
+    return {
+        "stats": streaming.stats(),
+        "turn_p50_s": median(turn_s),
+        "finals": [u.message.replies[-1] if u.message.replies else "" for u in updates],
+        "edits_per_reply": sum(len(u.message.edits) for u in updates) / len(updates),
+        "min_gap_s": min_gap,
+        "leaked": leaked,
+    }
+
+
+async def main_async(users: int, latency: float, token_delay: float, interval: float) -> int:
+    install_stub_llm(bot, ScriptedChatModel(script=_script, latency_s=latency, token_delay_s=token_delay))
+    bot.intent_classifier = _GeneralIntent()
+    streaming.STREAM_EDIT_INTERVAL_S = interval
+    results = {"reply_text": await _run(users, stream=False), "streamed": await _run(users, stream=True)}
+
+    print(f"{users} users; agent latency {latency * 1000:.0f} ms, then a word every {token_delay * 1000:.0f} ms")
+    print(f"{'mode':>11} {'TTFB p50 ms':>12} {'TTFB p95 ms':>12} {'turn p50 s':>11} {'edits/reply':>12}")
+    for mode, r in results.items():
+        s = r["stats"]
+        print(f"{mode:>11} {s['ttfb_p50_ms']:>12} {s['ttfb_p95_ms']:>12} {r['turn_p50_s']:>11.2f} {r['edits_per_reply']:>12.1f}")
+    plain, streamed = results["reply_text"], results["streamed"]
+
+    failures = []
+    if streamed["stats"]["ttfb_p50_ms"] >= plain["stats"]["ttfb_p50_ms"]:
+        failures.append("streaming did not lower the median TTFB")
+    if streamed["finals"] != plain["finals"]:
+        failures.append("final replies differ between modes")
+    if streamed["leaked"]:
+        failures.append(f"{streamed['leaked']} preview edits showed text the single-question filter cuts")
+    if streamed["min_gap_s"] < interval * 0.95:
+        failures.append(f"edits {streamed['min_gap_s']:.2f}s apart, below STREAM_EDIT_INTERVAL_S={interval}")
+    for failure in failures:
+        print(f"FAIL {failure}")
+    print("OK" if not failures else "FAIL")
+    return 1 if failures else 0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compare reply TTFB with and without streamed edits.")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.8, help="Stub agent latency before the first token (s)")
+    parser.add_argument("--token-delay", type=float, default=0.05, help="Stub delay between words (s)")
+    parser.add_argument("--edit-interval", type=float, default=streaming.STREAM_EDIT_INTERVAL_S)
+    args = parser.parse_args()
+    sys.exit(asyncio.run(main_async(args.users, args.latency, args.token_delay, args.edit_interval)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,491 @@
+"""
+Local OpenAI-compatible server for end-to-end runs without OpenAI.
+
+Speaks POST /v1/chat/completions (plain and streamed, tool calls, usage in the
+last chunk with stream_options.include_usage) and POST /v1/embeddings (float
+or base64), over HTTP/1.1 keep-alive so the clients' connection pools are
+exercised as with the real API. Point the bot at it with
+
+    python benchmarks/openai_stub_server.py --port 8765 --latency-median 0.6 --latency-p95 1.5
+    OPENAI_BASE_URL=http://127.0.0.1:8765/v1 OPENAI_API_KEY=stub python -m src.bot
+    OPENAI_BASE_URL=http://127.0.0.1:8765/v1 OPENAI_API_KEY=stub python test_cases.py --only case1
+
+Where answers come from, in order:
+  * --replay FILE: responses recorded with --record (JSONL), looked up by
+    request_key(), a hash of the normalized request;
+  * --script FILE: JSON list of rules, first match wins:
+        {"match": "regex on the last user message", "system": "regex on the system prompt",
+         "steps": [{"tool_calls": [{"name": "retrieval_tool", "arguments": {"query": "{user}"}}]},
+                   {"content": "Which date works for you?"}]}
+    The step is the number of assistant messages since the last user message
+    (an agent's iteration); the last step repeats. "{user}" is replaced by the
+    last user message; a tool name also matches offered tools ending with it
+    (retrieval_tool -> water_retrieval_tool);
+  * DEFAULT_SCRIPT, which answers the bot's router, summary and agents.
+With --upstream URL, requests that miss the replay file are forwarded there
+(non-streamed) and, with --record FILE, appended to it. Embeddings are
+replayed and recorded the same way (embedding_key()), else made up from a hash
+of the input. --strict answers a miss with 404 instead of making one up.
+
+Chaos: --latency-median/--latency-p95 (lognormal, before the first byte),
+--token-delay between streamed words, --error-rate with --error-status (e.g.
+500,429; a 429 carries Retry-After), --hang-rate/--hang-s to trip client timeouts.
+Every request is logged (--log FILE, JSONL) with its token usage; totals are
+printed on exit.
+"""
+import argparse
+import base64
+import hashlib
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+import urllib.request
+import uuid
+from array import array
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+
+# Allow running as a script: `python benchmarks/openai_stub_server.py`
+if __package__ is None and __name__ == "__main__":
+    sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from benchmarks.stubs import lognormal_latency
+from src.history import count_tokens
+from src.usage import count_embedding_tokens
+
+_WORD_RE = re.compile(r"\S+\s*")
+EMBEDDING_SIZE = 1536
+
+DEFAULT_SCRIPT: List[Dict[str, Any]] = [
+    {"match": r"^last_agent=", "steps": [{"content": "general"}]},
+    {"match": r"UPDATED SUMMARY:", "steps": [{"content": "Customer is asking about activities."}]},
+    {"system": r"strict evaluator", "steps": [{"content": json.dumps({
+        "scores": {"accuracy": 80, "robustness": 80, "user_experience": 80, "memory_context_retention": 80,
+                   "language_understanding": 80, "speed_latency": None, "cost_efficiency": None},
+        "overall_score": 80, "notes": "Scripted by the stub server.",
+    })}]},
+    {"match": r"^\[user_id=|\[/BOOKING_CONTEXT\]", "steps": [
+        {"tool_calls": [{"name": "retrieval_tool", "arguments": {"query": "{user}"}}]},
+        {"content": "Our activities run every day from 9am to 9pm. Which date and time would you like?"},
+    ]},
+    {"steps": [{"content": "I can help with desert and water activities in Dubai. What would you like to do?"}]},
+]
+
+
+# ----------------------------
+# Requests and answers
+# ----------------------------
+def _text(content: Any) -> str:
+    if isinstance(content, list):  # content parts
+        return "".join(part.get("text", "") for part in content if isinstance(part, dict))
+    return content or ""
+
+
+def request_key(body: Dict[str, Any]) -> str:
+    """Hash of what determines the answer: model, messages, offered tools (not stream flags or ids)."""
+    messages = []
+    for m in body.get("messages", []):
+        calls = [(c["function"]["name"], c["function"]["arguments"]) for c in m.get("tool_calls") or []]
+        messages.append((m.get("role"), _text(m.get("content")), calls))
+    tools = sorted(t.get("function", {}).get("name", "") for t in body.get("tools") or [])
+    normalized = json.dumps([body.get("model"), messages, tools], sort_keys=True)
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+
+def _fill(value: Any, user: str) -> Any:
+    if isinstance(value, str):
+        return value.replace("{user}", user)
+    if isinstance(value, dict):
+        return {k: _fill(v, user) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_fill(v, user) for v in value]
+    return value
+
+
+def scripted_message(script: List[Dict[str, Any]], body: Dict[str, Any]) -> Dict[str, Any]:
+    """The assistant message the first matching rule gives for this request."""
+    messages = body.get("messages", [])
+    system = next((_text(m.get("content")) for m in messages if m.get("role") == "system"), "")
+    last_user = max((i for i, m in enumerate(messages) if m.get("role") == "user"), default=-1)
+    user = _text(messages[last_user].get("content")) if last_user >= 0 else ""
+    step = sum(1 for m in messages[last_user + 1:] if m.get("role") == "assistant")
+    offered = [t.get("function", {}).get("name", "") for t in body.get("tools") or []]
+    for rule in script:
+        if "match" in rule and not re.search(rule["match"], user):
+            continue
+        if "system" in rule and not re.search(rule["system"], system):
+            continue
+        steps = rule["steps"]
+        answer = _fill(steps[min(step, len(steps) - 1)], user.rsplit("] ", 1)[-1])
+        calls = []
+        for call in answer.get("tool_calls") or []:
+            name = next((t for t in offered if t == call["name"]), None) or next(
+                (t for t in offered if t.endswith(call["name"])), None)
+            if name is None:
+                continue  # not offered to this agent; fall through to text
+            calls.append({
+                "id": f"call_{uuid.uuid4().hex[:24]}",
+                "type": "function",
+                "function": {"name": name, "arguments": json.dumps(call.get("arguments", {}))},
+            })
+        if calls:
+            return {"role": "assistant", "content": None, "tool_calls": calls}
+        if "content" in answer:
+            return {"role": "assistant", "content": answer["content"]}
+    return {"role": "assistant", "content": "OK."}
+
+
+def _usage(body: Dict[str, Any], message: Dict[str, Any]) -> Dict[str, Any]:
+    prompt = sum(count_tokens(_text(m.get("content"))) + 4 for m in body.get("messages", []))
+    prompt += count_tokens(json.dumps(body["tools"])) if body.get("tools") else 0
+    completion = count_tokens(message.get("content") or "") + sum(
+        count_tokens(c["function"]["arguments"]) + 4 for c in message.get("tool_calls") or [])
+    return {
+        "prompt_tokens": prompt,
+        "completion_tokens": completion,
+        "total_tokens": prompt + completion,
+        "prompt_tokens_details": {"cached_tokens": 0},
+    }
+
+
+def _completion(body: Dict[str, Any], message: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "stub"),
+        "choices": [{
+            "index": 0,
+            "message": message,
+            "finish_reason": "tool_calls" if message.get("tool_calls") else "stop",
+        }],
+        "usage": _usage(body, message),
+    }
+
+
+def _chunks(completion: Dict[str, Any], include_usage: bool) -> List[Dict[str, Any]]:
+    """The completion as the chat.completion.chunk events the streaming API sends."""
+    base = {"id": completion["id"], "object": "chat.completion.chunk",
+            "created": completion["created"], "model": completion["model"]}
+    choice = completion["choices"][0]
+    message = choice["message"]
+
+    def chunk(delta: Dict[str, Any], finish_reason: Optional[str] = None) -> Dict[str, Any]:
+        return dict(base, choices=[{"index": 0, "delta": delta, "finish_reason": finish_reason}])
+
+    events = [chunk({"role": "assistant", "content": ""})]
+    for i, call in enumerate(message.get("tool_calls") or []):
+        events.append(chunk({"tool_calls": [dict(call, index=i)]}))
+    for word in _WORD_RE.findall(message.get("content") or ""):
+        events.append(chunk({"content": word}))
+    events.append(chunk({}, choice["finish_reason"]))
+    if include_usage:
+        events.append(dict(base, choices=[], usage=completion["usage"]))
+    return events
+
+
+def _vector(item: Any, size: int) -> List[float]:
+    rng = random.Random(hashlib.sha256(json.dumps(item).encode("utf-8")).digest())
+    vec = [rng.gauss(0, 1) for _ in range(size)]
+    norm = sum(v * v for v in vec) ** 0.5
+    return [v / norm for v in vec]
+
+
+def _inputs(body: Dict[str, Any]) -> List[Any]:
+    inputs = body.get("input", [])
+    if isinstance(inputs, str) or (inputs and isinstance(inputs[0], int)):
+        inputs = [inputs]  # one string, or one pre-tokenized input
+    return inputs
+
+
+def embedding_key(body: Dict[str, Any]) -> str:
+    """Hash of what determines the vectors: model, dimensions, inputs (not the encoding)."""
+    normalized = json.dumps([body.get("model"), body.get("dimensions"), _inputs(body)], sort_keys=True)
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+
+def _embeddings(body: Dict[str, Any]) -> Dict[str, Any]:
+    """An embeddings response (float vectors) with deterministic random unit vectors."""
+    size = int(body.get("dimensions") or EMBEDDING_SIZE)
+    data, tokens = [], 0
+    for i, item in enumerate(_inputs(body)):
+        tokens += len(item) if isinstance(item, list) else count_embedding_tokens(item)
+        data.append({"object": "embedding", "index": i, "embedding": _vector(item, size)})
+    return {
+        "object": "list",
+        "data": data,
+        "model": body.get("model", "stub"),
+        "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+    }
+
+
+def _encoded(result: Dict[str, Any], encoding_format: Optional[str]) -> Dict[str, Any]:
+    if encoding_format != "base64":
+        return result
+    data = [dict(item, embedding=base64.b64encode(array("f", item["embedding"]).tobytes()).decode("ascii"))
+            for item in result["data"]]
+    return dict(result, data=data)
+
+
+# ----------------------------
+# Server
+# ----------------------------
+class ReplayMiss(Exception):
+    """A --strict server got a request its replay file has no answer for."""
+
+
+class StubState:
+    """Configuration plus counters shared by the handler threads."""
+
+    def __init__(self, args: argparse.Namespace):
+        self.latency = lognormal_latency(args.latency_median, args.latency_p95)
+        self.token_delay = args.token_delay
+        self.error_rate = args.error_rate
+        self.error_statuses = [int(code) for code in str(args.error_status).split(",")]
+        self.hang_rate = args.hang_rate
+        self.hang_s = args.hang_s
+        self.upstream = args.upstream.rstrip("/") if args.upstream else None
+        self.script = DEFAULT_SCRIPT
+        if args.script:
+            with open(args.script, encoding="utf-8") as f:
+                self.script = json.load(f)
+        self.replay: Dict[str, Dict[str, Any]] = {}
+        for path in filter(None, [args.replay, args.record]):
+            if os.path.exists(path):
+                with open(path, encoding="utf-8") as f:
+                    for line in f:
+                        if line.strip():
+                            entry = json.loads(line)
+                            if "key" in entry:  # other lines carry metadata (e.g. test_cases.py's clock)
+                                self.replay[entry["key"]] = entry["response"]
+        self.strict = args.strict
+        self.record_path = args.record
+        self.log_path = args.log
+        self.lock = threading.Lock()
+        self.totals: Dict[str, int] = {
+            "connections": 0, "requests": 0, "errors_injected": 0, "hangs_injected": 0,
+            "replayed": 0, "scripted": 0, "forwarded": 0, "missed": 0,
+            "prompt_tokens": 0, "completion_tokens": 0, "embedding_tokens": 0,
+        }
+
+    def count(self, **deltas: int) -> None:
+        with self.lock:
+            for key, n in deltas.items():
+                self.totals[key] += n
+
+    def log(self, entry: Dict[str, Any]) -> None:
+        if self.log_path:
+            with self.lock, open(self.log_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry) + "\n")
+
+    def record(self, key: str, request: Dict[str, Any], response: Dict[str, Any]) -> None:
+        self.replay[key] = response
+        if self.record_path:
+            with self.lock, open(self.record_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps({"key": key, "request": request, "response": response}) + "\n")
+
+    def _recorded(self, endpoint: str, key: str, forwarded: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """The recorded response for `key`, else the upstream's (recorded now); None if neither has one."""
+        if key in self.replay:
+            self.count(replayed=1)
+            return self.replay[key]
+        if self.upstream:
+            request = urllib.request.Request(
+                f"{self.upstream}/{endpoint}",
+                data=json.dumps(forwarded).encode("utf-8"),
+                headers={"Content-Type": "application/json",
+                         "Authorization": f"Bearer {os.getenv('OPENAI_UPSTREAM_API_KEY', os.getenv('OPENAI_API_KEY', ''))}"},
+            )
+            with urllib.request.urlopen(request, timeout=120) as resp:
+                response = json.loads(resp.read())
+            self.count(forwarded=1)
+            self.record(key, forwarded, response)
+            return response
+        if self.strict:
+            self.count(missed=1)
+            raise ReplayMiss(f"No recorded response for {endpoint} request {key[:12]} (re-record the replay file)")
+        return None
+
+    def answer(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        """A chat.completion for `body`: replayed, forwarded upstream, or scripted."""
+        forwarded = {k: v for k, v in body.items() if k not in ("stream", "stream_options")}
+        completion = self._recorded("chat/completions", request_key(body), forwarded)
+        if completion is not None:
+            return dict(completion, id=f"chatcmpl-{uuid.uuid4().hex}", created=int(time.time()))
+        self.count(scripted=1)
+        return _completion(body, scripted_message(self.script, body))
+
+    def embed(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        """An embeddings response for `body`: replayed, forwarded upstream, or synthetic."""
+        forwarded = dict(body, encoding_format="float")  # recorded as floats, served in the encoding asked for
+        result = self._recorded("embeddings", embedding_key(body), forwarded)
+        if result is None:
+            self.count(scripted=1)
+            result = _embeddings(body)
+        return _encoded(result, body.get("encoding_format"))
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, like api.openai.com
+    state: StubState
+
+    def setup(self) -> None:
+        super().setup()
+        self.state.count(connections=1)
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass  # one JSONL line per request instead (--log)
+
+    def do_POST(self) -> None:
+        try:
+            self._serve()
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True  # the client gave up (timeout) while we hung
+
+    def _serve(self) -> None:
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length) or b"{}")
+        path = self.path.split("?")[0].rstrip("/")
+        state = self.state
+        state.count(requests=1)
+        start = time.perf_counter()
+        entry: Dict[str, Any] = {"time": time.time(), "path": path, "model": body.get("model"), "stream": bool(body.get("stream"))}
+
+        roll = random.random()
+        if roll < state.hang_rate:
+            state.count(hangs_injected=1)
+            time.sleep(state.hang_s)
+        elif roll < state.hang_rate + state.error_rate:
+            state.count(errors_injected=1)
+            status = random.choice(state.error_statuses)
+            self._error(status, "Injected error from the stub server")
+            state.log(dict(entry, status=status, seconds=round(time.perf_counter() - start, 4)))
+            return
+        time.sleep(state.latency())
+
+        if path.endswith("/chat/completions"):
+            try:
+                completion = state.answer(body)
+            except ReplayMiss as e:
+                self._error(404, str(e))  # not retried by the OpenAI clients
+                state.log(dict(entry, status=404, seconds=round(time.perf_counter() - start, 4)))
+                return
+            except Exception as e:
+                self._error(502, f"Upstream failed: {e}")
+                state.log(dict(entry, status=502, seconds=round(time.perf_counter() - start, 4)))
+                return
+            usage = completion.get("usage") or {}
+            state.count(prompt_tokens=usage.get("prompt_tokens", 0), completion_tokens=usage.get("completion_tokens", 0))
+            if body.get("stream"):
+                include_usage = bool((body.get("stream_options") or {}).get("include_usage"))
+                self._stream(_chunks(completion, include_usage))
+            else:
+                self._json(200, completion)
+            entry.update(usage=usage, finish_reason=completion["choices"][0].get("finish_reason"))
+        elif path.endswith("/embeddings"):
+            try:
+                result = state.embed(body)
+            except ReplayMiss as e:
+                self._error(404, str(e))
+                state.log(dict(entry, status=404, seconds=round(time.perf_counter() - start, 4)))
+                return
+            except Exception as e:
+                self._error(502, f"Upstream failed: {e}")
+                state.log(dict(entry, status=502, seconds=round(time.perf_counter() - start, 4)))
+                return
+            state.count(embedding_tokens=result["usage"]["prompt_tokens"])
+            self._json(200, result)
+            entry.update(usage=result["usage"], inputs=len(result["data"]))
+        else:
+            self._error(404, f"Unknown endpoint {path}")
+            state.log(dict(entry, status=404))
+            return
+        state.log(dict(entry, status=200, seconds=round(time.perf_counter() - start, 4)))
+
+    def _json(self, status: int, payload: Dict[str, Any], headers: Optional[Dict[str, str]] = None) -> None:
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _error(self, status: int, message: str) -> None:
+        headers = {"Retry-After": "1"} if status == 429 else None
+        self._json(status, {"error": {"message": message, "type": "stub_error", "code": status}}, headers)
+
+    def _stream(self, events: List[Dict[str, Any]]) -> None:
+        """Server-sent events over chunked transfer encoding, so the connection stays reusable."""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for i, event in enumerate(events):
+            if i and self.state.token_delay and event["choices"] and "content" in event["choices"][0]["delta"]:
+                time.sleep(self.state.token_delay)
+            self._write_chunk(f"data: {json.dumps(event)}\n\n".encode("utf-8"))
+        self._write_chunk(b"data: [DONE]\n\n")
+        self._write_chunk(b"")
+
+    def _write_chunk(self, data: bytes) -> None:
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+
+def start_server(args: argparse.Namespace, host: str = "127.0.0.1") -> Tuple[ThreadingHTTPServer, StubState]:
+    """Serve on (host, args.port) from a daemon thread; port 0 picks a free one."""
+    state = StubState(args)
+    handler = type("StubHandler", (_Handler,), {"state": state})
+    server = ThreadingHTTPServer((host, args.port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="openai-stub", daemon=True).start()
+    return server, state
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Local OpenAI-compatible stub server (chat completions + embeddings).")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--script", help="JSON rules for scripted answers (default: DEFAULT_SCRIPT)")
+    parser.add_argument("--replay", help="JSONL of recorded responses to serve first")
+    parser.add_argument("--upstream", help="Forward requests that miss the replay file here, e.g. https://api.openai.com/v1")
+    parser.add_argument("--record", help="Append forwarded requests and responses to this JSONL (replayed next time)")
+    parser.add_argument("--strict", action="store_true",
+                        help="Answer requests missing from the replay file (and not forwarded) with 404, not a script")
+    parser.add_argument("--latency-median", type=float, default=0.0, help="Seconds before the first byte (median)")
+    parser.add_argument("--latency-p95", type=float, default=0.0)
+    parser.add_argument("--token-delay", type=float, default=0.0, help="Seconds between streamed words")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of requests answered with --error-status")
+    parser.add_argument("--error-status", default="500", help="Status to inject, or a comma-separated list to pick from")
+    parser.add_argument("--hang-rate", type=float, default=0.0, help="Share of requests held for --hang-s first")
+    parser.add_argument("--hang-s", type=float, default=30.0)
+    parser.add_argument("--log", help="Append one JSON line per request (path, status, seconds, token usage)")
+    parser.add_argument("--seed", type=int)
+    return parser
+
+
+def main() -> None:
+    args = build_parser().parse_args()
+    if args.seed is not None:
+        random.seed(args.seed)
+    server, state = start_server(args, args.host)
+    print(f"OpenAI stub on http://{args.host}:{server.server_address[1]}/v1 "
+          f"({len(state.replay)} recorded responses, {len(state.script)} script rules)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.shutdown()
+        print(json.dumps(state.totals, indent=2))
+
+
+if __name__ == "__main__":
+    main()
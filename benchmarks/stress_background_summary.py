@@ -0,0 +1,136 @@
+"""
+Stress check for the background rolling summary.
+
+Many users hold long conversations with verbose replies, so the history budget
+folds turns out every few messages. A scripted stub model answers the router
+and the general agent quickly, and the summary prompt very slowly.
+
+Checks:
+  * no turn waits for a summary call: every turn finishes well before one could;
+  * every folded turn is summarized exactly once, and each summary prompt only
+    contains turns not summarized before;
+  * the summary never grows past SUMMARY_MAX_TOKENS however long the chat runs.
+
+    python benchmarks/stress_background_summary.py --users 50 --messages 30
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import re
+import sys
+import time
+from collections import Counter
+from typing import Any, List, Optional
+
+# Allow running as a script: `python benchmarks/stress_background_summary.py`
+if __package__ is None and __name__ == "__main__":
+    sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatResult
+
+from benchmarks.stubs import ScriptedChatModel, fake_update, install_stub_llm, prepare_offline_env
+
+prepare_offline_env()
+
+import src.bot as bot
+import src.streaming as streaming
+from src.history import count_tokens
+
+_MSG_RE = re.compile(r"human: (?:\[user_id=\w+\] )?tell me more (\w+) (\d+)")
+_USER_RE = re.compile(r"tell me more (\w+) (\d+)")
+# Long enough that a few turns overflow HISTORY_MAX_TOKENS
+_VERBOSE = "Our desert and water activities run every day from 9am to 9pm. " * 25
+# Deliberately longer than the cap, to check the cap
+_LONG_SUMMARY = "Customer is asking about activities and has not chosen one yet. " * 40
+
+summarized: Counter = Counter()
+
+
+def _script(messages: List[BaseMessage]) -> AIMessage:
+    prompt = messages[-1].content if messages else ""
+    if "UPDATED SUMMARY:" in prompt:
+        new_part = prompt.split("NEW MESSAGES:", 1)[1]
+        for user_id, step in _MSG_RE.findall(new_part):
+            summarized[(user_id, int(step))] += 1
+        return AIMessage(content=_LONG_SUMMARY)
+    if "last_agent=" in prompt:
+        return AIMessage(content="general")
+    return AIMessage(content=_VERBOSE)
+
+
+class _SlowSummaryModel(ScriptedChatModel):
+    summary_latency_s: float = 1.0
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[Any] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        if messages and "UPDATED SUMMARY:" in str(messages[-1].content):
+            await asyncio.sleep(self.summary_latency_s)
+            return self._result(messages)
+        return await super()._agenerate(messages, stop, run_manager, **kwargs)
+
+
+async def _conversation(user_id: str, messages: int, summary_latency: float) -> List[float]:
+    slow = []
+    for step in range(messages):
+        start = time.perf_counter()
+        update = fake_update(0, f"tell me more {user_id} {step}")
+        update.effective_user.id = user_id
+        await bot.on_message(update, None)
+        elapsed = time.perf_counter() - start
+        if elapsed >= summary_latency:
+            slow.append(elapsed)
+    return slow
+
+
+async def main_async(users: int, messages: int, latency: float, summary_latency: float) -> int:
+    install_stub_llm(bot, _SlowSummaryModel(script=_script, latency_s=latency, summary_latency_s=summary_latency))
+    bot.intent_classifier = None  # route every turn through the (stub) LLM router
+    bot._turn_slots = asyncio.Semaphore(users)  # queueing for a slot would look like a slow turn
+    # Streaming 50 users' long replies word by word at zero latency is CPU-bound and would also
+    # look like slow turns; bench_streaming_replies.py covers streaming
+    streaming.STREAM_REPLIES = False
+    user_ids = [f"s{i}" for i in range(users)]
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        slow = await asyncio.gather(*(_conversation(uid, messages, summary_latency) for uid in user_ids))
+        await bot.drain_summaries()
+    elapsed = time.perf_counter() - start
+
+    slow_turns = sum(len(s) for s in slow)
+    folded_lost = 0
+    for uid in user_ids:
+        kept = {int(m.content.rsplit(" ", 1)[-1]) for m in bot.sessions.peek(uid).memory.chat_memory.messages
+                if m.type == "human"}
+        folded_lost += sum(1 for step in range(messages) if step not in kept and not summarized[(uid, step)])
+    repeated = sum(1 for n in summarized.values() if n > 1)
+    summary_tokens = max((count_tokens(bot.sessions.peek(uid).summary or "") for uid in user_ids), default=0)
+
+    print(f"{users * messages} turns for {users} users in {elapsed:.2f}s")
+    print(f"turns slowed by a summary call: {slow_turns}")
+    print(f"summarized turns: {len(summarized)}, summarized twice: {repeated}, folded but never summarized: {folded_lost}")
+    print(f"largest summary: {summary_tokens} tokens (cap {bot.SUMMARY_MAX_TOKENS})")
+    failed = slow_turns or repeated or folded_lost or not summarized or summary_tokens > bot.SUMMARY_MAX_TOKENS
+    print("FAIL" if failed else "OK")
+    return 1 if failed else 0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Check that rolling summaries run off the reply path.")
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--messages", type=int, default=30)
+    parser.add_argument("--latency", type=float, default=0.05, help="Stub router/agent latency per call (s)")
+    parser.add_argument("--summary-latency", type=float, default=1.0, help="Stub summary latency (s)")
+    args = parser.parse_args()
+    sys.exit(asyncio.run(main_async(args.users, args.messages, args.latency, args.summary_latency)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""
+End-to-end chaos check of the OpenAI HTTP path against the local stub server.
+
+Unlike the other benchmarks, nothing inside the bot is replaced: ChatOpenAI
+and OpenAIEmbeddings talk HTTP to benchmarks/openai_stub_server.py (started
+in-process on a free port) through OPENAI_BASE_URL. Users book a buggy (the
+desert agent streams a retrieval tool call, the KB embeds the query, the agent
+answers) or ask a general question (LLM router, streamed general answer).
+
+Phases:
+  errors   --error-rate of requests fail with 500 or 429 (Retry-After): the
+           clients' retries must hide every one of them;
+  hangs    --hang-rate of requests stall past OPENAI_TIMEOUT_S: the timeout
+           must fire and the retry succeed.
+
+Checks: no turn fails; keep-alive works (far fewer connections than requests);
+the token usage src/usage.py accounted equals what the server says it served
+(errors phase; a hung request is served after its client gave up).
+
+    python benchmarks/stress_openai_http.py --users 20 --messages 4 --error-rate 0.05
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+# Allow running as a script: `python benchmarks/stress_openai_http.py`
+if __package__ is None and __name__ == "__main__":
+    sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from benchmarks.openai_stub_server import build_parser, start_server
+from benchmarks.stubs import fake_update, prepare_offline_env
+
+TIMEOUT_S = 2.0
+
+
+async def _phase(bot, users: int, messages: int, base_uid: int) -> Dict[str, object]:
+    bot.sessions.clear()
+    updates = []
+
+    async def conversation(uid: int) -> None:
+        text = "I want a buggy" if uid % 2 == 0 else "what else do you offer"
+        for _ in range(messages):
+            update = fake_update(uid, text)
+            updates.append(update)
+            await bot.on_message(update, None)
+
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        await asyncio.gather(*(conversation(base_uid + i) for i in range(users)))
+        await bot.drain_summaries()
+    failed = [u.message.replies[-1] for u in updates
+              if not u.message.replies or u.message.replies[-1].startswith("Sorry")]
+    return {"elapsed": time.perf_counter() - start, "turns": len(updates), "failed": failed}
+
+
+async def main_async(args: argparse.Namespace) -> int:
+    server_args = build_parser().parse_args([
+        "--port", "0", "--latency-median", str(args.latency), "--latency-p95", str(args.latency * 2),
+        "--token-delay", "0.005", "--error-status", "500,429", "--hang-s", str(TIMEOUT_S * 2), "--seed", "1",
+    ])
+    server, state = start_server(server_args)
+    base_url = f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+    # Before the bot is imported: its clients are configured from the environment
+    prepare_offline_env()
+    os.environ["OPENAI_BASE_URL"] = base_url
+    os.environ["OPENAI_TIMEOUT_S"] = str(TIMEOUT_S)
+    os.environ["OPENAI_MAX_RETRIES"] = str(args.retries)
+    os.environ["EMBEDDING_CACHE_PATH"] = os.path.join(tempfile.mkdtemp(prefix="stress_http_"), "cache.sqlite3")
+    import src.bot as bot
+    from src import usage
+
+    bot.intent_classifier = None  # general turns take the LLM router over HTTP too
+    bot.USAGE_LOG = False
+    with contextlib.redirect_stdout(io.StringIO()):
+        bot.warmup()
+    usage.LEDGER.reset()
+
+    failures: List[str] = []
+    print(f"stub server {base_url}; {args.users} users x {args.messages} messages per phase, "
+          f"timeout {TIMEOUT_S}s, {args.retries} retries\n")
+    print(f"{'phase':>7} {'turns':>6} {'wall s':>7} {'requests':>9} {'conns':>6} {'injected':>9} {'failed':>7}")
+
+    for phase, (error_rate, hang_rate) in (("errors", (args.error_rate, 0.0)), ("hangs", (0.0, args.hang_rate))):
+        before = dict(state.totals)
+        state.error_rate, state.hang_rate = error_rate, hang_rate
+        result = await _phase(bot, args.users, args.messages, 50_000 if phase == "errors" else 60_000)
+        delta = {k: state.totals[k] - before[k] for k in state.totals}
+        injected = delta["errors_injected"] + delta["hangs_injected"]
+        print(f"{phase:>7} {result['turns']:>6} {result['elapsed']:>7.2f} {delta['requests']:>9} "
+              f"{delta['connections']:>6} {injected:>9} {len(result['failed']):>7}")
+        if result["failed"]:
+            failures.append(f"{phase}: {len(result['failed'])} turns failed, e.g. {result['failed'][0][:120]}")
+        if not injected and (error_rate or hang_rate):
+            failures.append(f"{phase}: nothing was injected; raise the rate or the traffic")
+        if phase == "errors":
+            spent = usage.LEDGER.snapshot(top_users=0)["total"]
+            served = (delta["prompt_tokens"], delta["completion_tokens"], delta["embedding_tokens"])
+            accounted = (spent["input_tokens"], spent["output_tokens"], spent["embedding_tokens"])
+            print(f"{'':>7} tokens in/out/embedding: server {served}, accounted {accounted}")
+            if served != accounted:
+                failures.append(f"accounted usage {accounted} != served {served}")
+            if delta["connections"] * 2 > delta["requests"]:
+                failures.append(f"{delta['connections']} connections for {delta['requests']} requests: no keep-alive")
+
+    server.shutdown()
+    for failure in failures:
+        print(f"FAIL {failure}")
+    print("OK" if not failures else "FAIL")
+    return 1 if failures else 0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Chaos-test the OpenAI HTTP path against the local stub server.")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--messages", type=int, default=4)
+    parser.add_argument("--latency", type=float, default=0.05, help="Median server latency (p95 is twice that)")
+    parser.add_argument("--error-rate", type=float, default=0.05)
+    parser.add_argument("--hang-rate", type=float, default=0.03)
+    parser.add_argument("--retries", type=int, default=4, help="OPENAI_MAX_RETRIES for the run")
+    args = parser.parse_args()
+    sys.exit(asyncio.run(main_async(args)))
+
+
+if __name__ == "__main__":
+    main()
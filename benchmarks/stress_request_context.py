@@ -0,0 +1,123 @@
+"""
+Concurrency check for the task-local request context used by the water tools.
+
+Every user gets a water draft dated in a different season. Then:
+  * agent turns: concurrent `on_message` turns where a scripted stub model calls
+    `water_packages_tool` without a booking_date, so the tool must infer it from
+    the current user's draft;
+  * threads: worker threads each bind their own context and infer the date.
+Each user must only ever see their own booking date and season.
+
+    python benchmarks/stress_request_context.py --users 300
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import random
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+# Allow running as a script: `python benchmarks/stress_request_context.py`
+if __package__ is None and __name__ == "__main__":
+    sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, ToolMessage
+
+from benchmarks.stubs import ScriptedChatModel, fake_update, install_stub_llm, prepare_offline_env
+
+prepare_offline_env()
+
+import src.bot as bot
+import src.water_tools as water_tools
+from src.request_context import request_context
+
+SEASON_DATES = ["2026-01-10", "2026-05-10", "2026-10-10"]  # high / low / summer_end
+
+
+def _script(messages: List[BaseMessage]) -> AIMessage:
+    last_human = max(i for i, m in enumerate(messages) if isinstance(m, HumanMessage))
+    tool_results = [m for m in messages[last_human:] if isinstance(m, ToolMessage)]
+    if tool_results:
+        return AIMessage(content=json.loads(tool_results[-1].content)["query"])
+    return AIMessage(
+        content="",
+        tool_calls=[{"name": "water_packages_tool", "args": {"activity": "jet ski"}, "id": "call_packages"}],
+    )
+
+
+async def _fake_water_search(query: str, k: int = 6) -> Dict[str, object]:
+    await asyncio.sleep(random.uniform(0, 0.01))
+    return {"query": query, "matches": []}
+
+
+def _seed_drafts(users: int) -> Dict[str, str]:
+    expected = {}
+    for i in range(users):
+        uid = str(i)
+        date = SEASON_DATES[i % len(SEASON_DATES)]
+        draft = water_tools._get_or_create_water_booking(uid)
+        draft.update({"activity": "jetski", "date_time_iso": f"{date}T10:00:00+04:00", "booking_date": date})
+        expected[uid] = date
+    return expected
+
+
+async def _agent_turns(expected: Dict[str, str]) -> int:
+    updates = {uid: fake_update(int(uid), "jet ski price please") for uid in expected}
+    with contextlib.redirect_stdout(io.StringIO()):
+        await asyncio.gather(*(bot.on_message(u, None) for u in updates.values()))
+    leaks = 0
+    for uid, update in updates.items():
+        reply = update.message.replies[-1] if update.message.replies else ""
+        if not reply.endswith(f"on {expected[uid]}"):
+            leaks += 1
+    return leaks
+
+
+def _thread_job(uid: str) -> tuple:
+    with request_context(uid):
+        time.sleep(random.uniform(0, 0.002))
+        date = water_tools._infer_booking_date_from_context()
+        return uid, date, water_tools._get_season_for_date(date) if date else None
+
+
+def _threads(expected: Dict[str, str], workers: int) -> int:
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(_thread_job, list(expected) * 3))
+    return sum(
+        1 for uid, date, season in results
+        if date != expected[uid] or season != water_tools._get_season_for_date(expected[uid])
+    )
+
+
+async def main_async(users: int, workers: int) -> int:
+    install_stub_llm(bot, ScriptedChatModel(script=_script, latency_s=0.0, jitter_s=0.01))
+    water_tools._awater_search = _fake_water_search
+    expected = _seed_drafts(users)
+
+    agent_leaks = await _agent_turns(expected)
+    thread_leaks = _threads(expected, workers)
+    outside = water_tools._infer_booking_date_from_context()
+
+    print(f"agent turns: {users} concurrent, {agent_leaks} saw another user's date")
+    print(f"threads: {users * 3} lookups on {workers} workers, {thread_leaks} saw another user's date")
+    print(f"lookup outside any request: {outside!r}")
+    failed = agent_leaks or thread_leaks or outside is not None
+    print("FAIL" if failed else "OK")
+    return 1 if failed else 0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Check request-context isolation under concurrency.")
+    parser.add_argument("--users", type=int, default=300)
+    parser.add_argument("--workers", type=int, default=32)
+    args = parser.parse_args()
+    sys.exit(asyncio.run(main_async(args.users, args.workers)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,212 @@
+"""
+Stress check for token and cost accounting (src/usage.py).
+
+Many users talk at once: even uids book a buggy (the desert agent calls
+booking_update, then answers), odd uids ask general questions that go through
+the LLM router and get replies verbose enough to trigger background summaries.
+The stub model reports usage like ChatOpenAI with stream_usage=True and keeps
+its own tally of what it charged, per user and per kind of call, from inside
+the call.
+
+Checks:
+  * the ledger matches the stub's tally overall, per route and per user, so no
+    call is lost, counted twice or attributed to another user's turn;
+  * the per-turn log lines add up to the ledger minus the background summaries;
+  * embedding tokens are counted for cache misses only;
+  * /stats answers admins only.
+
+    python benchmarks/stress_usage_accounting.py --users 40 --messages 8
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import re
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from types import SimpleNamespace
+from typing import Dict, List
+
+# Allow running as a script: `python benchmarks/stress_usage_accounting.py`
+if __package__ is None and __name__ == "__main__":
+    sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, LLMResult
+
+from benchmarks.stubs import FakeMessage, ScriptedChatModel, fake_update, install_stub_llm, prepare_offline_env
+
+prepare_offline_env()
+
+import src.bot as bot
+import src.streaming as streaming
+from src import usage
+from src.embedding_cache import CachedEmbeddings, EmbeddingStore
+from src.request_context import current_user_id, request_context
+
+MODEL = "gpt-4.1-mini"
+_VERBOSE = "Our desert and water activities run every day from 9am to 9pm. " * 25
+_LOG_RE = re.compile(r"usage user=(\S+) .*?: (\d+) LLM calls, (\d+) in \((\d+) cached\) / (\d+) out")
+
+charged: Dict[str, Dict[str, List[int]]] = {"route": defaultdict(lambda: [0, 0, 0]), "user": defaultdict(lambda: [0, 0, 0])}
+
+
+def _kind(messages: List[BaseMessage]) -> str:
+    prompt = str(messages[-1].content)
+    if "UPDATED SUMMARY:" in prompt:
+        return "summary"
+    if "last_agent=" in prompt:
+        return "router"
+    return "desert" if "[user_id=" in prompt or isinstance(messages[-1], ToolMessage) else "general"
+
+
+def _script(messages: List[BaseMessage]) -> AIMessage:
+    kind = _kind(messages)
+    if kind == "summary":
+        return AIMessage(content="Customer is asking about activities.")
+    if kind == "router":
+        return AIMessage(content="general")
+    if kind == "general":
+        return AIMessage(content=_VERBOSE)
+    last_human = max(i for i, m in enumerate(messages) if isinstance(m, HumanMessage))
+    if any(isinstance(m, ToolMessage) for m in messages[last_human:]):
+        return AIMessage(content="Noted. Which date works for you?")
+    user_id = str(messages[last_human].content).split("[user_id=", 1)[1].split("]", 1)[0]
+    return AIMessage(content="", tool_calls=[{
+        "name": "booking_update",
+        "args": {"user_id": user_id, "add_item": {"activity": "buggy", "quantity": 1}},
+        "id": "call_update",
+    }])
+
+
+class _TallyingModel(ScriptedChatModel):
+    """Charges every answer to the user whose turn (or background task) is running, as seen from inside the call."""
+
+    def _answer(self, messages: List[BaseMessage]) -> AIMessage:
+        message = super()._answer(messages)
+        meta = message.usage_metadata
+        for key, name in (("route", _kind(messages)), ("user", current_user_id())):
+            row = charged[key][name]
+            row[0] += 1
+            row[1] += meta["input_tokens"]
+            row[2] += meta["output_tokens"]
+        return message
+
+
+def _as_row(u: Dict[str, int]) -> List[int]:
+    return [u.get("llm_calls", 0), u.get("input_tokens", 0), u.get("output_tokens", 0)]
+
+
+async def _check_embeddings() -> List[str]:
+    with tempfile.TemporaryDirectory() as tmp:
+        emb = CachedEmbeddings(DeterministicFakeEmbedding(size=8), "text-embedding-3-small",
+                               EmbeddingStore(os.path.join(tmp, "cache.sqlite3")))
+        texts = ["buggy prices for two people", "jet ski at Burj Al Arab"]
+        with request_context("emb-user"), usage.route("desert"), usage.turn() as spent:
+            for _ in range(3):  # the 2nd and 3rd round are cache hits
+                await emb.aembed_query(texts[0])
+                emb.embed_documents(texts)
+    expected = sum(usage.count_embedding_tokens(t) for t in texts)
+    if spent.embedding_tokens != expected or usage.LEDGER.user("emb-user").embedding_tokens != expected:
+        return [f"embedding tokens {spent.embedding_tokens}, expected {expected} (misses only)"]
+    return []
+
+
+async def _check_stats_cmd() -> List[str]:
+    bot.ADMIN_USER_IDS = {"1"}
+    admin = SimpleNamespace(effective_user=SimpleNamespace(id=1), message=FakeMessage("/stats"))
+    other = SimpleNamespace(effective_user=SimpleNamespace(id=2), message=FakeMessage("/stats"))
+    await bot.stats_cmd(admin, None)
+    await bot.stats_cmd(other, None)
+    failures = []
+    if not admin.message.replies or "router" not in admin.message.replies[0]:
+        failures.append("/stats did not show per-route usage to an admin")
+    if other.message.replies:
+        failures.append("/stats answered a non-admin")
+    return failures
+
+
+def _accountant_us(calls: int = 20_000) -> float:
+    message = AIMessage(content="ok", usage_metadata={"input_tokens": 1200, "output_tokens": 40, "total_tokens": 1240},
+                        response_metadata={"model_name": MODEL})
+    result = LLMResult(generations=[[ChatGeneration(message=message)]])
+    start = time.perf_counter()
+    with usage.route("bench"):
+        for _ in range(calls):
+            usage.ACCOUNTANT.on_llm_end(result)
+    return (time.perf_counter() - start) / calls * 1e6
+
+
+async def main_async(users: int, messages: int, latency: float) -> int:
+    install_stub_llm(bot, _TallyingModel(script=_script, latency_s=latency, jitter_s=latency, stub_model=MODEL))
+    bot.intent_classifier = None  # general turns go through the stub LLM router
+    streaming.STREAM_REPLIES = False
+    usage.LEDGER.reset()
+
+    async def conversation(uid: int) -> None:
+        text = "I want a buggy" if uid % 2 == 0 else "what else do you offer"
+        for _ in range(messages):
+            await bot.on_message(fake_update(uid, text), None)
+
+    log = io.StringIO()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(log):
+        await asyncio.gather(*(conversation(40_000 + i) for i in range(users)))
+        await bot.drain_summaries()
+    elapsed = time.perf_counter() - start
+    data = usage.LEDGER.snapshot(top_users=users)
+
+    failures = []
+    for route, row in sorted(charged["route"].items()):
+        got = _as_row(data["by_route"].get(route, {}))
+        if got != row:
+            failures.append(f"route {route}: ledger {got}, model charged {row}")
+    if set(data["by_route"]) != set(charged["route"]):
+        failures.append(f"routes {sorted(data['by_route'])}, expected {sorted(charged['route'])}")
+    wrong_users = [uid for uid, row in charged["user"].items() if _as_row(data["top_users"].get(uid, {})) != row]
+    if wrong_users:
+        failures.append(f"{len(wrong_users)} users' usage differs from what the model charged them")
+
+    logged: Dict[str, List[int]] = defaultdict(lambda: [0, 0, 0])
+    for uid, calls, tokens_in, _cached, tokens_out in _LOG_RE.findall(log.getvalue()):
+        row = logged[uid]
+        row[0] += int(calls)
+        row[1] += int(tokens_in)
+        row[2] += int(tokens_out)
+    # Per-turn lines leave out background summaries; those are only known per route, so compare totals
+    turn_total = [sum(r[i] for r in logged.values()) for i in range(3)]
+    expected_turn_total = [sum(r[i] for r in charged["user"].values()) - charged["route"]["summary"][i] for i in range(3)]
+    if turn_total != expected_turn_total:
+        failures.append(f"per-turn log lines add up to {turn_total}, expected {expected_turn_total}")
+    if "summary" not in charged["route"]:
+        failures.append("no summary ran; replies too short to fold history")
+
+    failures += await _check_embeddings()
+    failures += await _check_stats_cmd()
+
+    print(f"{users} users x {messages} messages in {elapsed:.2f}s, stub priced as {MODEL}\n")
+    print(usage.format_report(usage.LEDGER.snapshot(top_users=3)))
+    turns = users * messages
+    print(f"\ncost per turn: ${data['total']['cost_usd'] / turns:.5f} (stub token counts, chars/4)")
+    print(f"accountant: {_accountant_us():.1f} us per LLM call")
+    for failure in failures:
+        print(f"FAIL {failure}")
+    print("OK" if not failures else "FAIL")
+    return 1 if failures else 0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Check that token usage is attributed to the right route, user and turn.")
+    parser.add_argument("--users", type=int, default=40)
+    parser.add_argument("--messages", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.02, help="Stub latency per call, plus as much jitter (s)")
+    args = parser.parse_args()
+    sys.exit(asyncio.run(main_async(args.users, args.messages, args.latency)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""
+Stress check for per-user ordering in `on_message`.
+
+Fires interleaved updates for many users at once. A scripted stub model makes the
+desert agent call `booking_update` to add one draft item per message, with random
+latency so turns finish out of order. Afterwards every user's draft items, chat history and
+replies must be in send order, no user may ever have two turns in flight, and
+in-flight turns must never exceed the global limit.
+
+    python benchmarks/stress_user_ordering.py --users 200 --messages 8 --limit 16
+    python benchmarks/stress_user_ordering.py --unordered   # bypass the lock to see the races
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import re
+import sys
+import time
+from collections import defaultdict
+from typing import Dict, List
+
+# Allow running as a script: `python benchmarks/stress_user_ordering.py`
+if __package__ is None and __name__ == "__main__":
+    sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, ToolMessage
+
+from benchmarks.stubs import ScriptedChatModel, fake_update, install_stub_llm, prepare_offline_env
+
+prepare_offline_env()
+
+import src.bot as bot
+from src.tools import BOOKINGS
+
+_STEP_RE = re.compile(r"\[user_id=(\w+)\] buggy step (\d+)")
+
+
+def _script(messages: List[BaseMessage]) -> AIMessage:
+    last_human = max(i for i, m in enumerate(messages) if isinstance(m, HumanMessage))
+    user_id, step = _STEP_RE.search(messages[last_human].content).groups()
+    if any(isinstance(m, ToolMessage) for m in messages[last_human:]):
+        return AIMessage(content=f"noted step {step}")
+    return AIMessage(
+        content="",
+        tool_calls=[{
+            "name": "booking_update",
+            "args": {"user_id": user_id, "add_item": {"activity": "buggy", "quantity": int(step)}},
+            "id": f"call_{user_id}_{step}",
+        }],
+    )
+
+
+async def main_async(users: int, messages: int, limit: int, latency: float, unordered: bool) -> int:
+    install_stub_llm(bot, ScriptedChatModel(script=_script, latency_s=latency / 2, jitter_s=latency))
+    bot._turn_slots = asyncio.Semaphore(limit)
+
+    in_flight = 0
+    peak = 0
+    per_user: Dict[str, int] = defaultdict(int)
+    overlaps = 0
+    handle_message = bot._handle_message
+
+    async def tracked(update, context, session=None):
+        nonlocal in_flight, peak, overlaps
+        user_id = str(update.effective_user.id)
+        session = session or bot.sessions.get(user_id)  # --unordered skips on_message
+        in_flight += 1
+        peak = max(peak, in_flight)
+        per_user[user_id] += 1
+        if per_user[user_id] > 1:
+            overlaps += 1
+        try:
+            await handle_message(update, context, session)
+        finally:
+            in_flight -= 1
+            per_user[user_id] -= 1
+
+    bot._handle_message = tracked
+    entry = tracked if unordered else bot.on_message
+
+    user_ids = [f"u{i}" for i in range(users)]
+    updates: Dict[str, list] = {uid: [] for uid in user_ids}
+    tasks = []
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        for step in range(messages):
+            for idx, uid in enumerate(user_ids):
+                update = fake_update(idx, f"buggy step {step}")
+                update.effective_user.id = uid
+                updates[uid].append(update)
+                tasks.append(asyncio.create_task(entry(update, None)))
+        await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - start
+
+    expected = [f"step {i}" for i in range(messages)]
+    bad_drafts = bad_history = bad_counters = 0
+    for uid in user_ids:
+        items = BOOKINGS.get(uid, {}).get("items") or []
+        if [item.get("quantity") for item in items] != list(range(messages)):
+            bad_drafts += 1
+        session = bot.sessions.peek(uid)
+        humans = [m.content for m in session.memory.chat_memory.messages if isinstance(m, HumanMessage)]
+        if [h.rsplit("buggy ", 1)[-1] for h in humans] != expected:
+            bad_history += 1
+        if session.message_count != messages:  # stub turns never overflow the history budget
+            bad_counters += 1
+    missing_replies = sum(1 for uid in user_ids for u in updates[uid] if not u.message.replies)
+
+    total = users * messages
+    print(f"{total} updates for {users} users in {elapsed:.2f}s ({total / elapsed:.0f} msgs/s)")
+    print(f"peak in-flight turns: {peak} (limit {limit})")
+    print(f"same-user overlaps: {overlaps}")
+    print(f"inconsistent drafts: {bad_drafts}, out-of-order histories: {bad_history}, "
+          f"wrong counters: {bad_counters}, missing replies: {missing_replies}")
+
+    failed = overlaps or bad_drafts or bad_history or bad_counters or missing_replies
+    if not unordered:
+        failed = failed or peak > limit or len(bot._user_locks)
+    print("FAIL" if failed else "OK")
+    return 1 if failed else 0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Stress per-user ordering of concurrent Telegram updates.")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--messages", type=int, default=8, help="Messages per user (keep below 20 to skip summaries).")
+    parser.add_argument("--limit", type=int, default=16, help="Global concurrent-turn limit.")
+    parser.add_argument("--latency", type=float, default=0.02, help="Max stub LLM latency per call, in seconds.")
+    parser.add_argument("--unordered", action="store_true", help="Bypass the per-user lock and global limit.")
+    args = parser.parse_args()
+    sys.exit(asyncio.run(main_async(args.users, args.messages, args.limit, args.latency, args.unordered)))
+
+
+if __name__ == "__main__":
+    main()
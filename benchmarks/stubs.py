@@ -0,0 +1,274 @@
+"""Offline stand-ins for the OpenAI-backed pieces of the bot, used by the benchmarks."""
+import asyncio
+import hashlib
+import itertools
+import json
+import math
+import os
+import random
+import re
+import time
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
+
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+import telegram
+
+_WORD_RE = re.compile(r"\S+\s*")
+
+
+def prepare_offline_env() -> None:
+    """Set the env vars `src.bot` requires at import so benchmarks never need a real .env."""
+    os.environ.setdefault("TELEGRAM_BOT_TOKEN", "offline-benchmark-token")
+    os.environ.setdefault("OPENAI_API_KEY", "sk-offline-benchmark")
+
+
+def lognormal_latency(median_s: float, p95_s: float) -> Callable[[], float]:
+    """Sampler for a right-skewed latency like an API's: half the calls under median_s, 5% over p95_s."""
+    if median_s <= 0:
+        return lambda: 0.0
+    sigma = math.log(max(p95_s, median_s) / median_s) / 1.645
+    mu = math.log(median_s)
+    return lambda: random.lognormvariate(mu, sigma)
+
+
+class StubChatModel(BaseChatModel):
+    """Chat model that sleeps for a fixed latency (plus optional jitter) and answers with a canned reply.
+
+    When streamed, the latency comes before the first chunk and the text then
+    arrives word by word, `token_delay_s` apart; unstreamed calls take as long
+    in total, like the real API.
+
+    Every answer reports token usage the way ChatOpenAI does (usage_metadata;
+    on the last chunk when streamed), estimated at 4 characters per token and
+    priced as `stub_model` by src/usage.py.
+    """
+
+    latency_s: float = 0.2
+    jitter_s: float = 0.0
+    latency_fn: Optional[Callable[[], float]] = None  # e.g. lognormal_latency(); replaces latency_s + jitter
+    token_delay_s: float = 0.0
+    reply: str = "Sure — which date and time would you like?"
+    stub_model: str = "stub-chat"  # unpriced; set e.g. "gpt-4.1-mini" to see costs
+
+    @property
+    def _llm_type(self) -> str:
+        return "stub-chat"
+
+    def _delay(self) -> float:
+        if self.latency_fn is not None:
+            return self.latency_fn()
+        return self.latency_s + random.uniform(0, self.jitter_s)
+
+    def _respond(self, messages: List[BaseMessage]) -> AIMessage:
+        return AIMessage(content=self.reply)
+
+    def _words(self, message: AIMessage) -> List[str]:
+        return _WORD_RE.findall(message.content) or [""]
+
+    def _generation_time(self, result: ChatResult) -> float:
+        return self.token_delay_s * (len(self._words(result.generations[0].message)) - 1)
+
+    def _usage(self, messages: List[BaseMessage], message: AIMessage) -> dict:
+        prompt = sum(len(str(m.content)) // 4 + 4 for m in messages)
+        completion = len(str(message.content)) // 4 + sum(len(json.dumps(c["args"])) // 4 for c in message.tool_calls)
+        return {"input_tokens": prompt, "output_tokens": completion, "total_tokens": prompt + completion}
+
+    def _answer(self, messages: List[BaseMessage]) -> AIMessage:
+        message = self._respond(messages)
+        return message.model_copy(update={
+            "usage_metadata": self._usage(messages, message),
+            "response_metadata": {**message.response_metadata, "model_name": self.stub_model},
+        })
+
+    def _result(self, messages: List[BaseMessage]) -> ChatResult:
+        return ChatResult(generations=[ChatGeneration(message=self._answer(messages))])
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[Any] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        time.sleep(self._delay())
+        result = self._result(messages)
+        time.sleep(self._generation_time(result))
+        return result
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[Any] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        await asyncio.sleep(self._delay())
+        result = self._result(messages)
+        await asyncio.sleep(self._generation_time(result))
+        return result
+
+    async def _astream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[Any] = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        await asyncio.sleep(self._delay())
+        message = self._answer(messages)
+        if message.tool_calls:
+            tool_call_chunks = [
+                {"name": call["name"], "args": json.dumps(call["args"]), "id": call["id"], "index": i}
+                for i, call in enumerate(message.tool_calls)
+            ]
+            yield ChatGenerationChunk(message=AIMessageChunk(content=message.content, tool_call_chunks=tool_call_chunks))
+        else:
+            for i, word in enumerate(self._words(message)):
+                if i and self.token_delay_s:
+                    await asyncio.sleep(self.token_delay_s)
+                yield ChatGenerationChunk(message=AIMessageChunk(content=word))
+        # Like stream_usage=True: usage comes in a last, empty chunk
+        yield ChatGenerationChunk(message=AIMessageChunk(
+            content="", usage_metadata=message.usage_metadata, response_metadata=message.response_metadata,
+        ))
+
+
+class ScriptedChatModel(StubChatModel):
+    """Stub whose reply (text or tool calls) is computed from the prompt by `script`."""
+
+    script: Callable[[List[BaseMessage]], AIMessage]
+
+    def _respond(self, messages: List[BaseMessage]) -> AIMessage:
+        return self.script(messages)
+
+
+def install_stub_llm(bot_module: Any, chat_model: BaseChatModel) -> None:
+    """Point the bot's router, general agent and both tool agents at `chat_model`."""
+    bot_module.llm = chat_model
+    bot_module._executors.clear()  # rebuilt around the stub on first use
+
+
+class StubEmbeddings(Embeddings):
+    """Embeddings model that sleeps like an API call and returns a vector derived from the text's hash."""
+
+    def __init__(self, size: int = 1536, latency_fn: Callable[[], float] = lambda: 0.0):
+        self.size = size
+        self.latency_fn = latency_fn
+        self.calls = 0
+
+    def _vector(self, text: str) -> List[float]:
+        rng = random.Random(hashlib.sha256(text.encode("utf-8")).digest())
+        return [rng.gauss(0, 1) for _ in range(self.size)]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        self.calls += 1
+        time.sleep(self.latency_fn())
+        return [self._vector(t) for t in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        self.calls += 1
+        await asyncio.sleep(self.latency_fn())
+        return [self._vector(t) for t in texts]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return (await self.aembed_documents([text]))[0]
+
+
+def install_stub_embeddings(model: str, embeddings: Embeddings, cache_path: str) -> None:
+    """Serve `model` from `embeddings` behind a CachedEmbeddings at `cache_path` (use a temp file for a cold cache)."""
+    from src import embedding_cache
+
+    store = embedding_cache.EmbeddingStore(cache_path)
+    embedding_cache._shared[model] = embedding_cache.CachedEmbeddings(embeddings, model, store)
+
+
+class FakeMessage:
+    """Just enough of `telegram.Message` for `on_message`: text plus an awaitable reply_text.
+
+    `replies` holds what the user currently sees of each reply, so a streamed
+    reply's entry is its placeholder until edited; `edits` logs (time, text).
+    """
+
+    def __init__(self, text: str):
+        self.text = text
+        self.replies: List[str] = []
+        self.edits: List[tuple] = []
+        self.sent_at: List[float] = []
+
+    async def reply_text(self, text: str, **kwargs: Any) -> "FakeSentMessage":
+        self.replies.append(text)
+        self.sent_at.append(time.perf_counter())
+        return FakeSentMessage(self, len(self.replies) - 1)
+
+
+class FakeSentMessage:
+    """A message the bot sent; editing it updates the parent's `replies` entry."""
+
+    def __init__(self, parent: FakeMessage, index: int):
+        self._parent = parent
+        self._index = index
+
+    async def edit_text(self, text: str, **kwargs: Any) -> "FakeSentMessage":
+        self._parent.replies[self._index] = text
+        self._parent.edits.append((time.perf_counter(), text))
+        return self
+
+    async def delete(self) -> bool:
+        self._parent.replies[self._index] = ""
+        return True
+
+
+def fake_update(user_id: int, text: str) -> Any:
+    return SimpleNamespace(effective_user=SimpleNamespace(id=user_id), message=FakeMessage(text))
+
+
+class RecordingBot:
+    """Stands in for `telegram.Bot` behind real `telegram.Message` objects: the Bot API calls
+    `Message.reply_text` / `edit_text` / `delete` make sleep for `latency_fn` and are counted."""
+
+    defaults = None
+
+    def __init__(self, latency_fn: Callable[[], float] = lambda: 0.0):
+        self.latency_fn = latency_fn
+        self.calls: Dict[str, int] = {"send_message": 0, "edit_message_text": 0, "delete_message": 0}
+        self._message_ids = itertools.count(1)
+        self._user = telegram.User(id=1, first_name="Jetset", is_bot=True)
+
+    def _message(self, chat_id: int, text: str) -> "telegram.Message":
+        chat = telegram.Chat(id=chat_id, type=telegram.Chat.PRIVATE)
+        message = telegram.Message(next(self._message_ids), datetime.now(timezone.utc), chat,
+                                   from_user=self._user, text=text)
+        message.set_bot(self)
+        return message
+
+    async def send_message(self, chat_id: int, text: str, **kwargs: Any) -> "telegram.Message":
+        self.calls["send_message"] += 1
+        await asyncio.sleep(self.latency_fn())
+        return self._message(chat_id, text)
+
+    async def edit_message_text(self, text: str, chat_id: int, **kwargs: Any) -> "telegram.Message":
+        self.calls["edit_message_text"] += 1
+        await asyncio.sleep(self.latency_fn())
+        return self._message(chat_id, text)
+
+    async def delete_message(self, chat_id: int, message_id: int, **kwargs: Any) -> bool:
+        self.calls["delete_message"] += 1
+        await asyncio.sleep(self.latency_fn())
+        return True
+
+    def update(self, user_id: int, text: str) -> "telegram.Update":
+        """A private-chat text message from `user_id`, as PTB would hand it to on_message."""
+        user = telegram.User(id=user_id, first_name=f"user{user_id}", is_bot=False)
+        chat = telegram.Chat(id=user_id, type=telegram.Chat.PRIVATE)
+        message_id = next(self._message_ids)
+        message = telegram.Message(message_id, datetime.now(timezone.utc), chat, from_user=user, text=text)
+        message.set_bot(self)
+        return telegram.Update(message_id, message=message)
@@ -0,0 +1,229 @@
+"""
+Pluggable storage for the desert (`BOOKINGS`) and water (`WATER_BOOKINGS`) drafts.
+
+Both stores behave like the dicts they replace: `store[user_id]` returns the
+draft, which the tools mutate in place, and `store[user_id] = draft` saves it.
+
+- SessionBookingStore: the draft lives on the user's Session (src/sessions.py),
+  next to their history, so it is evicted, spilled and reset with it. Nothing
+  survives a restart unless the session spill is enabled. Used by default.
+- SQLiteBookingStore: write-through to one SQLite file in WAL mode, so drafts and
+  confirmed bookings survive restarts and can be shared by worker processes.
+  A per-process copy of each draft keeps in-place edits working; a version
+  column tells the store when another process has changed a row.
+  With BOOKING_STORE=sqlite it sits behind the session store, which still keeps
+  the current draft on the session.
+
+The tools wrap their bodies in `saves_draft`, which writes the draft back when
+the call returns, including on the early error returns that only mutate it.
+
+    BOOKING_STORE=sqlite BOOKING_DB_PATH=data/bookings.sqlite3
+"""
+import functools
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections.abc import MutableMapping
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
+
+from src.sessions import SESSIONS, SessionManager
+
+BOOKING_STORE = os.getenv("BOOKING_STORE", "memory").strip().lower()
+BOOKING_DB_PATH = os.getenv("BOOKING_DB_PATH", "data/bookings.sqlite3")
+
+Draft = Dict[str, Any]
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS bookings (
+    namespace TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    status TEXT,
+    data TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (namespace, user_id)
+);
+CREATE INDEX IF NOT EXISTS bookings_status ON bookings (namespace, status);
+"""
+_SELECT = "SELECT data, version FROM bookings WHERE namespace = ? AND user_id = ?"
+_VERSION = "SELECT version FROM bookings WHERE namespace = ? AND user_id = ?"
+_UPSERT = (
+    "INSERT INTO bookings (namespace, user_id, status, data, version, updated_at) VALUES (?, ?, ?, ?, 1, ?) "
+    "ON CONFLICT (namespace, user_id) DO UPDATE SET "
+    "status = excluded.status, data = excluded.data, version = version + 1, updated_at = excluded.updated_at "
+    "RETURNING version"
+)
+_DELETE = "DELETE FROM bookings WHERE namespace = ? AND user_id = ?"
+_KEYS = "SELECT user_id FROM bookings WHERE namespace = ?"
+_COUNT = "SELECT COUNT(*) FROM bookings WHERE namespace = ?"
+
+
+class BookingStore(MutableMapping):
+    """dict-like store of drafts keyed by user_id."""
+
+    namespace: str = ""
+
+    def flush(self, user_id: str) -> None:
+        """Persist in-place edits to `user_id`'s draft (no-op for in-memory stores)."""
+
+
+class SQLiteBookingStore(BookingStore):
+    """Write-through SQLite (WAL) store. Thread-safe; statements are compiled once and cached by sqlite3."""
+
+    def __init__(self, path: str, namespace: str):
+        self.path = path
+        self.namespace = namespace
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, cached_statements=64)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        self._conn.executescript(_SCHEMA)
+        # user_id -> (draft object handed to the tools, version it was read at, JSON last written)
+        self._cache: Dict[str, Tuple[Draft, int, str]] = {}
+
+    def _load(self, user_id: str) -> Optional[Draft]:
+        cached = self._cache.get(user_id)
+        if cached is not None:
+            row = self._conn.execute(_VERSION, (self.namespace, user_id)).fetchone()
+            if row is not None and row[0] == cached[1]:
+                return cached[0]
+        row = self._conn.execute(_SELECT, (self.namespace, user_id)).fetchone()
+        if row is None:
+            self._cache.pop(user_id, None)
+            return None
+        draft = json.loads(row[0])
+        self._cache[user_id] = (draft, row[1], row[0])
+        return draft
+
+    def _write(self, user_id: str, draft: Draft) -> None:
+        data = json.dumps(draft, separators=(",", ":"))
+        cached = self._cache.get(user_id)
+        if cached is not None and cached[0] is draft and cached[2] == data:
+            return  # nothing changed since the last write
+        version = self._conn.execute(
+            _UPSERT, (self.namespace, user_id, draft.get("status"), data, time.time())
+        ).fetchone()[0]
+        self._cache[user_id] = (draft, version, data)
+
+    def __getitem__(self, user_id: str) -> Draft:
+        with self._lock:
+            draft = self._load(user_id)
+        if draft is None:
+            raise KeyError(user_id)
+        return draft
+
+    def __setitem__(self, user_id: str, draft: Draft) -> None:
+        with self._lock:
+            self._write(user_id, draft)
+
+    def __delitem__(self, user_id: str) -> None:
+        with self._lock:
+            deleted = self._conn.execute(_DELETE, (self.namespace, user_id)).rowcount
+            self._cache.pop(user_id, None)
+        if not deleted:
+            raise KeyError(user_id)
+
+    def __contains__(self, user_id: object) -> bool:
+        with self._lock:
+            return self._load(str(user_id)) is not None
+
+    def __iter__(self) -> Iterator[str]:
+        with self._lock:
+            return iter([row[0] for row in self._conn.execute(_KEYS, (self.namespace,))])
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute(_COUNT, (self.namespace,)).fetchone()[0]
+
+    def flush(self, user_id: str) -> None:
+        with self._lock:
+            cached = self._cache.get(user_id)
+            if cached is not None:
+                self._write(user_id, cached[0])
+
+
+class SessionBookingStore(BookingStore):
+    """Drafts kept on each user's Session, optionally written through to a durable store."""
+
+    def __init__(self, namespace: str, durable: Optional[BookingStore] = None, sessions: SessionManager = SESSIONS):
+        self.namespace = namespace
+        self.slot = f"{namespace}_draft"  # Session.desert_draft / Session.water_draft
+        self.durable = durable
+        self.sessions = sessions
+        if durable is not None:
+            # Drafts are also in the database; a reset has to drop them there too
+            sessions.on_reset(lambda user_id: durable.pop(user_id, None))
+
+    def __getitem__(self, user_id: str) -> Draft:
+        session = self.sessions.find(user_id)
+        if self.durable is not None:
+            # The durable store returns the same object until another process changes the row
+            draft = self.durable.get(user_id)
+            if session is not None:
+                setattr(session, self.slot, draft)
+        else:
+            draft = getattr(session, self.slot) if session is not None else None
+        if draft is None:
+            raise KeyError(user_id)
+        return draft
+
+    def __setitem__(self, user_id: str, draft: Draft) -> None:
+        setattr(self.sessions.get(user_id), self.slot, draft)
+        if self.durable is not None:
+            self.durable[user_id] = draft
+
+    def __delitem__(self, user_id: str) -> None:
+        session = self.sessions.find(user_id)
+        found = session is not None and getattr(session, self.slot) is not None
+        if found:
+            setattr(session, self.slot, None)
+        if self.durable is not None:
+            found = self.durable.pop(user_id, None) is not None or found
+        if not found:
+            raise KeyError(user_id)
+
+    def __contains__(self, user_id: object) -> bool:
+        try:
+            self[str(user_id)]
+        except KeyError:
+            return False
+        return True
+
+    def __iter__(self) -> Iterator[str]:
+        if self.durable is not None:
+            return iter(self.durable)
+        return iter([uid for uid in self.sessions if getattr(self.sessions.peek(uid), self.slot, None) is not None])
+
+    def __len__(self) -> int:
+        if self.durable is not None:
+            return len(self.durable)
+        return sum(1 for _ in self)
+
+    def flush(self, user_id: str) -> None:
+        if self.durable is not None:
+            self.durable.flush(user_id)
+
+
+def make_booking_store(namespace: str, backend: str = BOOKING_STORE, path: str = BOOKING_DB_PATH) -> BookingStore:
+    if backend == "sqlite":
+        return SessionBookingStore(namespace, SQLiteBookingStore(path, namespace))
+    if backend == "memory":
+        return SessionBookingStore(namespace)
+    raise ValueError(f"Unknown BOOKING_STORE backend: {backend!r} (expected 'memory' or 'sqlite')")
+
+
+def saves_draft(store: BookingStore) -> Callable:
+    """Decorator for booking tools: write `user_id`'s draft back to `store` when the call returns."""
+    def decorator(fn: Callable) -> Callable:
+        @functools.wraps(fn)
+        def wrapper(user_id: str, *args, **kwargs):
+            try:
+                return fn(user_id, *args, **kwargs)
+            finally:
+                store.flush(user_id)
+        return wrapper
+    return decorator
@@ -1,7 +1,13 @@
 import os
 import re
 import sys
-from typing import Dict
+import html
+import json
+import time
+import asyncio
+import threading
+from contextlib import asynccontextmanager
+from typing import TYPE_CHECKING, Any, AsyncIterator, Dict, List, Optional, Tuple
 import telegram
 from time import sleep
 
@@ -13,18 +19,24 @@ from dotenv import load_dotenv
 from telegram import Update
 from telegram.ext import ApplicationBuilder, CommandHandler, MessageHandler, ContextTypes, filters
 
-from langchain_openai import ChatOpenAI
-from langchain.agents import AgentExecutor, create_openai_tools_agent
-from langchain.memory import ConversationBufferWindowMemory
+from langchain_core.callbacks import BaseCallbackHandler
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 
-from src.tools import desert_tools, has_active_desert_booking
+from src.tools import desert_tools, has_active_desert_booking, open_kb, warm_fixed_queries
 from src.water_tools import (
     water_tools,
     has_active_water_booking,
-    set_current_water_user_id,
+    open_water_kb,
     water_booking_update,
+    warm_fixed_water_queries,
 )
+from src import metrics, usage
+from src.embedding_cache import flush_embedding_cache
+from src.request_context import current_request, request_context
+from src.history import TokenBudgetMemory, count_tokens
+from src.sessions import SESSIONS, Session
+from src.streaming import ReplyStream
+from src.intent import IntentClassifier
 from src.prompts import (
     DESERT_SYSTEM_PROMPT,
     WATER_SYSTEM_PROMPT,
@@ -32,6 +44,10 @@ from src.prompts import (
     ROUTER_SYSTEM_PROMPT,
 )
 
+if TYPE_CHECKING:
+    from langchain.agents import AgentExecutor
+    from langchain_core.language_models import BaseChatModel
+
 # ----------------------------
 # Load env
 # ----------------------------
@@ -39,7 +55,27 @@ load_dotenv(dotenv_path=os.path.join(os.getcwd(), ".env"))
 
 TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
 CHAT_MODEL = os.getenv("CHAT_MODEL", "gpt-4.1-mini")
+# Any OpenAI-compatible endpoint, e.g. the local stub server in benchmarks/openai_stub_server.py
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL") or None
+# Per-request timeout (unset: the client's default) and retries on 429/5xx/connection errors
+OPENAI_TIMEOUT_S = float(os.getenv("OPENAI_TIMEOUT_S", "0")) or None
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "2"))
 TZ = os.getenv("TZ", "Asia/Dubai")
+# Updates PTB may have in flight at once (includes ones queued behind the same user's lock)
+MAX_CONCURRENT_UPDATES = int(os.getenv("MAX_CONCURRENT_UPDATES", "256"))
+# Turns allowed to run routing/agents at once across all users
+MAX_CONCURRENT_TURNS = int(os.getenv("MAX_CONCURRENT_TURNS", "32"))
+# Local intent classifier: below this confidence route_agent falls back to the LLM router
+INTENT_MODEL_PATH = os.getenv("INTENT_MODEL_PATH", "data/intent/model.json")
+INTENT_CONFIDENCE_THRESHOLD = float(os.getenv("INTENT_CONFIDENCE_THRESHOLD", "0.9"))
+# Optional JSONL log of LLM router decisions, used as training data for src/intent.py
+ROUTER_LOG_PATH = os.getenv("ROUTER_LOG_PATH")
+# Upper bound on the rolling [BOOKING_CONTEXT] summary
+SUMMARY_MAX_TOKENS = int(os.getenv("SUMMARY_MAX_TOKENS", "200"))
+# Telegram user ids allowed to use /stats (comma-separated)
+ADMIN_USER_IDS = {uid.strip() for uid in os.getenv("ADMIN_USER_IDS", "").split(",") if uid.strip()}
+# One "usage" line per turn on stdout (tokens and cost, see src/usage.py)
+USAGE_LOG = os.getenv("USAGE_LOG", "1") == "1"
 
 if not TELEGRAM_BOT_TOKEN:
     raise ValueError("Missing TELEGRAM_BOT_TOKEN in .env")
@@ -47,7 +83,14 @@ if not TELEGRAM_BOT_TOKEN:
 # ----------------------------
 # LLM + Agent + Memory
 # ----------------------------
-llm = ChatOpenAI(model=CHAT_MODEL, temperature=0)
+# The OpenAI client and the agents are built on first use (or by warmup()): importing
+# langchain_openai and langchain.agents alone costs about a second, which CLIs, tests and
+# workers that never call the LLM shouldn't pay. Assign `llm` before first use to swap it.
+llm: Optional["BaseChatModel"] = None
+_executors: Dict[str, "AgentExecutor"] = {}
+# (route, METRICS_ENABLED) -> usage and timing handlers; built once, they serve every concurrent call
+_agent_callbacks: Dict[Tuple[str, bool], List[BaseCallbackHandler]] = {}
+_init_lock = threading.RLock()
 
 desert_tool_list = desert_tools()
 water_tool_list = water_tools()
@@ -77,57 +120,162 @@ router_prompt = ChatPromptTemplate.from_messages([
     ("human", "last_agent={last_agent}\nuser_message={input}"),
 ])
 
-desert_agent = create_openai_tools_agent(llm, desert_tool_list, desert_prompt)
-water_agent = create_openai_tools_agent(llm, water_tool_list, water_prompt)
-
-# NOTE: This memory is global.
-# For production, you should make one memory per user.
-memory_store: Dict[str, ConversationBufferWindowMemory] = {}  # key -> memory object
-router_state: Dict[str, str] = {}  # user_id -> last_agent
-summary_store: Dict[str, str] = {}  # user_id -> accumulated summaries
-message_counter: Dict[str, int] = {}  # user_id -> messages since last summary
-
-def get_memory(user_id: str, agent_key: str) -> ConversationBufferWindowMemory:
-    key = user_id
-    if key not in memory_store:
-        memory_store[key] = ConversationBufferWindowMemory(
-            k=20,  # keep last 20 turns 
-            return_messages=True,
-            memory_key="chat_history"
-        )
-    return memory_store[key]
-
-def make_desert_executor(user_id: str) -> AgentExecutor:
-    mem = get_memory(user_id, "desert")
-    return AgentExecutor(
-        agent=desert_agent,
-        tools=desert_tool_list,
-        memory=mem,
-        verbose=False,
-        handle_parsing_errors=True,
-        max_iterations=12,
-        early_stopping_method="force"
-    )
+def get_llm() -> "BaseChatModel":
+    global llm
+    if llm is None:
+        with _init_lock:
+            if llm is None:
+                from langchain_openai import ChatOpenAI
+
+                # The agents always stream; without stream_usage those calls report no tokens
+                llm = ChatOpenAI(
+                    model=CHAT_MODEL,
+                    temperature=0,
+                    stream_usage=True,
+                    base_url=OPENAI_BASE_URL,
+                    timeout=OPENAI_TIMEOUT_S,
+                    max_retries=OPENAI_MAX_RETRIES,
+                )
+    return llm
+
+def _load_intent_classifier() -> Optional[IntentClassifier]:
+    if not os.path.exists(INTENT_MODEL_PATH):
+        return None
+    try:
+        return IntentClassifier.load(INTENT_MODEL_PATH)
+    except Exception:
+        return None  # A broken model file should only cost us the LLM router call
 
-def make_water_executor(user_id: str) -> AgentExecutor:
-    mem = get_memory(user_id, "water")
-    return AgentExecutor(
-        agent=water_agent,
-        tools=water_tool_list,
-        memory=mem,
-        verbose=True,
-        handle_parsing_errors=True,
-        max_iterations=12,
-        early_stopping_method="force"
-    )
+intent_classifier = _load_intent_classifier()
 
-def run_general_agent(user_id: str, user_text: str) -> str:
-    mem = get_memory(user_id, "general")
+# Per-user memory, last agent, summary, message counter and booking drafts; idle users
+# are evicted (and optionally spilled to disk) per SESSION_TTL_S / SESSION_MAX_RESIDENT.
+sessions = SESSIONS
+
+class _UserLocks:
+    """Keyed asyncio locks: one user's updates run one at a time, in arrival order."""
+
+    def __init__(self) -> None:
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._holders: Dict[str, int] = {}  # user_id -> tasks holding or waiting on the lock
+
+    @asynccontextmanager
+    async def hold(self, user_id: str) -> AsyncIterator[None]:
+        lock = self._locks.get(user_id)
+        if lock is None:
+            lock = self._locks[user_id] = asyncio.Lock()
+        self._holders[user_id] = self._holders.get(user_id, 0) + 1
+        try:
+            async with lock:
+                yield
+        finally:
+            self._holders[user_id] -= 1
+            if not self._holders[user_id]:
+                # Nobody else queued for this user; drop the lock so idle users cost nothing
+                del self._holders[user_id]
+                del self._locks[user_id]
+
+    def __len__(self) -> int:
+        return len(self._locks)
+
+_user_locks = _UserLocks()
+# user_id -> background summary task (see _schedule_summary)
+_summary_tasks: Dict[str, "asyncio.Task[None]"] = {}
+# Acquired *after* the user lock, so a user spamming messages queues on their own lock
+# instead of tying up slots other users could run in.
+_turn_slots = asyncio.Semaphore(MAX_CONCURRENT_TURNS)
+
+def get_memory(session: Session, agent_key: str) -> TokenBudgetMemory:
+    # The newest turns within this route's HISTORY_TOKEN_BUDGET_* (see src/history.py)
+    return session.get_memory().use_route(agent_key)
+
+# route -> (tools, prompt, verbose)
+_AGENT_SPECS = {
+    "desert": (desert_tool_list, desert_prompt, False),
+    "water": (water_tool_list, water_prompt, True),
+}
+
+def get_executor(agent_key: str) -> "AgentExecutor":
+    """The shared tool-agent executor for desert/water, built with get_llm() on first use."""
+    executor = _executors.get(agent_key)
+    if executor is None:
+        with _init_lock:
+            executor = _executors.get(agent_key)
+            if executor is None:
+                from langchain.agents import AgentExecutor, create_openai_tools_agent
+
+                tools, prompt, verbose = _AGENT_SPECS[agent_key]
+                # No memory here: executors are shared by all users, history is passed per call by run_agent
+                executor = _executors[agent_key] = AgentExecutor(
+                    agent=create_openai_tools_agent(get_llm(), tools, prompt),
+                    tools=tools,
+                    verbose=verbose,
+                    handle_parsing_errors=True,
+                    max_iterations=12,
+                    early_stopping_method="force"
+                )
+    return executor
+
+def warmup() -> None:
+    """Build the LLM client and both agents, and open both knowledge bases, before the first turn."""
+    get_llm()
+    for agent_key in _AGENT_SPECS:
+        get_executor(agent_key)
+    open_kb()
+    open_water_kb()
+
+def _config(callbacks: Optional[List[BaseCallbackHandler]]) -> Optional[Dict[str, Any]]:
+    return {"callbacks": callbacks} if callbacks else None
+
+def agent_callbacks(route: str, extra: Optional[List[BaseCallbackHandler]] = None) -> List[BaseCallbackHandler]:
+    """`extra` plus the route's usage handler and, with METRICS_ENABLED, its AgentMetrics timings.
+
+    Every handler LangChain dispatches to costs on each event of the run tree (~0.1-0.3 ms per agent turn with
+    the fake model of benchmarks/bench_executor_overhead.py), so the timings are only attached when enabled.
+    """
+    key = (route, metrics.METRICS_ENABLED)
+    handlers = _agent_callbacks.get(key)
+    if handlers is None:
+        timings = [metrics.AgentMetrics(route)] if metrics.METRICS_ENABLED else []
+        handlers = _agent_callbacks[key] = [*usage.callbacks(), *timings]
+    return [*extra, *handlers] if extra else handlers
+
+async def run_agent(
+    session: Session,
+    agent_key: str,
+    agent_input: str,
+    callbacks: Optional[List[BaseCallbackHandler]] = None,
+) -> Dict[str, Any]:
+    """One tool-agent turn with the user's history, saved back to their memory on success."""
+    mem = get_memory(session, agent_key)
+    history = mem.load_memory_variables({})["chat_history"]
+    executor = get_executor(agent_key)
+    config = _config(agent_callbacks(agent_key, callbacks))
+    with usage.route(agent_key), metrics.span("agent", route=agent_key), metrics.agent_run(agent_key):
+        result = await executor.ainvoke({"input": agent_input, "chat_history": history}, config=config)
+    mem.save_context({"input": agent_input}, {"output": result.get("output") or ""})
+    return result
+
+async def run_general_agent(
+    session: Session,
+    user_text: str,
+    callbacks: Optional[List[BaseCallbackHandler]] = None,
+) -> str:
+    mem = get_memory(session, "general")
     history = mem.load_memory_variables({}).get("chat_history", [])
     messages = general_prompt.format_messages(input=user_text, chat_history=history)
-    response = llm.invoke(messages)
-    mem.save_context({"input": user_text}, {"output": response.content})
-    return (response.content or "").strip()
+    config = _config(agent_callbacks("general", callbacks))
+    with usage.route("general"), metrics.span("agent", route="general"):
+        if callbacks:
+            # Streamed so the callbacks see the answer as it arrives; chunk handling isn't free, so only then
+            content = ""
+            async for chunk in get_llm().astream(messages, config=config):
+                content += chunk.content if isinstance(chunk.content, str) else ""
+        else:
+            response = await get_llm().ainvoke(messages, config=config)
+            content = response.content or ""
+    mem.save_context({"input": user_text}, {"output": content})
+    return content.strip()
 
 _DESERT_KEYWORDS = re.compile(r"\b(desert|buggy|quad|safari|dune|camp)\b", re.IGNORECASE)
 _WATER_KEYWORDS = re.compile(
@@ -210,78 +358,128 @@ def _extract_payment_method(text: str) -> str | None:
         return "cryptocurrency"
     return None
 
-def _get_last_agent(user_id: str) -> str:
-    return router_state.get(user_id, "general")
+def _get_last_agent(session: Session) -> str:
+    return session.last_agent or "general"
 
-def _set_last_agent(user_id: str, agent_key: str) -> None:
-    router_state[user_id] = agent_key
+def _set_last_agent(session: Session, agent_key: str) -> None:
+    session.last_agent = agent_key
 
-def _increment_message_count(user_id: str) -> int:
+def _increment_message_count(session: Session) -> int:
     """Increment and return message count for user."""
-    current = message_counter.get(user_id, 0)
-    message_counter[user_id] = current + 1
-    return message_counter[user_id]
+    session.message_count = (session.message_count or 0) + 1
+    return session.message_count
 
-def _get_accumulated_summary(user_id: str) -> str:
+def _get_accumulated_summary(session: Session) -> str:
     """Get accumulated summaries for user."""
-    return summary_store.get(user_id, "")
+    return session.summary or ""
 
-def _reset_summary(user_id: str) -> None:
+def _reset_summary(session: Session) -> None:
     """Reset summary counter and store after booking confirmed."""
-    message_counter[user_id] = 0
-    if user_id in summary_store:
-        del summary_store[user_id]
+    session.message_count = 0
+    session.summary = None
 
-def _generate_summary(user_id: str) -> None:
-    """Generate summary of last 20 messages and accumulate."""
-    mem = get_memory(user_id, "summary")
-    history = mem.load_memory_variables({}).get("chat_history", [])
+def reset_session(user_id: str) -> Session:
+    """Forget everything about the user (history, agent, summary, counters, drafts) at once."""
+    return sessions.reset(user_id)
+
+def _cap_summary(text: str) -> str:
+    """Keep the leading sentences that fit SUMMARY_MAX_TOKENS, so [BOOKING_CONTEXT] stays a fixed size."""
+    if count_tokens(text) <= SUMMARY_MAX_TOKENS:
+        return text
+    kept = []
+    for sentence in re.split(r"(?<=[.!?])\s+|\n+", text):
+        if count_tokens(" ".join(kept + [sentence])) > SUMMARY_MAX_TOKENS:
+            break
+        kept.append(sentence)
+    # A single overlong sentence still gets cut rather than dropped
+    return " ".join(kept) if kept else text[:SUMMARY_MAX_TOKENS * 4]
+
+async def _generate_summary(session: Session) -> bool:
+    """Fold the turns that fell out of the history budget into the session summary."""
+    if session.memory is None:
+        return False
+    folded = session.memory.pop_folded()
     
-    if not history:
-        return
+    if not folded:
+        return False
     
-    # Build conversation text from last ~20 messages
+    # Only the newly folded turns; everything older is already in the summary
     text_parts = []
-    for msg in history[-20:]:
+    for msg in folded:
         role = getattr(msg, "type", "unknown")
         content = getattr(msg, "content", "")
         if content:
             text_parts.append(f"{role}: {content}")
     
     if not text_parts:
-        return
+        return False
     
     conversation_text = "\n".join(text_parts)
+    previous = session.summary or "(none yet)"
     
-    # Quick summary prompt to extract booking context
-    summary_prompt = f"""Summarize the key booking details from this conversation. 
+    # Update the previous summary instead of appending a new one
+    summary_prompt = f"""Update the booking summary with the new messages below.
 Preserve: activity type, vehicle/package name, duration, date/time, price, discount, any booking stages reached.
-Keep it concise (2-3 sentences):
+Keep every detail from the current summary that the new messages don't change; replace details they do change.
+Return only the updated summary, at most {SUMMARY_MAX_TOKENS // 2} words.
+
+CURRENT SUMMARY:
+{previous}
 
+NEW MESSAGES:
 {conversation_text}
 
-SUMMARY:"""
+UPDATED SUMMARY:"""
     
     try:
-        response = llm.invoke([("human", summary_prompt)])
+        # Runs after the reply went out: counted for the route and user, not in the turn's log line
+        with metrics.span("summary"), usage.route("summary", per_turn=False):
+            response = await get_llm().ainvoke([("human", summary_prompt)], config=_config(usage.callbacks()))
         summary_text = (response.content or "").strip()
-        
-        # Accumulate with previous summary
-        if user_id in summary_store:
-            summary_store[user_id] += f"\n{summary_text}"
-        else:
-            summary_store[user_id] = summary_text
+        if summary_text:
+            session.summary = _cap_summary(summary_text)
+        session.message_count = 0  # Reset counter after summary
+        return True
     except Exception:
-        pass  # If summary fails, don't break the flow
+        return False  # If summary fails, don't break the flow
 
-def _format_agent_input_with_summary(user_id: str, user_text: str) -> str:
+async def _summarize_in_background(session: Session) -> None:
+    # Pin the session so eviction can't drop it (and the new summary) while the LLM call runs
+    with sessions.hold(session.user_id):
+        try:
+            # Turns folded while the LLM call ran are picked up here, not left for the next message
+            while await _generate_summary(session):
+                pass
+        finally:
+            _summary_tasks.pop(session.user_id, None)
+
+def _schedule_summary(session: Session) -> None:
+    """Summarize folded turns after the reply has gone out; at most one task per user."""
+    if session.memory is None or not session.memory.has_folded() or session.user_id in _summary_tasks:
+        return  # a running task picks up newer folded turns before it exits
+    _summary_tasks[session.user_id] = asyncio.get_running_loop().create_task(_summarize_in_background(session))
+
+async def drain_summaries() -> None:
+    """Wait for in-flight background summaries (shutdown, tests)."""
+    while _summary_tasks:
+        await asyncio.gather(*list(_summary_tasks.values()), return_exceptions=True)
+
+def _format_agent_input_with_summary(session: Session, user_text: str) -> str:
     """Format agent input with booking context if available."""
-    acc_summary = _get_accumulated_summary(user_id)
+    user_id = session.user_id
+    acc_summary = _get_accumulated_summary(session)
     if acc_summary:
         return f"[BOOKING_CONTEXT]\n{acc_summary}\n[/BOOKING_CONTEXT]\n\n[user_id={user_id}] {user_text}"
     return f"[user_id={user_id}] {user_text}"
 
-def route_agent(user_id: str, user_text: str) -> str:
+async def route_agent(session: Session, user_text: str) -> str:
+    with metrics.span("route") as labels:
+        route, labels["method"] = await _route_agent(session, user_text)
+    return route
+
+async def _route_agent(session: Session, user_text: str) -> Tuple[str, str]:
+    """(route, how it was decided: keyword / classifier / llm)."""
+    user_id = session.user_id
     water_match = _WATER_KEYWORDS.search(user_text)
     desert_match = _DESERT_KEYWORDS.search(user_text)
     
@@ -290,36 +488,55 @@ def route_agent(user_id: str, user_text: str) -> str:
     has_active_desert = has_active_desert_booking(user_id)
     
     if water_match and desert_match:
-        return "clarify"
+        return "clarify", "keyword"
     
     # If user is trying to switch to a different activity type while one is active, reject it
     if water_match and has_active_desert:
-        return "block_mixed"
+        return "block_mixed", "keyword"
     if desert_match and has_active_water:
-        return "block_mixed"
+        return "block_mixed", "keyword"
     
     if water_match:
-        return "water"
+        return "water", "keyword"
     if desert_match:
-        return "desert"
+        return "desert", "keyword"
 
     if has_active_water:
-        return "water"
+        return "water", "keyword"
     if has_active_desert:
-        return "desert"
+        return "desert", "keyword"
 
-    last_agent = _get_last_agent(user_id)
+    last_agent = _get_last_agent(session)
     if last_agent in {"desert", "water"}:
         if _FOLLOWUP_KEYWORDS.search(user_text.strip()):
-            return last_agent
+            return last_agent, "keyword"
         if _TIME_OR_DATE_RE.search(user_text) or _is_short_followup(user_text):
-            return last_agent
+            return last_agent, "keyword"
+
+    if intent_classifier is not None:
+        label, confidence = intent_classifier.predict(user_text, last_agent)
+        if confidence >= INTENT_CONFIDENCE_THRESHOLD:
+            return label, "classifier"
 
     messages = router_prompt.format_messages(input=user_text, last_agent=last_agent)
-    response = llm.invoke(messages)
+    with usage.route("router"):
+        response = await get_llm().ainvoke(messages, config=_config(usage.callbacks()))
     route_text = (response.content or "").strip().lower()
     match = re.search(r"\b(desert|water|general|clarify)\b", route_text)
-    return match.group(1) if match else "general"
+    route = match.group(1) if match else "general"
+    _log_router_decision(user_text, last_agent, route)
+    return route, "llm"
+
+def _log_router_decision(user_text: str, last_agent: str, route: str) -> None:
+    """Append an LLM router decision to ROUTER_LOG_PATH as intent-classifier training data."""
+    if not ROUTER_LOG_PATH:
+        return
+    try:
+        os.makedirs(os.path.dirname(ROUTER_LOG_PATH) or ".", exist_ok=True)
+        with open(ROUTER_LOG_PATH, "a", encoding="utf-8") as f:
+            f.write(json.dumps({"text": user_text, "last_agent": last_agent, "label": route, "source": "llm_router"}) + "\n")
+    except OSError:
+        pass  # Logging must never break routing
 
 def _enforce_single_question(reply: str) -> str:
     lower = reply.lower()
@@ -335,6 +552,18 @@ def _enforce_single_question(reply: str) -> str:
     first_idx = reply.find("?")
     return reply[:first_idx + 1].strip()
 
+def _preview_reply(text: str, price_inquiry: bool = False) -> str:
+    """The part of a partial agent answer that is safe to show before the filters see all of it."""
+    q_idx = text.find("?")
+    if q_idx != -1:
+        # _enforce_single_question may cut anything after the first question
+        text = text[:q_idx + 1]
+    if price_inquiry:
+        # _strip_payment_questions drops whole sentences: only show finished ones
+        end = max(text.rfind(mark) for mark in ".!?\n")
+        text = _strip_payment_questions(text[:end + 1]) if end != -1 else ""
+    return text.strip()
+
 def _strip_payment_questions(reply: str) -> str:
     lines = [line.strip() for line in reply.splitlines() if line.strip()]
     filtered = []
@@ -382,32 +611,51 @@ async def help_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "You can ask about desert activities (Safari, Quad, Buggy) or water activities (Jet Ski, Flyboard, Jet Car), plus pricing, pickup, location, rules, or say you want to book and I will guide you."
     )
 
+async def stats_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Token usage and cost since start, per route and for the most expensive users, and the cache and
+    session counters exported to metrics (admins only)."""
+    if str(update.effective_user.id) not in ADMIN_USER_IDS:
+        return
+    report = usage.format_report(usage.LEDGER.snapshot(top_users=5))
+    text = f"Usage since start:\n<pre>{html.escape(report)}</pre>"
+    collected = await asyncio.to_thread(metrics.format_collected)  # the spilled-session count is a SQLite query
+    if collected:
+        text += f"\nCounters:\n<pre>{html.escape(collected)}</pre>"
+    await update.message.reply_text(text, parse_mode="HTML")
+
 def extract_user_text(update: Update) -> str:
     return (update.message.text or "").strip()
 
 async def on_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    # Per-user ordering protects BOOKINGS/WATER_BOOKINGS drafts, memory and counters
+    # from two rapid messages racing; different users still run in parallel.
     user_id = str(update.effective_user.id)
-    user_text = extract_user_text(update)
-
+    # Opened before queueing so RequestContext.started (reply TTFB) includes the wait
+    with request_context(user_id) as ctx:
+        async with _user_locks.hold(user_id):
+            async with _turn_slots:
+                metrics.observe("queue_wait", time.monotonic() - ctx.started)
+                with sessions.hold(user_id) as session, metrics.span("turn"), usage.turn() as spent:
+                    await _handle_message(update, context, session)
+    if USAGE_LOG and (spent.llm_calls or spent.embedding_tokens):
+        print(f"💰 usage user={user_id} trace={ctx.trace_id[:8]}: {spent}")
+
+async def _precheck(session: Session, user_text: str) -> Optional[str]:
+    """Canned reply for messages that never need routing or an agent, else None."""
+    user_id = session.user_id
     if not user_text:
-        await update.message.reply_text("I didn’t catch that. Please type your message.")
-        return
+        return "I didn’t catch that. Please type your message."
     if _WATER_KEYWORDS.search(user_text) and _DESERT_KEYWORDS.search(user_text):
-        await update.message.reply_text(
-            "We can’t combine desert and water activities in one booking. Please choose one to book first."
-        )
-        return
+        return "We can’t combine desert and water activities in one booking. Please choose one to book first."
     payment_method = _extract_payment_method(user_text)
     if payment_method and has_active_water_booking(user_id):
         try:
-            water_booking_update(user_id=user_id, payment_method=payment_method)
+            # ainvoke runs the sync tool in an executor: with BOOKING_STORE=sqlite it writes to disk
+            await water_booking_update.ainvoke({"user_id": user_id, "payment_method": payment_method})
         except Exception:
             pass
     # Increment message counter and check if we should generate summary
-    msg_count = _increment_message_count(user_id)
-    if msg_count % 20 == 0:
-        _generate_summary(user_id)
-        message_counter[user_id] = 0  # Reset counter after summary
+    _increment_message_count(session)
     if _wants_both_packages(user_text):
         # Check if there's an active booking
         has_desert = has_active_desert_booking(user_id)
@@ -416,29 +664,39 @@ async def on_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
         if has_desert or has_water:
             # One booking is already in progress, complete it first
             if has_desert:
-                reply = "You have an active desert booking in progress. Please complete it first (confirm or cancel), then you can start a water activity booking separately."
-            else:
-                reply = "You have an active water booking in progress. Please complete it first (confirm or cancel), then you can start a desert activity booking separately."
-        else:
-            # No active bookings, but user wants both - ask them to choose one first
-            reply = "Great! We offer both desert activities (Buggy, Quad, Safari) and water activities (Jet Ski, Flyboard, Jet Car). " \
-                    "However, we process them as separate bookings. " \
-                    "Which would you like to book first: a desert activity or a water activity? " \
-                    "Once you complete the first booking, you can start another one."
-        
-        await update.message.reply_text(reply)
-        return
+                return "You have an active desert booking in progress. Please complete it first (confirm or cancel), then you can start a water activity booking separately."
+            return "You have an active water booking in progress. Please complete it first (confirm or cancel), then you can start a desert activity booking separately."
+        # No active bookings, but user wants both - ask them to choose one first
+        return "Great! We offer both desert activities (Buggy, Quad, Safari) and water activities (Jet Ski, Flyboard, Jet Car). " \
+               "However, we process them as separate bookings. " \
+               "Which would you like to book first: a desert activity or a water activity? " \
+               "Once you complete the first booking, you can start another one."
 
     if _ALL_PACKAGES_RE.search(user_text.lower()):
         lower = user_text.lower()
         if "water" not in lower and "desert" not in lower:
-            reply = "Do you want desert packages, water packages, or both?"
-            await update.message.reply_text(reply)
-            return
+            return "Do you want desert packages, water packages, or both?"
+    return None
 
-    route = route_agent(user_id, user_text)
+async def _handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE, session: Session):
+    user_id = session.user_id
+    user_text = extract_user_text(update)
 
+    with metrics.span("prechecks"):
+        early_reply = await _precheck(session, user_text)
+    if early_reply is not None:
+        with metrics.span("telegram_send", op="reply"):
+            await update.message.reply_text(early_reply)
+        return
+
+    # Placeholder first; it is edited as the answer streams in (see src/streaming.py)
+    ctx = current_request()
+    stream = ReplyStream(update.message, ctx.started if ctx else None)
+    await stream.open()
+
+    # Everything after the placeholder is inside the try, so it always ends in stream.finish()
     try:
+        route = await route_agent(session, user_text)
         if route == "block_mixed":
             # User is trying to book a different activity type while one is active
             has_active_water = has_active_water_booking(user_id)
@@ -447,16 +705,15 @@ async def on_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 reply = "You have an active water booking in progress. Please complete it first (confirm or cancel), then you can start a desert activity booking separately."
             else:
                 reply = "You have an active desert booking in progress. Please complete it first (confirm or cancel), then you can start a water activity booking separately."
-            await update.message.reply_text(reply)
+            await stream.finish(reply)
             return
         
         if route == "desert":
             # Pass user_id inline so the agent can use it when calling booking tools
-            agent_input = _format_agent_input_with_summary(user_id, user_text)
-            executor = make_desert_executor(user_id)
-            result = executor.invoke({"input": agent_input})
+            agent_input = _format_agent_input_with_summary(session, user_text)
+            result = await run_agent(session, "desert", agent_input, stream.tokens(_preview_reply))
             reply = _enforce_single_question((result.get("output") or "").strip())
-            _set_last_agent(user_id, "desert")
+            _set_last_agent(session, "desert")
         elif route == "water":
             hinted_text = user_text
             if _is_price_inquiry(user_text):
@@ -473,34 +730,71 @@ async def on_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
                         hints.append(f"use base duration {base_duration} minutes")
                 if hints:
                     hinted_text = f"{user_text} ({'; '.join(hints)})"
-            agent_input = _format_agent_input_with_summary(user_id, hinted_text)
-            set_current_water_user_id(user_id)
-            executor = make_water_executor(user_id)
-            result = executor.invoke({"input": agent_input})
+            agent_input = _format_agent_input_with_summary(session, hinted_text)
+            price_inquiry = _is_price_inquiry(user_text)
+            callbacks = stream.tokens(lambda text: _preview_reply(text, price_inquiry))
+            result = await run_agent(session, "water", agent_input, callbacks)
             reply = _enforce_single_question((result.get("output") or "").strip())
-            if _is_price_inquiry(user_text):
+            if price_inquiry:
                 reply = _strip_payment_questions(reply)
-            _set_last_agent(user_id, "water")
+            _set_last_agent(session, "water")
         elif route == "clarify":
-            reply = run_general_agent(user_id, user_text)
+            reply = await run_general_agent(session, user_text, stream.tokens())
         else:
-            reply = run_general_agent(user_id, user_text)
+            reply = await run_general_agent(session, user_text, stream.tokens())
 
         if not reply:
             reply = "Sorry — I couldn’t generate a response. Try again."
     except Exception as e:
         reply = f"Sorry, something went wrong: {e}"
 
-    await update.message.reply_text(reply)
+    await stream.finish(reply)
+    # Turns that no longer fit the history budget are folded into the summary, off the reply path
+    _schedule_summary(session)
 
 # ----------------------------
 # Main
 # ----------------------------
+_metrics_dump: Optional["asyncio.Task[None]"] = None
+
+async def _post_init(app) -> None:
+    global _metrics_dump
+    # Precompute the fixed-query KB results before the first update arrives
+    try:
+        await asyncio.gather(warm_fixed_queries(), warm_fixed_water_queries())
+    except Exception as e:
+        print(f"⚠️  KB warmup failed, falling back to first use: {e}")
+    if metrics.METRICS_DUMP_PATH:
+        _metrics_dump = asyncio.create_task(
+            metrics.dump_periodically(metrics.METRICS_DUMP_PATH, metrics.METRICS_DUMP_INTERVAL_S)
+        )
+
+async def _post_shutdown(app) -> None:
+    # Let summaries of the last turns finish so they aren't lost on restart
+    await drain_summaries()
+    if _metrics_dump is not None:
+        _metrics_dump.cancel()  # writes a last snapshot on the way out
+        await asyncio.gather(_metrics_dump, return_exceptions=True)
+    flush_embedding_cache()  # pending last_used updates, so LRU trimming sees this run's hits
+
 def main():
-    app = ApplicationBuilder().token(TELEGRAM_BOT_TOKEN).build()
+    # Pay for the OpenAI client, agents and Chroma now rather than on the first user's turn
+    warmup()
+    if metrics.METRICS_PORT:
+        metrics.start_http_server(metrics.METRICS_PORT)
+        print(f"📈 Metrics on {metrics.METRICS_HOST}:{metrics.METRICS_PORT}/metrics")
+    app = (
+        ApplicationBuilder()
+        .token(TELEGRAM_BOT_TOKEN)
+        .concurrent_updates(MAX_CONCURRENT_UPDATES)
+        .post_init(_post_init)
+        .post_shutdown(_post_shutdown)
+        .build()
+    )
 
     app.add_handler(CommandHandler("start", start))
     app.add_handler(CommandHandler("help", help_cmd))
+    app.add_handler(CommandHandler("stats", stats_cmd))
     app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, on_message))
 
     print("✅ Bot is running (polling)...")
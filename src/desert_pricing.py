@@ -0,0 +1,219 @@
+"""
+Deterministic desert pricing from the package tables in the Desert KB DOCX.
+
+`src/ingest.py` extracts the Buggy and Quad models x durations, the Safari
+shared (per passenger) / private (per car) packages and the pickup fee into
+data/desert_pricing.json. `quote()` prices a whole draft, mixed `items`
+included, plus pickup and card VAT, so booking_compute_price never has to fall
+back to the KB.
+
+    python -m src.desert_pricing extract "data/docs/Desert JetSet Knowledge Base.docx"
+"""
+import argparse
+import json
+import os
+import re
+import sys
+from typing import Any, Dict, List, Optional, Tuple
+
+# Allow running as a script: `python src/desert_pricing.py`
+if __package__ is None and __name__ == "__main__":
+    sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+DESERT_PRICING_PATH = os.getenv("DESERT_PRICING_PATH", os.path.join("data", "desert_pricing.json"))
+CARD_VAT_RATE = 0.05
+
+
+class PricingError(ValueError):
+    """Raised when a draft can't be priced from the catalog (unknown model, bad duration, ...)."""
+
+
+# ----------------------------
+# Extraction (ingest time)
+# ----------------------------
+_SECTION_RE = re.compile(r"^(Desert Safari|Buggy|Quad Bike) tour\s*:$", re.I)
+_SAFARI_PACKAGE_RE = re.compile(r"^(Shared|Private) Tour\s*:$", re.I)
+_SAFARI_PRICE_RE = re.compile(r"^(\d+)\s*AED per 1 (?:private )?(passenger|car)$", re.I)
+_VEHICLE_PRICE_RE = re.compile(r"^(\d+)\s*AED per 1 (?:Buggy|Quad) for (\d+)\s*minutes$", re.I)
+_PICKUP_FEE_RE = re.compile(r"pay\s+(\d+)\s*AED extra", re.I)
+_SECTION_KEYS = {"desert safari": "safari", "buggy": "buggy", "quad bike": "quad"}
+
+
+def extract_catalog(raw_text: str, source: str = "") -> Dict[str, Any]:
+    """Parse the 'Available packages' paragraphs of the desert KB into a catalog."""
+    catalog: Dict[str, Any] = {"source": source, "currency": "AED", "safari": {}, "buggy": {}, "quad": {}}
+    section: Optional[str] = None
+    current: Optional[str] = None
+    for line in (l.strip() for l in raw_text.splitlines()):
+        if not line:
+            continue
+        if line.lower().startswith("frequently asked questions"):
+            section = None
+            continue
+        match = _SECTION_RE.match(line)
+        if match:
+            section, current = _SECTION_KEYS[match.group(1).lower()], None
+            continue
+        if section is None or line.lower().endswith("type :") or line.lower().endswith("type:"):
+            continue
+        if section == "safari":
+            match = _SAFARI_PACKAGE_RE.match(line)
+            if match:
+                current = match.group(1).lower()
+                continue
+            match = _SAFARI_PRICE_RE.match(line)
+            if match and current:
+                catalog["safari"][current] = {"price": int(match.group(1)), "per": match.group(2).lower()}
+            continue
+        if line.endswith(":"):
+            current = line[:-1].strip().lower()
+            catalog[section][current] = {}
+            continue
+        match = _VEHICLE_PRICE_RE.match(line)
+        if match and current:
+            catalog[section][current][match.group(2)] = int(match.group(1))
+
+    fee = _PICKUP_FEE_RE.search(raw_text)
+    catalog["pickup_fee"] = int(fee.group(1)) if fee else None
+    missing = [k for k in ("safari", "buggy", "quad", "pickup_fee") if not catalog.get(k)]
+    if missing:
+        raise PricingError(f"Could not find price tables for: {', '.join(missing)}")
+    return catalog
+
+
+def save_catalog(catalog: Dict[str, Any], path: str = DESERT_PRICING_PATH) -> None:
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(catalog, f, indent=2, ensure_ascii=False)
+        f.write("\n")
+    os.replace(tmp_path, path)
+
+
+_catalog: Optional[Dict[str, Any]] = None
+_catalog_key: Optional[Tuple[str, int]] = None  # (path, mtime) _catalog was read at
+
+
+def load_catalog(path: str = DESERT_PRICING_PATH) -> Dict[str, Any]:
+    """The desert catalog, re-read when a re-ingest replaces the file. Raises FileNotFoundError if ingest never wrote it."""
+    global _catalog, _catalog_key
+    # One stat per quote, as LiveCollection does for the KB manifest; save_catalog swaps the file atomically
+    key = (path, os.stat(path).st_mtime_ns)
+    if key != _catalog_key:
+        with open(path, encoding="utf-8") as f:
+            _catalog = json.load(f)
+        _catalog_key = key
+    return _catalog
+
+
+# ----------------------------
+# Pricing (request time)
+# ----------------------------
+_SEATS_RE = re.compile(r"(\d)\s*-?\s*seat")
+_TOKEN_RE = re.compile(r"[a-z]+|\d+")
+
+
+def _match_buggy(vehicle_model: Optional[str], models: Dict[str, Any]) -> str:
+    # Same rule as before the catalog: 4-seat only when asked for, otherwise 2-seat
+    seats = _SEATS_RE.search(str(vehicle_model or "").lower())
+    wanted = seats.group(1) if seats and seats.group(1) == "4" else "2"
+    for name in models:
+        if re.search(rf"\b{wanted}\s*seats?\b", name):
+            return name
+    raise PricingError(f"Unknown buggy model: {vehicle_model}")
+
+
+def _match_quad(vehicle_model: Optional[str], models: Dict[str, Any]) -> str:
+    """Best keyword overlap, so 'cobra', 'raptor 700' or '570cc' all resolve."""
+    words = set(_TOKEN_RE.findall(str(vehicle_model or "").lower().replace("cc", " ")))
+    scores = {}
+    for name in models:
+        tokens = set(_TOKEN_RE.findall(name.replace("cc", " ")))
+        scores[name] = len(words & tokens)
+    best = max(scores.values(), default=0)
+    winners = [name for name, score in scores.items() if score == best]
+    if best == 0 or len(winners) > 1:
+        options = ", ".join(name.title() for name in models)
+        raise PricingError(f"Please choose a quad model: {options}.")
+    return winners[0]
+
+
+def price_item(
+    activity: str,
+    quantity: int,
+    vehicle_model: Optional[str] = None,
+    duration_min: Optional[int] = None,
+    package: Optional[str] = None,
+    catalog: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
+    """Price one line item: per vehicle for buggy/quad, per passenger or car for safari."""
+    catalog = catalog or load_catalog()
+    activity = (activity or "").strip().lower()
+    if quantity in (None, ""):
+        raise PricingError(f"Missing quantity for {activity or 'the activity'}.")
+    quantity = int(quantity)
+    line: Dict[str, Any] = {"activity": activity, "quantity": quantity}
+
+    if activity == "safari":
+        pkg = str(package or "").lower()
+        kind = "private" if "private" in pkg else "shared" if "shared" in pkg else None
+        if kind is None:
+            raise PricingError("Please choose a shared or private safari.")
+        row = catalog["safari"][kind]
+        line.update(package=kind, per=row["per"], unit_price=row["price"])
+    elif activity in ("buggy", "quad"):
+        models = catalog[activity]
+        model = _match_buggy(vehicle_model, models) if activity == "buggy" else _match_quad(vehicle_model, models)
+        prices = models[model]
+        if duration_min in (None, "") or str(int(duration_min)) not in prices:
+            durations = ", ".join(sorted(prices, key=int))
+            raise PricingError(f"Unsupported {activity} duration. Please choose {durations} minutes.")
+        line.update(vehicle_model=model, duration_min=int(duration_min), per="vehicle",
+                    unit_price=prices[str(int(duration_min))])
+    else:
+        raise PricingError(f"Unknown desert activity: {activity or 'missing'}")
+
+    line["subtotal"] = line["unit_price"] * quantity
+    return line
+
+
+def quote(
+    lines: List[Dict[str, Any]],
+    pickup_required: Optional[bool],
+    payment_method: Optional[str],
+    catalog: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
+    """Sum priced lines, add one pickup fee per booking and card VAT."""
+    catalog = catalog or load_catalog()
+    pickup_fee = catalog["pickup_fee"] if pickup_required is True else 0
+    subtotal = sum(line["subtotal"] for line in lines) + pickup_fee
+    vat = round(subtotal * CARD_VAT_RATE, 2) if (payment_method or "").lower() == "card" else 0.0
+    return {
+        "currency": "AED",
+        "items": lines,
+        "pickup_fee": pickup_fee,
+        "subtotal": subtotal,
+        "vat": vat,
+        "total": round(subtotal + vat, 2),
+        "payment_method": payment_method,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Extract the desert catalog from the KB DOCX.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    ex = sub.add_parser("extract")
+    ex.add_argument("docx", nargs="?", default=os.getenv("DOC_PATH"))
+    ex.add_argument("--out", default=DESERT_PRICING_PATH)
+    args = parser.parse_args()
+
+    from docx import Document
+
+    paragraphs = [(p.text or "").strip() for p in Document(args.docx).paragraphs]
+    catalog = extract_catalog("\n".join(p for p in paragraphs if p), source=os.path.basename(args.docx))
+    save_catalog(catalog, args.out)
+    print(f"✓ Wrote {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,333 @@
+"""
+Persistent, content-addressed embedding cache shared by the desert and water tools.
+
+Vectors are keyed by sha256(model, text) and stored as float32 blobs in SQLite, so
+they survive restarts and are shared by every process pointing at the same file.
+A small in-memory LRU sits in front for the hot fixed queries, and the SQLite table
+is trimmed back to EMBEDDING_CACHE_MAX_ENTRIES by least-recent use. Uses (memory
+hits included) are written to last_used in batches, at the latest every
+EMBEDDING_CACHE_TOUCH_INTERVAL_S and always before rows are evicted. The async
+methods answer memory hits inline and do all SQLite reads and writes in a worker
+thread, off the event loop.
+
+    python -m src.embedding_cache          # entries / size of the on-disk cache
+"""
+import argparse
+import asyncio
+import hashlib
+import os
+import sqlite3
+import sys
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+# Allow running as a script: `python src/embedding_cache.py`
+if __package__ is None and __name__ == "__main__":
+    sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from dotenv import load_dotenv
+load_dotenv(dotenv_path=os.path.join(os.getcwd(), ".env"))
+
+from langchain_core.embeddings import Embeddings
+
+from src import metrics, usage
+
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "data/embedding_cache.sqlite3")
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "50000"))
+EMBEDDING_CACHE_MEMORY_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MEMORY_ENTRIES", "1024"))
+EMBEDDING_CACHE_TOUCH_INTERVAL_S = float(os.getenv("EMBEDDING_CACHE_TOUCH_INTERVAL_S", "30"))
+_TOUCH_BATCH = 256
+OPENAI_TIMEOUT_S = float(os.getenv("OPENAI_TIMEOUT_S", "0")) or None
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "2"))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS embeddings (
+    key TEXT PRIMARY KEY,
+    model TEXT NOT NULL,
+    vector BLOB NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used);
+"""
+_SELECT = "SELECT vector FROM embeddings WHERE key = ?"
+_TOUCH = "UPDATE embeddings SET last_used = ? WHERE key = ?"
+_UPSERT = "INSERT OR REPLACE INTO embeddings (key, model, vector, last_used) VALUES (?, ?, ?, ?)"
+_COUNT = "SELECT COUNT(*) FROM embeddings"
+_EVICT = "DELETE FROM embeddings WHERE key IN (SELECT key FROM embeddings ORDER BY last_used LIMIT ?)"
+
+
+def _cache_key(model: str, text: str) -> str:
+    return hashlib.sha256(f"{model}\0{text}".encode("utf-8")).hexdigest()
+
+
+def _pack(vector: List[float]) -> bytes:
+    return array("f", vector).tobytes()
+
+
+def _unpack(blob: bytes) -> List[float]:
+    vec = array("f")
+    vec.frombytes(blob)
+    return vec.tolist()
+
+
+class EmbeddingStore:
+    """SQLite (WAL) table of vectors with LRU trimming. Thread-safe."""
+
+    def __init__(self, path: str, max_entries: int = EMBEDDING_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        self._count = self._conn.execute(_COUNT).fetchone()[0]
+        self._touched: Dict[str, float] = {}  # key -> last use not written yet
+        self._flushed_at = time.monotonic()
+
+    def get(self, key: str) -> Optional[List[float]]:
+        with self._lock:
+            row = self._conn.execute(_SELECT, (key,)).fetchone()
+        if row is None:
+            return None
+        self.touch(key)
+        return _unpack(row[0])
+
+    def touch(self, key: str) -> None:
+        """Note a use of `key`; last_used is written in batches (flush_if_due) instead of once per hit."""
+        with self._lock:
+            self._touched[key] = time.time()
+
+    def flush_due(self) -> bool:
+        return bool(self._touched) and (len(self._touched) >= _TOUCH_BATCH
+                                        or time.monotonic() - self._flushed_at >= EMBEDDING_CACHE_TOUCH_INTERVAL_S)
+
+    def flush_if_due(self) -> None:
+        with self._lock:
+            if self.flush_due():
+                self._flush_touches()
+
+    def flush(self) -> None:
+        """Write pending last_used updates now (shutdown)."""
+        with self._lock:
+            self._flush_touches()
+
+    def _flush_touches(self) -> None:
+        # Caller holds self._lock
+        if self._touched:
+            self._conn.execute("BEGIN")
+            self._conn.executemany(_TOUCH, [(used, key) for key, used in self._touched.items()])
+            self._conn.execute("COMMIT")
+            self._touched.clear()
+        self._flushed_at = time.monotonic()
+
+    def put_many(self, model: str, items: Dict[str, List[float]]) -> None:
+        now = time.time()
+        rows = [(key, model, _pack(vec), now) for key, vec in items.items()]
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.executemany(_UPSERT, rows)
+            self._conn.execute("COMMIT")
+            self._count += len(rows)
+            if self._count > self.max_entries:
+                self._flush_touches()  # so recently used rows aren't the ones trimmed
+                # Trim 10% below the cap so we don't evict on every insert
+                self._count = self._conn.execute(_COUNT).fetchone()[0]
+                excess = self._count - int(self.max_entries * 0.9)
+                if excess > 0:
+                    self._conn.execute(_EVICT, (excess,))
+                    self._count -= excess
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute(_COUNT).fetchone()[0]
+
+
+class CachedEmbeddings(Embeddings):
+    """Wrap an Embeddings model so each (model, text) pair is embedded at most once."""
+
+    def __init__(self, inner: Embeddings, model: str, store: EmbeddingStore,
+                 memory_entries: int = EMBEDDING_CACHE_MEMORY_ENTRIES):
+        self.inner = inner
+        self.model = model
+        self.store = store
+        self.memory_entries = memory_entries
+        self._memory: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._memory_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    # ----------------------------
+    # Lookup helpers
+    # ----------------------------
+    def _lookup(self, key: str) -> Optional[List[float]]:
+        with self._memory_lock:
+            vec = self._memory.get(key)
+            if vec is not None:
+                self._memory.move_to_end(key)
+        if vec is not None:
+            self.store.touch(key)  # keep the hottest queries young on disk too
+        return vec
+
+    def _remember(self, key: str, vec: List[float]) -> None:
+        with self._memory_lock:
+            self._memory[key] = vec
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_entries:
+                self._memory.popitem(last=False)
+
+    def _split(self, texts: List[str]):
+        """Keys of `texts`, the vectors the memory LRU has, and the rest (key -> text, de-duplicated)."""
+        keys = [_cache_key(self.model, t) for t in texts]
+        found: Dict[str, List[float]] = {}
+        missing: Dict[str, str] = {}  # key -> text, de-duplicated
+        for key, text in zip(keys, texts):
+            if key in found or key in missing:
+                continue
+            vec = self._lookup(key)
+            if vec is None:
+                missing[key] = text
+            else:
+                found[key] = vec
+        return keys, found, missing
+
+    def _load(self, found: Dict[str, List[float]], missing: Dict[str, str]) -> None:
+        """Move what the SQLite store has of `missing` into `found`, and write due touches. Blocking I/O."""
+        for key in list(missing):
+            vec = self.store.get(key)
+            if vec is not None:
+                self._remember(key, vec)
+                found[key] = vec
+                del missing[key]
+        self.store.flush_if_due()
+
+    def _count(self, texts: List[str], missing: Dict[str, str]) -> None:
+        self.hits += len(texts) - len(missing)
+        self.misses += len(missing)
+
+    def _prepare(self, texts: List[str]):
+        keys, found, missing = self._split(texts)
+        self._load(found, missing)
+        self._count(texts, missing)
+        return keys, found, missing
+
+    async def _aprepare(self, texts: List[str]):
+        keys, found, missing = self._split(texts)
+        if missing or self.store.flush_due():
+            await asyncio.to_thread(self._load, found, missing)
+        self._count(texts, missing)
+        return keys, found, missing
+
+    def _store(self, found: Dict[str, List[float]], missing: Dict[str, str], vectors: List[List[float]]) -> None:
+        usage.record_embedding(self.model, list(missing.values()))  # only misses reach the API
+        fresh = dict(zip(missing.keys(), vectors))
+        self.store.put_many(self.model, fresh)
+        for key, vec in fresh.items():
+            self._remember(key, vec)
+        found.update(fresh)
+
+    # ----------------------------
+    # Embeddings interface
+    # ----------------------------
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys, found, missing = self._prepare(texts)
+        if missing:
+            self._store(found, missing, self.inner.embed_documents(list(missing.values())))
+        return [found[k] for k in keys]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys, found, missing = await self._aprepare(texts)
+        if missing:
+            vectors = await self.inner.aembed_documents(list(missing.values()))
+            await asyncio.to_thread(self._store, found, missing, vectors)
+        return [found[k] for k in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        keys, found, missing = self._prepare([text])
+        if missing:
+            self._store(found, missing, [self.inner.embed_query(text)])
+        return found[keys[0]]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        keys, found, missing = await self._aprepare([text])
+        if missing:
+            vector = await self.inner.aembed_query(text)
+            await asyncio.to_thread(self._store, found, missing, [vector])
+        return found[keys[0]]
+
+    def stats(self) -> Dict[str, float]:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "memory_entries": len(self._memory),
+        }
+
+
+_shared: Dict[str, CachedEmbeddings] = {}
+_shared_lock = threading.Lock()
+
+
+def get_shared_embeddings(model: str, base_url: Optional[str] = None) -> CachedEmbeddings:
+    """One cached OpenAIEmbeddings per model (and endpoint), shared by src/tools.py and src/water_tools.py."""
+    # Vectors from another endpoint (a stub server, a proxy to another model) must not mix with OpenAI's
+    key = f"{model}@{base_url}" if base_url else model
+    with _shared_lock:
+        if key not in _shared:
+            from langchain_openai import OpenAIEmbeddings
+
+            store = EmbeddingStore(EMBEDDING_CACHE_PATH)
+            inner = OpenAIEmbeddings(
+                model=model,
+                base_url=base_url,
+                # Client-side tiktoken chunking only makes sense against OpenAI itself
+                check_embedding_ctx_length=base_url is None,
+                timeout=OPENAI_TIMEOUT_S,
+                max_retries=OPENAI_MAX_RETRIES,
+            )
+            _shared[key] = CachedEmbeddings(inner, key, store)
+        return _shared[key]
+
+
+def flush_embedding_cache() -> None:
+    """Write the shared caches' pending last_used updates (shutdown)."""
+    for emb in list(_shared.values()):
+        emb.store.flush()
+
+
+def embedding_cache_stats() -> Dict[str, Dict[str, float]]:
+    """Per-model hit/miss counters for this process; each hit is one embedding call saved."""
+    return {model: emb.stats() for model, emb in _shared.items()}
+
+
+def _collect(field: str) -> metrics.Samples:
+    return [({"model": model}, stats[field]) for model, stats in embedding_cache_stats().items()]
+
+
+metrics.collect("jetset_embedding_cache_hits_total", "Embedding lookups answered by the cache.", "counter",
+                lambda: _collect("hits"))
+metrics.collect("jetset_embedding_cache_misses_total", "Embedding lookups sent to the API.", "counter",
+                lambda: _collect("misses"))
+metrics.collect("jetset_embedding_cache_hit_ratio", "Share of embedding lookups answered by the cache.", "gauge",
+                lambda: _collect("hit_rate"))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Inspect the on-disk embedding cache.")
+    parser.add_argument("--path", default=EMBEDDING_CACHE_PATH)
+    args = parser.parse_args()
+    if not os.path.exists(args.path):
+        print(f"No embedding cache at {args.path}")
+        return
+    store = EmbeddingStore(args.path)
+    size_kb = os.path.getsize(args.path) / 1024
+    print(f"{args.path}: {len(store)} vectors, {size_kb:.0f} KB (cap {store.max_entries})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+"""
+Token-budgeted chat history for the agents.
+
+TokenBudgetMemory replaces ConversationBufferWindowMemory(k=20). Instead of the
+last 20 turns whatever their size, each agent call gets the newest whole turns
+that fit its route's budget (HISTORY_TOKEN_BUDGET_DESERT / _WATER / _GENERAL).
+The buffer itself is capped at HISTORY_MAX_TOKENS; turns pushed out of it are
+"folded": handed to the bot through `pop_folded()` so they can be merged into
+the user's rolling summary instead of being resent forever.
+
+Tokens are counted with tiktoken for CHAT_MODEL. If the encoding can't be
+loaded (no network for the first download), a chars/4 estimate is used.
+"""
+import os
+import re
+import threading
+from typing import Any, Dict, List
+
+from langchain.memory.chat_memory import BaseChatMemory
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage
+from pydantic import PrivateAttr
+
+CHAT_MODEL = os.getenv("CHAT_MODEL", "gpt-4.1-mini")
+HISTORY_TOKEN_BUDGETS = {
+    "desert": int(os.getenv("HISTORY_TOKEN_BUDGET_DESERT", "1500")),
+    "water": int(os.getenv("HISTORY_TOKEN_BUDGET_WATER", "1500")),
+    "general": int(os.getenv("HISTORY_TOKEN_BUDGET_GENERAL", "800")),
+}
+HISTORY_MAX_TOKENS = int(os.getenv("HISTORY_MAX_TOKENS", str(max(HISTORY_TOKEN_BUDGETS.values()))))
+
+# Tokens OpenAI adds around every chat message (role, separators)
+_MESSAGE_OVERHEAD = 4
+# The summary is sent fresh with every input; don't keep a copy of it in each stored turn
+_CONTEXT_BLOCK_RE = re.compile(r"^\[BOOKING_CONTEXT\].*?\[/BOOKING_CONTEXT\]\s*", re.S)
+
+
+# ----------------------------
+# Token counting
+# ----------------------------
+_encoding: Any = None  # tiktoken.Encoding, or False once loading failed
+_encoding_lock = threading.Lock()
+
+
+def _load_encoding() -> Any:
+    try:
+        import tiktoken
+
+        try:
+            return tiktoken.encoding_for_model(CHAT_MODEL)
+        except KeyError:
+            # tiktoken doesn't know every model name; the gpt-4o/4.1/o-series all use o200k
+            return tiktoken.get_encoding("o200k_base")
+    except Exception:
+        return False
+
+
+def count_tokens(text: str) -> int:
+    global _encoding
+    if _encoding is None:
+        with _encoding_lock:
+            if _encoding is None:
+                _encoding = _load_encoding()
+    if _encoding is False:
+        return (len(text) + 3) // 4
+    return len(_encoding.encode_ordinary(text))
+
+
+def tokenizer_name() -> str:
+    count_tokens("")
+    return _encoding.name if _encoding else "chars/4 estimate"
+
+
+def message_tokens(message: BaseMessage) -> int:
+    content = message.content if isinstance(message.content, str) else str(message.content)
+    return count_tokens(content) + _MESSAGE_OVERHEAD
+
+
+# ----------------------------
+# Memory
+# ----------------------------
+class TokenBudgetMemory(BaseChatMemory):
+    """Chat memory that returns the newest whole turns within `token_budget`."""
+
+    memory_key: str = "chat_history"
+    return_messages: bool = True
+    token_budget: int = HISTORY_TOKEN_BUDGETS["desert"]
+    max_tokens: int = HISTORY_MAX_TOKENS
+
+    _counts: List[int] = PrivateAttr(default_factory=list)  # token count per message, same order
+    _folded: List[BaseMessage] = PrivateAttr(default_factory=list)
+
+    @property
+    def memory_variables(self) -> List[str]:
+        return [self.memory_key]
+
+    def use_route(self, route: str) -> "TokenBudgetMemory":
+        """Size the next load for `route` (desert/water/general)."""
+        self.token_budget = HISTORY_TOKEN_BUDGETS.get(route, self.max_tokens)
+        return self
+
+    def _token_counts(self) -> List[int]:
+        messages = self.chat_memory.messages
+        if len(self._counts) > len(messages):
+            self._counts = []  # history was replaced (restore, clear); recount
+        self._counts.extend(message_tokens(m) for m in messages[len(self._counts):])
+        return self._counts
+
+    def _turn_starts(self) -> List[int]:
+        starts = [i for i, m in enumerate(self.chat_memory.messages) if isinstance(m, HumanMessage)]
+        if not starts or starts[0] != 0:
+            starts.insert(0, 0)  # anything before the first human message counts as one turn
+        return starts
+
+    def buffer_tokens(self) -> int:
+        return sum(self._token_counts())
+
+    def load_memory_variables(self, inputs: Dict[str, Any]) -> Dict[str, Any]:
+        messages = self.chat_memory.messages
+        counts = self._token_counts()
+        starts = self._turn_starts()
+        # Walk back turn by turn; the latest turn is always kept so follow-ups like "yes" have context
+        keep_from = starts[-1] if messages else 0
+        used = sum(counts[keep_from:])
+        for start, end in zip(reversed(starts[:-1]), reversed(starts[1:])):
+            turn = sum(counts[start:end])
+            if used + turn > self.token_budget:
+                break
+            used += turn
+            keep_from = start
+        return {self.memory_key: messages[keep_from:]}
+
+    def save_context(self, inputs: Dict[str, Any], outputs: Dict[str, str]) -> None:
+        input_str, output_str = self._get_input_output(inputs, outputs)
+        input_str = _CONTEXT_BLOCK_RE.sub("", input_str, count=1)
+        self.chat_memory.add_messages([HumanMessage(content=input_str), AIMessage(content=output_str)])
+        self._fold()
+
+    async def asave_context(self, inputs: Dict[str, Any], outputs: Dict[str, str]) -> None:
+        self.save_context(inputs, outputs)
+
+    def _fold(self) -> None:
+        """Move the oldest whole turns out of the buffer until it fits max_tokens."""
+        messages = self.chat_memory.messages
+        counts = self._token_counts()
+        starts = self._turn_starts()
+        total = sum(counts)
+        cut = 0
+        for start, end in zip(starts, starts[1:]):
+            if total <= self.max_tokens:
+                break
+            total -= sum(counts[start:end])
+            cut = end
+        if cut:
+            self._folded.extend(messages[:cut])
+            del messages[:cut]
+            del counts[:cut]
+
+    def has_folded(self) -> bool:
+        return bool(self._folded)
+
+    def folded(self) -> List[BaseMessage]:
+        """Turns dropped from the buffer and not yet summarized (saved when the session is spilled)."""
+        return list(self._folded)
+
+    def restore_folded(self, messages: List[BaseMessage]) -> None:
+        self._folded = list(messages)
+
+    def pop_folded(self) -> List[BaseMessage]:
+        """Turns dropped from the buffer since the last call, oldest first."""
+        folded, self._folded = self._folded, []
+        return folded
+
+    def clear(self) -> None:
+        super().clear()
+        self._counts = []
+        self._folded = []
+
+
+def new_memory() -> TokenBudgetMemory:
+    return TokenBudgetMemory()
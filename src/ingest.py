@@ -8,9 +8,11 @@ from dotenv import load_dotenv
 from docx import Document
 
 from langchain_openai import OpenAIEmbeddings
-from langchain_chroma import Chroma
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 
+from src.kb_ingest import publish_chunks, print_report
+from src.desert_pricing import extract_catalog, save_catalog, DESERT_PRICING_PATH
+
 # ----------------------------
 # Load environment
 # ----------------------------
@@ -39,6 +41,13 @@ def load_docx(path: str) -> str:
 print(f"📄 Loading document: {DOC_PATH}")
 raw_text = load_docx(DOC_PATH)
 
+# ----------------------------
+# Price catalog (used by booking_compute_price)
+# ----------------------------
+catalog = extract_catalog(raw_text, source=os.path.basename(DOC_PATH))
+save_catalog(catalog, DESERT_PRICING_PATH)
+print(f"💰 Wrote price catalog to: {DESERT_PRICING_PATH}")
+
 # ----------------------------
 # Split into chunks
 # ----------------------------
@@ -56,25 +65,14 @@ print(f"✂️  Split into {len(chunks)} chunks")
 embeddings = OpenAIEmbeddings(model=EMBEDDING_MODEL)
 
 # ----------------------------
-# Chroma (auto-persistent)
+# Chroma (blue/green versions)
 # ----------------------------
 print(f"🧠 Writing to Chroma at: {CHROMA_DIR}")
 
-vectordb = Chroma(
-    collection_name=CHROMA_COLLECTION,
-    persist_directory=CHROMA_DIR,
-    embedding_function=embeddings,
-)
-
-# OPTIONAL: clear existing documents safely
-existing = vectordb._collection.count()
-if existing > 0:
-    print(f"⚠️  Clearing existing {existing} documents")
-    vectordb._collection.delete(where={})
-
-vectordb.add_texts(
-    texts=chunks,
-    metadatas=[{"source": "Desert JetSet Knowledge Base.docx"}] * len(chunks)
-)
+# Build a new versioned collection and flip the manifest to it once complete;
+# unchanged chunks reuse their vectors, only new/changed ones are embedded
+report = publish_chunks(CHROMA_DIR, CHROMA_COLLECTION, chunks, source="Desert JetSet Knowledge Base.docx", embeddings=embeddings,
+                        embedding_model=EMBEDDING_MODEL)
+print_report(report)
 
 print("✅ Ingestion complete (auto-persisted)")
@@ -8,9 +8,11 @@ from dotenv import load_dotenv
 from pypdf import PdfReader
 
 from langchain_openai import OpenAIEmbeddings
-from langchain_chroma import Chroma
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 
+from src.kb_ingest import publish_chunks, print_report
+from src.water_pricing import extract_price_tables, save_price_tables, WATER_PRICING_PATH
+
 # ----------------------------
 # Load environment
 # ----------------------------
@@ -39,6 +41,13 @@ def load_pdf(path: str) -> str:
 print(f"📄 Loading document: {WATER_DOC_PATH}")
 raw_text = load_pdf(WATER_DOC_PATH)
 
+# ----------------------------
+# Price tables (used by water_booking_compute_price)
+# ----------------------------
+price_tables = extract_price_tables(raw_text, source=os.path.basename(WATER_DOC_PATH))
+save_price_tables(price_tables, WATER_PRICING_PATH)
+print(f"💰 Wrote price tables to: {WATER_PRICING_PATH}")
+
 # ----------------------------
 # Split into chunks
 # ----------------------------
@@ -56,26 +65,15 @@ print(f"✂️  Split into {len(chunks)} chunks")
 embeddings = OpenAIEmbeddings(model=EMBEDDING_MODEL)
 
 # ----------------------------
-# Chroma (auto-persistent)
+# Chroma (blue/green versions)
 # ----------------------------
 print(f"🧠 Writing to Chroma at: {WATER_CHROMA_DIR}")
 
-vectordb = Chroma(
-    collection_name=WATER_CHROMA_COLLECTION,
-    persist_directory=WATER_CHROMA_DIR,
-    embedding_function=embeddings,
-)
-
-# OPTIONAL: clear existing documents safely
-existing = vectordb._collection.count()
-if existing > 0:
-    print(f"⚠️  Clearing existing {existing} documents")
-    vectordb._collection.delete(where={})
-
+# Build a new versioned collection and flip the manifest to it once complete;
+# unchanged chunks reuse their vectors, only new/changed ones are embedded
 source_name = os.path.basename(WATER_DOC_PATH)
-vectordb.add_texts(
-    texts=chunks,
-    metadatas=[{"source": source_name}] * len(chunks)
-)
+report = publish_chunks(WATER_CHROMA_DIR, WATER_CHROMA_COLLECTION, chunks, source=source_name, embeddings=embeddings,
+                        embedding_model=EMBEDDING_MODEL)
+print_report(report)
 
 print("✅ Water ingestion complete (auto-persisted)")
@@ -0,0 +1,265 @@
+"""
+In-process intent classifier used by `route_agent` before falling back to the LLM router.
+
+Character n-gram TF-IDF features plus a multinomial logistic regression, in pure
+Python so it adds no dependencies and predicts in well under a millisecond.
+Labels match ROUTER_SYSTEM_PROMPT: desert | water | general | clarify.
+
+Training data is JSONL with {"text", "last_agent", "label"} rows: the hand-labelled
+seed set in data/intent/seed.jsonl (built from the test_cases.py turns) plus any
+LLM router decisions the bot logged to ROUTER_LOG_PATH.
+
+    python -m src.intent train --out data/intent/model.json
+    python -m src.intent eval --data data/intent/router_log.jsonl --threshold 0.9
+
+`train` prints a holdout report first; `eval` on the seed set scores the model on
+its own training data, so use it on fresh router logs.
+"""
+import argparse
+import json
+import math
+import os
+import random
+import re
+import sys
+from collections import Counter
+from typing import Dict, Iterable, List, Tuple
+
+# Allow running as a script: `python src/intent.py`
+if __package__ is None and __name__ == "__main__":
+    sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+LABELS = ("desert", "water", "general", "clarify")
+NGRAM_RANGE = (2, 5)
+DEFAULT_SEED_PATH = os.path.join("data", "intent", "seed.jsonl")
+DEFAULT_MODEL_PATH = os.path.join("data", "intent", "model.json")
+
+Example = Dict[str, str]
+
+_USER_ID_PREFIX_RE = re.compile(r"^\[user_id=[^\]]*\]\s*")
+_SPACE_RE = re.compile(r"\s+")
+
+
+def _normalize(text: str) -> str:
+    text = _USER_ID_PREFIX_RE.sub("", text or "")
+    return _SPACE_RE.sub(" ", text.lower()).strip()
+
+
+def _raw_features(text: str, last_agent: str) -> Counter:
+    """Character n-grams within word boundaries (like sklearn's char_wb) plus the last agent."""
+    counts: Counter = Counter()
+    lo, hi = NGRAM_RANGE
+    for word in _normalize(text).split(" "):
+        padded = f" {word} "
+        for n in range(lo, hi + 1):
+            for i in range(len(padded) - n + 1):
+                counts[padded[i:i + n]] += 1
+    counts[f"__last={last_agent or 'general'}"] += 1
+    return counts
+
+
+class IntentClassifier:
+    def __init__(
+        self,
+        idf: Dict[str, float],
+        weights: Dict[str, Dict[str, float]],
+        bias: Dict[str, float],
+    ):
+        self.idf = idf
+        self.weights = weights
+        self.bias = bias
+
+    # ----------------------------
+    # Features
+    # ----------------------------
+    @staticmethod
+    def _vectorize(counts: Counter, idf: Dict[str, float]) -> Dict[str, float]:
+        vec = {f: (1.0 + math.log(c)) * idf[f] for f, c in counts.items() if f in idf}
+        norm = math.sqrt(sum(v * v for v in vec.values())) or 1.0
+        return {f: v / norm for f, v in vec.items()}
+
+    def vectorize(self, text: str, last_agent: str = "general") -> Dict[str, float]:
+        return self._vectorize(_raw_features(text, last_agent), self.idf)
+
+    # ----------------------------
+    # Prediction
+    # ----------------------------
+    def predict_proba(self, text: str, last_agent: str = "general") -> Dict[str, float]:
+        vec = self.vectorize(text, last_agent)
+        scores = {}
+        for label in LABELS:
+            w = self.weights.get(label, {})
+            scores[label] = self.bias.get(label, 0.0) + sum(w.get(f, 0.0) * v for f, v in vec.items())
+        top = max(scores.values())
+        exp = {label: math.exp(s - top) for label, s in scores.items()}
+        total = sum(exp.values())
+        return {label: e / total for label, e in exp.items()}
+
+    def predict(self, text: str, last_agent: str = "general") -> Tuple[str, float]:
+        """Return (label, confidence) for one message."""
+        proba = self.predict_proba(text, last_agent)
+        label = max(proba, key=proba.get)
+        return label, proba[label]
+
+    # ----------------------------
+    # Training
+    # ----------------------------
+    @classmethod
+    def fit(
+        cls,
+        examples: List[Example],
+        epochs: int = 60,
+        learning_rate: float = 0.5,
+        l2: float = 1e-4,
+        seed: int = 13,
+    ) -> "IntentClassifier":
+        """Multinomial logistic regression trained with SGD on TF-IDF vectors."""
+        raw = [(_raw_features(e["text"], e.get("last_agent", "general")), e["label"]) for e in examples]
+        df: Counter = Counter()
+        for counts, _ in raw:
+            df.update(counts.keys())
+        n_docs = len(raw)
+        idf = {f: math.log((1 + n_docs) / (1 + d)) + 1.0 for f, d in df.items()}
+        data = [(cls._vectorize(counts, idf), label) for counts, label in raw]
+
+        weights: Dict[str, Dict[str, float]] = {label: {} for label in LABELS}
+        bias = {label: 0.0 for label in LABELS}
+        model = cls(idf, weights, bias)
+        rng = random.Random(seed)
+        for epoch in range(epochs):
+            rng.shuffle(data)
+            lr = learning_rate / (1.0 + epoch * 0.1)
+            for vec, label in data:
+                scores = {
+                    c: bias[c] + sum(weights[c].get(f, 0.0) * v for f, v in vec.items())
+                    for c in LABELS
+                }
+                top = max(scores.values())
+                exp = {c: math.exp(s - top) for c, s in scores.items()}
+                total = sum(exp.values())
+                for c in LABELS:
+                    grad = exp[c] / total - (1.0 if c == label else 0.0)
+                    w = weights[c]
+                    for f, v in vec.items():
+                        w[f] = w.get(f, 0.0) * (1.0 - lr * l2) - lr * grad * v
+                    bias[c] -= lr * grad
+        return model
+
+    # ----------------------------
+    # Persistence
+    # ----------------------------
+    def save(self, path: str) -> None:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        payload = {
+            "labels": list(LABELS),
+            "ngram_range": list(NGRAM_RANGE),
+            "idf": {f: round(v, 4) for f, v in self.idf.items()},
+            "weights": {
+                label: {f: round(v, 4) for f, v in w.items() if abs(v) >= 1e-3}
+                for label, w in self.weights.items()
+            },
+            "bias": self.bias,
+        }
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(payload, f, ensure_ascii=False, separators=(",", ":"))
+
+    @classmethod
+    def load(cls, path: str) -> "IntentClassifier":
+        with open(path, encoding="utf-8") as f:
+            payload = json.load(f)
+        return cls(payload["idf"], payload["weights"], payload["bias"])
+
+
+def load_examples(paths: Iterable[str]) -> List[Example]:
+    examples: List[Example] = []
+    for path in paths:
+        if not os.path.exists(path):
+            continue
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                row = json.loads(line)
+                if row.get("label") in LABELS and row.get("text"):
+                    examples.append(row)
+    return examples
+
+
+def evaluate(model: IntentClassifier, examples: List[Example], threshold: float) -> Dict[str, float]:
+    """Accuracy overall, plus the share of messages confident enough to skip the LLM router."""
+    correct = confident = confident_correct = 0
+    for e in examples:
+        label, confidence = model.predict(e["text"], e.get("last_agent", "general"))
+        hit = label == e["label"]
+        correct += hit
+        if confidence >= threshold:
+            confident += 1
+            confident_correct += hit
+    n = len(examples) or 1
+    return {
+        "examples": len(examples),
+        "accuracy": correct / n,
+        "router_calls_avoided": confident / n,
+        "accuracy_when_avoided": confident_correct / confident if confident else 0.0,
+    }
+
+
+def _print_report(model: IntentClassifier, examples: List[Example], threshold: float) -> None:
+    report = evaluate(model, examples, threshold)
+    print(f"examples:               {report['examples']}")
+    print(f"accuracy:               {report['accuracy']:.1%}")
+    print(f"router calls avoided:   {report['router_calls_avoided']:.1%} (confidence >= {threshold})")
+    print(f"accuracy when avoided:  {report['accuracy_when_avoided']:.1%}")
+    print("\nthreshold sweep:")
+    print(f"  {'threshold':>9} {'avoided':>8} {'acc@avoided':>11}")
+    for t in (0.5, 0.6, 0.7, 0.8, 0.85, 0.9, 0.95):
+        r = evaluate(model, examples, t)
+        print(f"  {t:>9.2f} {r['router_calls_avoided']:>8.1%} {r['accuracy_when_avoided']:>11.1%}")
+
+
+def _default_data_paths() -> List[str]:
+    paths = [DEFAULT_SEED_PATH]
+    router_log = os.getenv("ROUTER_LOG_PATH")
+    if router_log:
+        paths.append(router_log)
+    return paths
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Train or evaluate the local intent classifier.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    train = sub.add_parser("train", help="Fit on labelled JSONL data and save the model.")
+    train.add_argument("--data", nargs="*", default=None, help="JSONL files (default: seed set + ROUTER_LOG_PATH).")
+    train.add_argument("--out", default=os.getenv("INTENT_MODEL_PATH", DEFAULT_MODEL_PATH))
+    train.add_argument("--holdout", type=float, default=0.2, help="Share held out for the report before the final fit.")
+    train.add_argument("--threshold", type=float, default=float(os.getenv("INTENT_CONFIDENCE_THRESHOLD", "0.9")))
+
+    ev = sub.add_parser("eval", help="Report accuracy and router calls avoided for a saved model.")
+    ev.add_argument("--data", nargs="*", default=None, help="JSONL files (default: seed set + ROUTER_LOG_PATH).")
+    ev.add_argument("--model", default=os.getenv("INTENT_MODEL_PATH", DEFAULT_MODEL_PATH))
+    ev.add_argument("--threshold", type=float, default=float(os.getenv("INTENT_CONFIDENCE_THRESHOLD", "0.9")))
+
+    args = parser.parse_args()
+    examples = load_examples(args.data or _default_data_paths())
+    if not examples:
+        raise SystemExit("No labelled examples found.")
+
+    if args.command == "train":
+        if 0 < args.holdout < 1:
+            shuffled = examples[:]
+            random.Random(7).shuffle(shuffled)
+            cut = max(1, int(len(shuffled) * args.holdout))
+            held_out, train_set = shuffled[:cut], shuffled[cut:]
+            print(f"== holdout report (trained on {len(train_set)}, evaluated on {len(held_out)})")
+            _print_report(IntentClassifier.fit(train_set), held_out, args.threshold)
+        model = IntentClassifier.fit(examples)
+        model.save(args.out)
+        print(f"\n✓ Trained on {len(examples)} examples, saved to {args.out}")
+    else:
+        _print_report(IntentClassifier.load(args.model), examples, args.threshold)
+
+
+if __name__ == "__main__":
+    main()
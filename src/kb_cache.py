@@ -0,0 +1,66 @@
+"""
+In-memory results for the knowledge-base tools whose query never changes.
+
+`about_tool`, `location_tool`, `packages_tool(activity)` and the water equivalents
+always send the same query, so their results only change when the KB is
+re-ingested. Each ingest publishes a new KB version through the manifest (see
+src/kb_manifest.py). A FixedQueryCache drops everything it holds as soon as the
+live version changes, so the next call re-runs the search against the new data.
+Hits, misses and entries per KB are exported through src/metrics.py.
+"""
+from typing import Awaitable, Callable, Dict, Optional
+
+from src import metrics
+from src.kb_manifest import LiveCollection
+
+
+# kb name -> its cache, for the exported counters
+CACHES: Dict[str, "FixedQueryCache"] = {}
+
+
+class FixedQueryCache:
+    """Memoized tool results, invalidated when the live KB version changes."""
+
+    def __init__(self, live: LiveCollection, kb: str):
+        self.live = live
+        self.kb = kb
+        self._results: Dict[str, str] = {}
+        self.version: Optional[str] = None
+        self.hits = 0
+        self.misses = 0
+        CACHES[kb] = self
+
+    def _check_version(self) -> Optional[str]:
+        version = self.live.current_version()
+        if version != self.version:
+            self.version = version
+            self._results.clear()
+        return version
+
+    async def get(self, key: str, compute: Callable[[], Awaitable[str]]) -> str:
+        version = self._check_version()
+        cached = self._results.get(key)
+        if cached is not None:
+            self.hits += 1
+            return cached
+        self.misses += 1
+        result = await compute()
+        # Don't store a result computed against a KB that was replaced mid-search
+        if self._check_version() == version:
+            self._results[key] = result
+        return result
+
+    def stats(self) -> Dict[str, object]:
+        return {"version": self.version, "entries": len(self._results), "hits": self.hits, "misses": self.misses}
+
+
+def _collect(field: str) -> metrics.Samples:
+    return [({"kb": kb}, cache.stats()[field]) for kb, cache in CACHES.items()]
+
+
+metrics.collect("jetset_kb_fixed_query_hits_total", "Fixed-query KB tool calls served from memory.", "counter",
+                lambda: _collect("hits"))
+metrics.collect("jetset_kb_fixed_query_misses_total", "Fixed-query KB tool calls that ran the search.", "counter",
+                lambda: _collect("misses"))
+metrics.collect("jetset_kb_fixed_query_entries", "Fixed-query results held for the live KB version.", "gauge",
+                lambda: _collect("entries"))
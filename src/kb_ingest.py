@@ -0,0 +1,170 @@
+"""
+Incremental, blue/green re-ingestion shared by src/ingest.py and src/ingest_water.py.
+
+Every chunk gets a stable id derived from its content, sha256(source, text), so a
+run can diff the document against the live collection instead of re-embedding
+everything. Changes are published as a new versioned collection:
+
+1. vectors for unchanged chunks are copied over from the live collection,
+2. only new or changed chunks are embedded,
+3. the manifest is flipped to the new collection in one atomic rename,
+4. collections older than KB_KEEP_PREVIOUS_VERSIONS are dropped.
+
+The bot keeps querying the old collection until step 3, so it never sees a
+half-populated index. A run with no changes publishes nothing.
+
+The manifest records the embedding model. Vectors are only copied from a live
+collection embedded with the same model; otherwise (or when the manifest predates
+the field) every chunk is re-embedded, so a collection never mixes vector spaces.
+"""
+import hashlib
+import os
+import time
+from typing import Dict, List
+
+import chromadb
+from langchain_chroma import Chroma
+from langchain_core.embeddings import Embeddings
+
+from src.kb_manifest import new_version, read_manifest, versioned_collection_name, write_manifest
+
+# Versions kept besides the live one, so in-flight queries and rollbacks still work
+KB_KEEP_PREVIOUS_VERSIONS = int(os.getenv("KB_KEEP_PREVIOUS_VERSIONS", "1"))
+_COPY_BATCH = 500
+
+
+def chunk_id(source: str, text: str) -> str:
+    return hashlib.sha256(f"{source}\0{text}".encode("utf-8")).hexdigest()
+
+
+def stable_chunk_ids(source: str, chunks: List[str]) -> List[str]:
+    """Content ids for `chunks`; repeated chunks get a #n suffix so ids stay unique."""
+    seen: Dict[str, int] = {}
+    ids = []
+    for text in chunks:
+        cid = chunk_id(source, text)
+        n = seen.get(cid, 0)
+        seen[cid] = n + 1
+        ids.append(cid if n == 0 else f"{cid}#{n}")
+    return ids
+
+
+def _existing_collection(client, name: str):
+    try:
+        return client.get_collection(name)
+    except Exception:  # chromadb raises different types across versions
+        return None
+
+
+def _copy_vectors(src, dst, ids: List[str]) -> None:
+    for i in range(0, len(ids), _COPY_BATCH):
+        batch = src.get(ids=ids[i:i + _COPY_BATCH], include=["embeddings", "documents", "metadatas"])
+        dst.add(
+            ids=batch["ids"],
+            embeddings=batch["embeddings"],
+            documents=batch["documents"],
+            metadatas=batch["metadatas"],
+        )
+
+
+def _drop_old_versions(client, base: str, keep: List[str]) -> List[str]:
+    names = [c if isinstance(c, str) else c.name for c in client.list_collections()]
+    ours = sorted(n for n in names if n == base or n.startswith(f"{base}-"))
+    dropped = [n for n in ours if n not in keep]
+    for name in dropped:
+        client.delete_collection(name)
+    return dropped
+
+
+def publish_chunks(
+    chroma_dir: str,
+    base_collection: str,
+    chunks: List[str],
+    source: str,
+    embeddings: Embeddings,
+    embedding_model: str,
+) -> Dict[str, object]:
+    """Publish `chunks` as a new KB version, embedding only what changed since the last `embedding_model` version."""
+    started = time.perf_counter()
+    client = chromadb.PersistentClient(path=chroma_dir)
+    manifest = read_manifest(chroma_dir) or {}
+    live_name = manifest.get("collection") or base_collection
+    live = _existing_collection(client, live_name)
+
+    ids = stable_chunk_ids(source, chunks)
+    wanted = dict(zip(ids, chunks))
+    live_ids = set(live.get(include=[])["ids"]) if live is not None else set()
+    live_model = manifest.get("embedding_model")
+    reembed = bool(live_ids) and live_model != embedding_model
+    existing = set() if reembed else live_ids  # vectors that may be copied over
+    new_ids = [cid for cid in ids if cid not in existing]
+    kept_ids = [cid for cid in ids if cid in existing]
+    stale = len(live_ids - set(ids))
+
+    report: Dict[str, object] = {
+        "added": len(new_ids),
+        "removed": stale,
+        "unchanged": len(kept_ids),
+        "copy_s": 0.0,
+        "embed_s": 0.0,
+        "version": manifest.get("version"),
+        "collection": live_name,
+        "published": False,
+        "reembed": reembed,
+        "previous_model": live_model,
+    }
+    if manifest and not new_ids and not stale:
+        report["total_s"] = time.perf_counter() - started
+        return report
+
+    version = new_version()
+    name = versioned_collection_name(base_collection, version)
+    vectordb = Chroma(client=client, collection_name=name, embedding_function=embeddings)
+
+    copy_started = time.perf_counter()
+    if kept_ids:
+        _copy_vectors(live, vectordb._collection, kept_ids)
+    report["copy_s"] = time.perf_counter() - copy_started
+
+    embed_started = time.perf_counter()
+    if new_ids:
+        vectordb.add_texts(
+            texts=[wanted[cid] for cid in new_ids],
+            metadatas=[{"source": source, "content_hash": cid.split("#")[0]} for cid in new_ids],
+            ids=new_ids,
+        )
+    report["embed_s"] = time.perf_counter() - embed_started
+
+    previous = [live_name] + list(manifest.get("previous", []))
+    write_manifest(chroma_dir, {
+        "collection": name,
+        "version": version,
+        "base_collection": base_collection,
+        "source": source,
+        "embedding_model": embedding_model,
+        "chunks": len(ids),
+        "published_at": time.time(),
+        "previous": previous[:KB_KEEP_PREVIOUS_VERSIONS],
+    })
+    report["dropped"] = _drop_old_versions(client, base_collection, [name] + previous[:KB_KEEP_PREVIOUS_VERSIONS])
+    report.update(version=version, collection=name, published=True, total_s=time.perf_counter() - started)
+    return report
+
+
+def print_report(report: Dict[str, object]) -> None:
+    if report["reembed"]:
+        print(f"🔁 Embedding model changed from {report['previous_model'] or 'unrecorded'}: re-embedding every chunk")
+    print(
+        f"➕ added {report['added']}  ➖ removed {report['removed']}  "
+        f"= unchanged {report['unchanged']}"
+    )
+    print(
+        f"⏱️  copy {report['copy_s']:.2f}s, embed+add {report['embed_s']:.2f}s, "
+        f"total {report['total_s']:.2f}s"
+    )
+    if report["published"]:
+        print(f"🔖 Live KB is now {report['collection']}")
+        if report.get("dropped"):
+            print(f"🧹 Dropped old versions: {', '.join(report['dropped'])}")
+    else:
+        print(f"🔖 No changes, live KB stays {report['collection']}")
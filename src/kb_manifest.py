@@ -0,0 +1,106 @@
+"""
+Blue/green pointer for the Chroma knowledge bases.
+
+Each ingest builds a fresh collection named `<base>-<version>` and then replaces
+manifest.json in the Chroma directory in one rename. Readers go through a
+LiveCollection, which stats the manifest on every query and reopens the
+collection it names when it changes. Running bots pick up a new KB on their
+next search and never see a half-built index.
+
+Without a manifest (a KB built before versioning), the base collection name
+from the env is used as is.
+"""
+import json
+import os
+import threading
+import time
+import uuid
+from typing import TYPE_CHECKING, Any, Callable, Dict, Optional
+
+from langchain_core.embeddings import Embeddings
+
+if TYPE_CHECKING:
+    from langchain_chroma import Chroma
+
+MANIFEST_FILENAME = "manifest.json"
+
+
+def new_version() -> str:
+    return f"{time.strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:8]}"
+
+
+def versioned_collection_name(base: str, version: str) -> str:
+    return f"{base}-{version}"
+
+
+def manifest_path(chroma_dir: str) -> str:
+    return os.path.join(chroma_dir, MANIFEST_FILENAME)
+
+
+def read_manifest(chroma_dir: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(manifest_path(chroma_dir), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_manifest(chroma_dir: str, manifest: Dict[str, Any]) -> None:
+    """Atomically point readers at `manifest['collection']`."""
+    os.makedirs(chroma_dir, exist_ok=True)
+    path = manifest_path(chroma_dir)
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class LiveCollection:
+    """The collection the manifest currently points at, reopened when the manifest changes. Thread-safe."""
+
+    def __init__(self, chroma_dir: str, base_collection: str, embeddings: Callable[[], Embeddings]):
+        self.chroma_dir = chroma_dir
+        self.base_collection = base_collection
+        # Called when the collection is first opened, so neither chromadb nor the
+        # embeddings client is loaded until the first search (or warmup)
+        self._embeddings = embeddings
+        self._lock = threading.Lock()
+        self._manifest_mtime: Optional[int] = -1  # forces a first read
+        self._db: Optional["Chroma"] = None
+        self.collection_name: Optional[str] = None
+        self.version: Optional[str] = None
+
+    def _refresh(self) -> None:
+        # One stat per query; the manifest is only re-read when it changes on disk
+        try:
+            mtime = os.stat(manifest_path(self.chroma_dir)).st_mtime_ns
+        except OSError:
+            mtime = None
+        if mtime == self._manifest_mtime and self._db is not None:
+            return
+        with self._lock:
+            if mtime == self._manifest_mtime and self._db is not None:
+                return
+            manifest = read_manifest(self.chroma_dir) or {}
+            name = manifest.get("collection") or self.base_collection
+            if name != self.collection_name or self._db is None:
+                from langchain_chroma import Chroma
+
+                self._db = Chroma(
+                    collection_name=name,
+                    persist_directory=self.chroma_dir,
+                    embedding_function=self._embeddings(),
+                )
+                self.collection_name = name
+            self.version = manifest.get("version")
+            self._manifest_mtime = mtime
+
+    def get(self) -> "Chroma":
+        self._refresh()
+        return self._db
+
+    def current_version(self) -> Optional[str]:
+        self._refresh()
+        return self.version
@@ -0,0 +1,406 @@
+"""
+Latency histograms for the bot's hot path.
+
+`span("route", method="llm")` times a block into the jetset_stage_seconds
+histogram. The LLM and tool calls an agent makes inside AgentExecutor are timed
+by the callback handler from `AgentMetrics(route)`, one per route, and each
+`agent_run(route)` block counts its LLM calls as that run's iterations. Each label set keeps
+Prometheus buckets (cumulative since start) plus a window of its most recent
+samples, which p50/p95/p99 are computed from.
+
+Stages recorded by src/bot.py and friends:
+    queue_wait      waiting for the user's lock and a turn slot
+    turn            _handle_message, end to end
+    prechecks       regex/keyword checks before routing
+    route           route_agent; method=keyword|classifier|llm
+    agent           one agent call; route=desert|water|general
+    agent_llm       each LLM call (= agent iteration) inside an agent
+    tool            each tool call; tool=<name>
+    kb_embed / kb_search   query embedding / vector search; kb=desert|water
+    summary         background rolling-summary update
+    telegram_send   op=reply|placeholder|edit
+
+Counters and sizes kept by other modules (cache hits, resident sessions) are
+registered with `collect(name, help, kind, read)` and read when exported.
+
+Export, both off by default:
+    METRICS_PORT=9108                    # Prometheus text at :9108/metrics (JSON at /metrics.json)
+    METRICS_HOST=0.0.0.0                 # bind address; default 127.0.0.1, the endpoint has no auth
+    METRICS_DUMP_PATH=data/metrics.json  # JSON snapshot every METRICS_DUMP_INTERVAL_S (60)
+
+    python -m src.metrics data/metrics.json   # where the seconds go, from a dump
+"""
+import argparse
+import asyncio
+import bisect
+import contextvars
+import json
+import os
+import sys
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional, Sequence, Tuple
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+# The endpoint has no auth (unlike the admin-only /stats), so it only listens locally unless opened up
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_DUMP_PATH = os.getenv("METRICS_DUMP_PATH", "")
+METRICS_DUMP_INTERVAL_S = float(os.getenv("METRICS_DUMP_INTERVAL_S", "60"))
+# Recent samples kept per label set for the percentiles
+METRICS_WINDOW = int(os.getenv("METRICS_WINDOW", "2048"))
+
+# 4s and 7s line up with the speed_latency buckets in test_cases.py
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 4.0, 7.0, 10.0, 20.0, 30.0)
+COUNT_BUCKETS = (1, 2, 3, 4, 6, 8, 10, 12)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+# ----------------------------
+# Histograms
+# ----------------------------
+class _Series:
+    __slots__ = ("buckets", "count", "sum", "recent")
+
+    def __init__(self, n_buckets: int):
+        self.buckets = [0] * n_buckets  # non-cumulative; summed up when rendered
+        self.count = 0
+        self.sum = 0.0
+        self.recent: Deque[float] = deque(maxlen=METRICS_WINDOW)
+
+
+def _percentile(ordered: List[float], q: float) -> Optional[float]:
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class Histogram:
+    """One metric family; a series per label set. Thread-safe (tools run in worker threads)."""
+
+    def __init__(self, name: str, help_text: str, buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.bounds = tuple(buckets)
+        self._series: Dict[Labels, _Series] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = _Series(len(self.bounds) + 1)
+            series.buckets[bisect.bisect_left(self.bounds, value)] += 1
+            series.count += 1
+            series.sum += value
+            series.recent.append(value)
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        """count, sum, and p50/p95/p99 over the recent window, per label set."""
+        with self._lock:
+            items = [(key, s.count, s.sum, sorted(s.recent)) for key, s in self._series.items()]
+        out = []
+        for key, count, total, ordered in items:
+            out.append({
+                "labels": dict(key),
+                "count": count,
+                "sum": round(total, 6),
+                "p50": _percentile(ordered, 0.50),
+                "p95": _percentile(ordered, 0.95),
+                "p99": _percentile(ordered, 0.99),
+            })
+        return out
+
+    def percentile(self, q: float, **labels: str) -> Optional[float]:
+        with self._lock:
+            series = self._series.get(tuple(sorted(labels.items())))
+            ordered = sorted(series.recent) if series else []
+        return _percentile(ordered, q)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = [(key, list(s.buckets), s.count, s.sum) for key, s in sorted(self._series.items())]
+        for key, buckets, count, total in items:
+            base = ",".join(f'{k}="{_escape(v)}"' for k, v in key)
+            sep = "," if base else ""
+            running = 0
+            for bound, n in zip(self.bounds, buckets):
+                running += n
+                lines.append(f'{self.name}_bucket{{{base}{sep}le="{bound:g}"}} {running}')
+            lines.append(f'{self.name}_bucket{{{base}{sep}le="+Inf"}} {count}')
+            labels = f"{{{base}}}" if base else ""
+            lines.append(f"{self.name}_sum{labels} {total:.6f}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+    def reset(self) -> None:
+        with self._lock:
+            self._series.clear()
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+REGISTRY: Dict[str, Histogram] = {}
+
+
+def histogram(name: str, help_text: str, buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+    """Get or create the named histogram."""
+    if name not in REGISTRY:
+        REGISTRY[name] = Histogram(name, help_text, buckets)
+    return REGISTRY[name]
+
+
+# ----------------------------
+# Collected values
+# ----------------------------
+Samples = List[Tuple[Dict[str, str], float]]
+
+
+class Collected:
+    """A gauge or counter family whose values live elsewhere; `read()` returns them when exported."""
+
+    def __init__(self, name: str, help_text: str, kind: str, read: Callable[[], Samples]):
+        self.name = name
+        self.help = help_text
+        self.kind = kind
+        self.read = read
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        return [{"labels": dict(labels), "value": value} for labels, value in self.read()]
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for labels, value in self.read():
+            base = ",".join(f'{k}="{_escape(v)}"' for k, v in sorted(labels.items()))
+            lines.append(f"{self.name}{{{base}}} {value:g}" if base else f"{self.name} {value:g}")
+        return lines
+
+
+COLLECTED: Dict[str, Collected] = {}
+
+
+def collect(name: str, help_text: str, kind: str, read: Callable[[], Samples]) -> None:
+    """Export the values `read()` returns as a gauge or counter family (registering the name again replaces it)."""
+    COLLECTED[name] = Collected(name, help_text, kind, read)
+
+
+STAGE_SECONDS = histogram("jetset_stage_seconds", "Wall time per pipeline stage.")
+AGENT_ITERATIONS = histogram("jetset_agent_iterations", "LLM calls per agent run.", COUNT_BUCKETS)
+
+
+@contextmanager
+def span(stage: str, **labels: str) -> Iterator[Dict[str, str]]:
+    """Time the block into jetset_stage_seconds{stage=...}. Labels can still be set on the yielded dict."""
+    if not METRICS_ENABLED:
+        yield labels
+        return
+    start = time.perf_counter()
+    try:
+        yield labels
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - start, stage=stage, **labels)
+
+
+def observe(stage: str, seconds: float, **labels: str) -> None:
+    """Record a duration measured elsewhere (e.g. from a callback's start/end pair)."""
+    if METRICS_ENABLED:
+        STAGE_SECONDS.observe(seconds, stage=stage, **labels)
+
+
+def reset() -> None:
+    for hist in REGISTRY.values():
+        hist.reset()
+
+
+# ----------------------------
+# Agent callbacks
+# ----------------------------
+# LLM calls so far in the current agent_run() block; a one-item list so callbacks can add to it
+_iterations: contextvars.ContextVar[Optional[List[int]]] = contextvars.ContextVar("jetset_agent_iterations", default=None)
+
+
+class AgentMetrics(BaseCallbackHandler):
+    """Times each LLM call (agent iteration) and tool call of a route's agent runs.
+
+    One instance serves every concurrent run: starts are keyed by run id, and
+    iterations are counted on the agent_run() block the call was made in.
+    """
+
+    run_inline = True  # a dict update per event; not worth a thread hop, and agent_run() needs the caller's context
+    # Only LLM and tool events are timed (tool events are gated by ignore_agent); skip the rest of the run tree's
+    ignore_chain = True
+    ignore_retriever = True
+    ignore_custom_event = True
+
+    def __init__(self, route: str):
+        self.route = route
+        self._starts: Dict[UUID, float] = {}
+        self._tools: Dict[UUID, str] = {}
+
+    def on_chat_model_start(self, serialized: Dict[str, Any], messages: List[List[Any]], *, run_id: UUID, **kwargs: Any) -> None:
+        self._start_llm(run_id)
+
+    def on_llm_start(self, serialized: Dict[str, Any], prompts: List[str], *, run_id: UUID, **kwargs: Any) -> None:
+        self._start_llm(run_id)
+
+    def _start_llm(self, run_id: UUID) -> None:
+        count = _iterations.get()
+        if count is not None:
+            count[0] += 1
+        self._starts[run_id] = time.perf_counter()
+
+    def on_llm_end(self, response: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        self._finish(run_id, "agent_llm", route=self.route)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self._finish(run_id, "agent_llm", route=self.route)
+
+    def on_tool_start(self, serialized: Dict[str, Any], input_str: str, *, run_id: UUID, **kwargs: Any) -> None:
+        self._starts[run_id] = time.perf_counter()
+        self._tools[run_id] = (serialized or {}).get("name") or "unknown"
+
+    def on_tool_end(self, output: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        self._finish(run_id, "tool", tool=self._tools.pop(run_id, "unknown"))
+
+    def on_tool_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self._finish(run_id, "tool", tool=self._tools.pop(run_id, "unknown"))
+
+    def _finish(self, run_id: UUID, stage: str, **labels: str) -> None:
+        start = self._starts.pop(run_id, None)
+        if start is not None:
+            observe(stage, time.perf_counter() - start, **labels)
+
+
+@contextmanager
+def agent_run(route: str) -> Iterator[None]:
+    """Record the LLM calls AgentMetrics sees inside the block as one run's jetset_agent_iterations."""
+    if not METRICS_ENABLED:
+        yield
+        return
+    count = [0]
+    token = _iterations.set(count)
+    try:
+        yield
+    finally:
+        _iterations.reset(token)
+        if count[0]:
+            AGENT_ITERATIONS.observe(count[0], route=route)
+
+
+# ----------------------------
+# Export
+# ----------------------------
+def render_prometheus() -> str:
+    lines: List[str] = []
+    for hist in REGISTRY.values():
+        lines.extend(hist.render())
+    for family in COLLECTED.values():
+        lines.extend(family.render())
+    return "\n".join(lines) + "\n"
+
+
+def snapshot() -> Dict[str, Any]:
+    return {
+        "time": time.time(),
+        "metrics": {name: hist.snapshot() for name, hist in REGISTRY.items()},
+        "collected": {name: family.snapshot() for name, family in COLLECTED.items()},
+    }
+
+
+def write_snapshot(path: str) -> None:
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(snapshot(), f)
+    os.replace(tmp_path, path)
+
+
+async def dump_periodically(path: str, interval_s: float) -> None:
+    """Write a JSON snapshot to `path` every `interval_s` until cancelled (and once more then)."""
+    try:
+        while True:
+            await asyncio.sleep(interval_s)
+            await asyncio.to_thread(write_snapshot, path)
+    finally:
+        write_snapshot(path)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self) -> None:
+        if self.path.split("?")[0] == "/metrics":
+            body, ctype = render_prometheus().encode(), "text/plain; version=0.0.4"
+        elif self.path.split("?")[0] == "/metrics.json":
+            body, ctype = json.dumps(snapshot()).encode(), "application/json"
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", ctype)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass  # scraped every few seconds; don't spam stdout
+
+
+def start_http_server(port: int, host: str = METRICS_HOST) -> ThreadingHTTPServer:
+    """Serve /metrics (Prometheus text) and /metrics.json from a daemon thread."""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
+
+
+def format_table(data: Dict[str, Any]) -> str:
+    """Stage series sorted by total time: where the seconds go."""
+    rows = data["metrics"].get(STAGE_SECONDS.name, [])
+    rows = sorted(rows, key=lambda r: r["sum"], reverse=True)
+    lines = [f"{'stage':<34} {'count':>7} {'total s':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}"]
+    for r in rows:
+        labels = dict(r["labels"])
+        name = labels.pop("stage", "?")
+        if labels:
+            name += " " + ",".join(f"{k}={v}" for k, v in sorted(labels.items()))
+        ms = [f"{r[q] * 1000:>8.1f}" if r[q] is not None else f"{'-':>8}" for q in ("p50", "p95", "p99")]
+        lines.append(f"{name[:34]:<34} {r['count']:>7} {r['sum']:>9.2f} {' '.join(ms)}")
+    collected = format_collected(data)
+    if collected:
+        lines.append(f"\n{collected}")
+    return "\n".join(lines)
+
+
+def format_collected(data: Optional[Dict[str, Any]] = None) -> str:
+    """The collected values (of a snapshot(), default now) one per line, as `name labels value`."""
+    families = (data if data is not None else snapshot()).get("collected", {})
+    lines = []
+    for name, samples in families.items():
+        for sample in samples:
+            labels = ",".join(f"{k}={v}" for k, v in sorted(sample["labels"].items()))
+            lines.append(" ".join(part for part in (name.removeprefix("jetset_"), labels, f"{sample['value']:g}") if part))
+    return "\n".join(lines)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Show the per-stage latency table from a metrics JSON dump.")
+    parser.add_argument("path", nargs="?", default=METRICS_DUMP_PATH or "data/metrics.json")
+    args = parser.parse_args()
+    if not os.path.exists(args.path):
+        print(f"No metrics dump at {args.path} (set METRICS_DUMP_PATH on the bot)")
+        sys.exit(1)
+    with open(args.path, encoding="utf-8") as f:
+        print(format_table(json.load(f)))
+
+
+if __name__ == "__main__":
+    main()
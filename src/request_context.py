@@ -0,0 +1,61 @@
+"""
+Task-local request context.
+
+The Telegram handler opens a context per turn; tools read it instead of module
+globals, so concurrent turns (asyncio tasks or worker threads) never see each
+other's user. asyncio tasks copy the context on creation and LangChain copies it
+into executor threads for sync tools, so it follows the agent into every tool call.
+"""
+import contextvars
+import time
+import uuid
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Iterator, Optional
+
+
+@dataclass(frozen=True)
+class RequestContext:
+    user_id: str
+    trace_id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    deadline: Optional[float] = None  # time.monotonic() value the turn should finish by
+    started: float = field(default_factory=time.monotonic)  # when the update reached the handler
+
+    def remaining(self) -> Optional[float]:
+        """Seconds left before the deadline, or None if the turn has no deadline."""
+        if self.deadline is None:
+            return None
+        return self.deadline - time.monotonic()
+
+
+_current: contextvars.ContextVar[Optional[RequestContext]] = contextvars.ContextVar(
+    "jetset_request_context", default=None
+)
+
+
+def current_request() -> Optional[RequestContext]:
+    return _current.get()
+
+
+def current_user_id() -> Optional[str]:
+    ctx = _current.get()
+    return ctx.user_id if ctx else None
+
+
+@contextmanager
+def request_context(
+    user_id: str,
+    trace_id: Optional[str] = None,
+    timeout_s: Optional[float] = None,
+) -> Iterator[RequestContext]:
+    """Bind a RequestContext for the duration of the block (restored on exit)."""
+    ctx = RequestContext(
+        user_id=user_id,
+        trace_id=trace_id or uuid.uuid4().hex,
+        deadline=time.monotonic() + timeout_s if timeout_s is not None else None,
+    )
+    token = _current.set(ctx)
+    try:
+        yield ctx
+    finally:
+        _current.reset(token)
@@ -0,0 +1,347 @@
+"""
+Bounded per-user conversation state for the bot.
+
+One Session per Telegram user holds the chat memory, the last agent used, the
+accumulated booking summary, the message counter and both booking drafts, so a
+turn looks the user up once and a reset is a single swap. SessionManager keeps at
+most SESSION_MAX_RESIDENT of them in memory (least recently used first out)
+and evicts any session idle for longer than SESSION_TTL_S, so RSS no longer
+grows with every user who ever said "hi".
+
+With SESSION_SPILL_PATH set, evicted sessions are written to a SQLite file and
+restored on the user's next message instead of starting from scratch. Spilled
+sessions are dropped after SESSION_SPILL_TTL_S. Drafts go with them; with
+BOOKING_STORE=sqlite they are also kept in the booking database (see
+src/booking_store.py).
+
+    python -m src.sessions          # spilled sessions / size of the spill file
+"""
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+# Allow running as a script: `python src/sessions.py`
+if __package__ is None and __name__ == "__main__":
+    sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from langchain_core.messages import messages_from_dict, messages_to_dict
+
+from src import metrics
+from src.history import TokenBudgetMemory, new_memory
+
+SESSION_TTL_S = float(os.getenv("SESSION_TTL_S", str(6 * 3600)))
+SESSION_MAX_RESIDENT = int(os.getenv("SESSION_MAX_RESIDENT", "10000"))
+# Empty means evicted sessions are simply forgotten
+SESSION_SPILL_PATH = os.getenv("SESSION_SPILL_PATH", "")
+SESSION_SPILL_TTL_S = float(os.getenv("SESSION_SPILL_TTL_S", str(7 * 24 * 3600)))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    user_id TEXT PRIMARY KEY,
+    data TEXT NOT NULL,
+    last_seen REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS sessions_last_seen ON sessions (last_seen);
+"""
+_SELECT = "SELECT data FROM sessions WHERE user_id = ?"
+_DELETE = "DELETE FROM sessions WHERE user_id = ?"
+_UPSERT = "INSERT OR REPLACE INTO sessions (user_id, data, last_seen) VALUES (?, ?, ?)"
+_COUNT = "SELECT COUNT(*) FROM sessions"
+_PURGE = "DELETE FROM sessions WHERE last_seen < ?"
+
+# Seconds between purges of expired rows from the spill file
+_PURGE_INTERVAL_S = 3600.0
+
+
+class Session:
+    """Everything the bot remembers about one user between messages."""
+
+    __slots__ = (
+        "user_id",
+        "memory",
+        "last_agent",
+        "summary",
+        "message_count",
+        "desert_draft",
+        "water_draft",
+        "last_seen",
+    )
+    # Saved when the session is spilled; memory is stored as its messages plus the turns
+    # folded out of it that no summary has taken in yet
+    _SNAPSHOT = ("last_agent", "summary", "message_count", "desert_draft", "water_draft")
+
+    def __init__(self, user_id: str):
+        self.user_id = user_id
+        self.memory: Optional[TokenBudgetMemory] = None  # created on first use
+        self.last_agent: Optional[str] = None
+        self.summary: Optional[str] = None
+        self.message_count: Optional[int] = None
+        self.desert_draft: Optional[Dict[str, Any]] = None  # BOOKINGS[user_id]
+        self.water_draft: Optional[Dict[str, Any]] = None  # WATER_BOOKINGS[user_id]
+        self.last_seen = time.monotonic()
+
+    def get_memory(self) -> TokenBudgetMemory:
+        if self.memory is None:
+            self.memory = new_memory()
+        return self.memory
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = {name: getattr(self, name) for name in self._SNAPSHOT}
+        messages = self.memory.chat_memory.messages if self.memory is not None else None
+        data["messages"] = messages_to_dict(messages) if messages is not None else None
+        folded = self.memory.folded() if self.memory is not None else []
+        data["folded"] = messages_to_dict(folded) if folded else None
+        return data
+
+    @classmethod
+    def from_dict(cls, user_id: str, data: Dict[str, Any]) -> "Session":
+        session = cls(user_id)
+        for name in cls._SNAPSHOT:
+            setattr(session, name, data.get(name))
+        if data.get("messages") is not None:
+            session.get_memory().chat_memory.messages = messages_from_dict(data["messages"])
+        if data.get("folded"):
+            # The next turn's _schedule_summary sees has_folded() and summarizes them
+            session.get_memory().restore_folded(messages_from_dict(data["folded"]))
+        return session
+
+
+class SessionSpill:
+    """SQLite (WAL) table of evicted sessions, keyed by user_id. Thread-safe."""
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+
+    def put(self, user_id: str, data: Dict[str, Any]) -> None:
+        with self._lock:
+            self._conn.execute(_UPSERT, (user_id, json.dumps(data, separators=(",", ":")), time.time()))
+
+    def pop(self, user_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute(_SELECT, (user_id,)).fetchone()
+            if row is None:
+                return None
+            self._conn.execute(_DELETE, (user_id,))
+        return json.loads(row[0])
+
+    def purge(self, max_age_s: float) -> int:
+        with self._lock:
+            return self._conn.execute(_PURGE, (time.time() - max_age_s,)).rowcount
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute(_COUNT).fetchone()[0]
+
+
+class SessionManager:
+    """Owns every user's Session: LRU + TTL eviction, optional spill to disk, counters."""
+
+    def __init__(
+        self,
+        ttl_s: float = SESSION_TTL_S,
+        max_resident: int = SESSION_MAX_RESIDENT,
+        spill_path: str = SESSION_SPILL_PATH,
+        spill_ttl_s: float = SESSION_SPILL_TTL_S,
+    ):
+        self.ttl_s = ttl_s
+        self.max_resident = max_resident
+        self.spill_ttl_s = spill_ttl_s
+        self.spill = SessionSpill(spill_path) if spill_path else None
+        self._sessions: "OrderedDict[str, Session]" = OrderedDict()  # least recently used first
+        self._pins: Dict[str, int] = {}  # user_id -> turns in flight; pinned sessions are never evicted
+        self._lock = threading.RLock()
+        self._last_purge = 0.0
+        self._reset_hooks: List[Callable[[str], None]] = []
+        self.counters = {
+            "created": 0,
+            "restored": 0,
+            "evicted_ttl": 0,
+            "evicted_lru": 0,
+            "spilled": 0,
+            "spill_expired": 0,
+            "resets": 0,
+        }
+
+    # ----------------------------
+    # Lookup
+    # ----------------------------
+    def get(self, user_id: str) -> Session:
+        """The user's session, restored from the spill file or created if needed."""
+        with self._lock:
+            session = self._sessions.get(user_id)
+            if session is None:
+                session = self._restore(user_id) or self._create(user_id)
+                self._sessions[user_id] = session
+            else:
+                self._sessions.move_to_end(user_id)
+            session.last_seen = time.monotonic()
+            self._evict(keep=user_id)
+            return session
+
+    def peek(self, user_id: str) -> Optional[Session]:
+        """The resident session, if any, without touching LRU order or the spill file."""
+        return self._sessions.get(user_id)
+
+    def find(self, user_id: str) -> Optional[Session]:
+        """The user's session if they have one, resident or spilled; never creates one."""
+        session = self._sessions.get(user_id)
+        if session is not None or self.spill is None:
+            return session
+        with self._lock:
+            session = self._sessions.get(user_id) or self._restore(user_id)
+            if session is not None:
+                self._sessions[user_id] = session
+            return session
+
+    def _create(self, user_id: str) -> Session:
+        self.counters["created"] += 1
+        return Session(user_id)
+
+    def _restore(self, user_id: str) -> Optional[Session]:
+        if self.spill is None:
+            return None
+        data = self.spill.pop(user_id)
+        if data is None:
+            return None
+        self.counters["restored"] += 1
+        return Session.from_dict(user_id, data)
+
+    @contextmanager
+    def hold(self, user_id: str) -> Iterator[Session]:
+        """Pin the user's session for the length of a turn so eviction can't drop it mid-turn."""
+        with self._lock:
+            self._pins[user_id] = self._pins.get(user_id, 0) + 1
+        try:
+            yield self.get(user_id)
+        finally:
+            with self._lock:
+                self._pins[user_id] -= 1
+                if not self._pins[user_id]:
+                    del self._pins[user_id]
+
+    # ----------------------------
+    # Eviction
+    # ----------------------------
+    def _evict(self, keep: Optional[str] = None) -> None:
+        # The OrderedDict is in last-use order, so expired sessions are all at the front
+        deadline = time.monotonic() - self.ttl_s
+        overflow = len(self._sessions) - self.max_resident
+        for user_id, session in list(self._sessions.items()):
+            expired = session.last_seen < deadline
+            if not expired and overflow <= 0:
+                break
+            if user_id in self._pins or user_id == keep:
+                continue
+            self._drop(user_id, session)
+            self.counters["evicted_ttl" if expired else "evicted_lru"] += 1
+            overflow -= 1
+        self._purge_spill()
+
+    def _drop(self, user_id: str, session: Session) -> None:
+        del self._sessions[user_id]
+        if self.spill is not None:
+            self.spill.put(user_id, session.to_dict())
+            self.counters["spilled"] += 1
+
+    def _purge_spill(self) -> None:
+        now = time.monotonic()
+        if self.spill is None or now - self._last_purge < _PURGE_INTERVAL_S:
+            return
+        self._last_purge = now
+        self.counters["spill_expired"] += self.spill.purge(self.spill_ttl_s)
+
+    def sweep(self) -> None:
+        """Evict expired sessions now (lookups also do this as a side effect)."""
+        with self._lock:
+            self._evict()
+
+    # ----------------------------
+    # Reset
+    # ----------------------------
+    def on_reset(self, hook: Callable[[str], None]) -> None:
+        """Call `hook(user_id)` on every reset, e.g. to drop rows a durable booking store keeps."""
+        self._reset_hooks.append(hook)
+
+    def reset(self, user_id: str) -> Session:
+        """Start the user over: history, agent, summary, counters and both drafts in one swap."""
+        with self._lock:
+            if self.spill is not None:
+                self.spill.pop(user_id)
+            # Callers holding the old session must switch to the returned one
+            session = self._sessions[user_id] = Session(user_id)
+            self._sessions.move_to_end(user_id)
+            self.counters["resets"] += 1
+            for hook in self._reset_hooks:
+                hook(user_id)
+            return session
+
+    def clear(self) -> None:
+        with self._lock:
+            self._sessions.clear()
+
+    def __contains__(self, user_id: object) -> bool:
+        return user_id in self._sessions
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(list(self._sessions))
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            return {
+                "resident": len(self._sessions),
+                "pinned": len(self._pins),
+                "spilled_now": len(self.spill) if self.spill is not None else 0,
+                "max_resident": self.max_resident,
+                "ttl_s": self.ttl_s,
+                **self.counters,
+            }
+
+
+# The one session manager per process, shared by the bot and the booking stores
+SESSIONS = SessionManager()
+
+
+def _session_states() -> metrics.Samples:
+    stats = SESSIONS.stats()
+    return [({"state": state}, stats[state]) for state in ("resident", "pinned", "spilled_now")]
+
+
+metrics.collect("jetset_sessions", "Sessions in memory (resident, pinned by a turn in flight) and on disk (spilled_now).",
+                "gauge", _session_states)
+metrics.collect("jetset_session_events_total", "Sessions created, restored, evicted, spilled, expired and reset.",
+                "counter", lambda: [({"event": event}, n) for event, n in SESSIONS.counters.items()])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Inspect the session spill file.")
+    parser.add_argument("--path", default=SESSION_SPILL_PATH or "data/sessions.sqlite3")
+    parser.add_argument("--purge", action="store_true", help="Drop sessions older than SESSION_SPILL_TTL_S")
+    args = parser.parse_args()
+    if not os.path.exists(args.path):
+        print(f"No session spill file at {args.path}")
+        return
+    spill = SessionSpill(args.path)
+    if args.purge:
+        print(f"Purged {spill.purge(SESSION_SPILL_TTL_S)} expired sessions")
+    size_kb = os.path.getsize(args.path) / 1024
+    print(f"{args.path}: {len(spill)} spilled sessions, {size_kb:.0f} KB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+"""
+Progressive Telegram replies.
+
+Instead of one message after the whole agent run, the bot sends a placeholder
+as soon as a turn starts and edits it as the answer's tokens arrive. Telegram
+rate-limits edits (roughly one per second per chat before RetryAfter), so edits
+are throttled to STREAM_EDIT_INTERVAL_S with at most one in flight; tokens that
+arrive in between are picked up by the next edit. The last edit always carries
+the complete, filtered reply; while streaming, a `preview` function decides
+which part of the partial answer is safe to show.
+
+Time to first byte (TTFB) -- from the update reaching on_message to the first
+answer text on the user's screen -- is recorded for every turn, streamed or not,
+in the jetset_reply_ttfb_seconds histogram (see src/metrics.py).
+
+    STREAM_REPLIES=0                  # one reply_text per turn, as before
+    STREAM_EDIT_INTERVAL_S=1.0        # minimum gap between edits of one message
+"""
+import asyncio
+import os
+import time
+from contextlib import suppress
+from typing import Any, Callable, Dict, List, Optional
+
+from langchain_core.callbacks import AsyncCallbackHandler
+from telegram.error import BadRequest, RetryAfter, TelegramError
+
+from src import metrics
+
+STREAM_REPLIES = os.getenv("STREAM_REPLIES", "1") == "1"
+STREAM_PLACEHOLDER = os.getenv("STREAM_PLACEHOLDER", "…")
+STREAM_EDIT_INTERVAL_S = float(os.getenv("STREAM_EDIT_INTERVAL_S", "1.0"))
+# Telegram rejects longer message texts; previews are cut to this
+TELEGRAM_MAX_MESSAGE_LEN = 4096
+
+
+# ----------------------------
+# TTFB / edit stats
+# ----------------------------
+REPLY_TTFB = metrics.histogram("jetset_reply_ttfb_seconds", "Update received to first answer text on screen.")
+PLACEHOLDER_LATENCY = metrics.histogram("jetset_reply_placeholder_seconds", "Update received to placeholder sent.")
+counters: Dict[str, int] = {"turns": 0, "streamed": 0, "edits": 0, "edit_errors": 0, "retry_after": 0}
+
+
+def _pct_ms(hist: metrics.Histogram, q: float) -> Optional[float]:
+    value = hist.percentile(q)
+    return round(value * 1000, 1) if value is not None else None
+
+
+def stats() -> Dict[str, Any]:
+    """Counters plus TTFB / placeholder latency percentiles (ms) over the last turns."""
+    return {
+        **counters,
+        "ttfb_p50_ms": _pct_ms(REPLY_TTFB, 0.50),
+        "ttfb_p95_ms": _pct_ms(REPLY_TTFB, 0.95),
+        "placeholder_p50_ms": _pct_ms(PLACEHOLDER_LATENCY, 0.50),
+    }
+
+
+def reset_stats() -> None:
+    REPLY_TTFB.reset()
+    PLACEHOLDER_LATENCY.reset()
+    for key in counters:
+        counters[key] = 0
+
+
+# ----------------------------
+# Reply stream
+# ----------------------------
+def _retry_after_s(error: RetryAfter) -> float:
+    value = error.retry_after
+    return value.total_seconds() if hasattr(value, "total_seconds") else float(value)
+
+
+class ReplyStream:
+    """One turn's reply: a placeholder, throttled edits while the answer streams, then the final text."""
+
+    def __init__(self, message: Any, started: Optional[float] = None):
+        self._message = message  # the user's telegram.Message we reply to
+        self._started = started if started is not None else time.monotonic()
+        self._sent: Any = None  # our placeholder message, once sent
+        self._preview: Callable[[str], str] = str.strip
+        self._raw = ""
+        self._version = 0  # bumped by every feed(); the pump stops once it has shown the latest
+        self._shown_version = 0
+        self._shown = ""
+        self._next_edit = 0.0
+        self._pump: Optional["asyncio.Task[None]"] = None
+        self._disabled = False  # an edit failed for good; only the final reply is sent
+        self._first_text_at: Optional[float] = None
+
+    async def open(self) -> None:
+        """Send the placeholder (no-op with STREAM_REPLIES=0)."""
+        if not STREAM_REPLIES or self._sent is not None:
+            return
+        try:
+            with metrics.span("telegram_send", op="placeholder"):
+                self._sent = await self._message.reply_text(STREAM_PLACEHOLDER)
+        except TelegramError:
+            return  # no placeholder; finish() falls back to a plain reply
+        PLACEHOLDER_LATENCY.observe(time.monotonic() - self._started)
+
+    def tokens(self, preview: Callable[[str], str] = str.strip) -> Optional[List[AsyncCallbackHandler]]:
+        """Callbacks for an LLM/agent call whose answer should stream into this reply."""
+        if self._sent is None:
+            return None
+        self._preview = preview
+        return [_TokenFeed(self)]
+
+    def feed(self, raw: str) -> None:
+        """The answer so far. Cheap: the preview is only computed when an edit is due."""
+        if self._sent is None or self._disabled:
+            return
+        self._raw = raw
+        self._version += 1
+        if self._pump is None:
+            self._pump = asyncio.create_task(self._run_pump())
+
+    async def _run_pump(self) -> None:
+        try:
+            while self._version != self._shown_version and not self._disabled:
+                delay = self._next_edit - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                self._shown_version = self._version
+                text = self._preview(self._raw)[:TELEGRAM_MAX_MESSAGE_LEN]
+                if text and text != self._shown:
+                    await self._edit(text)
+        finally:
+            self._pump = None
+
+    async def _edit(self, text: str) -> bool:
+        try:
+            with metrics.span("telegram_send", op="edit"):
+                await self._sent.edit_text(text)
+        except RetryAfter as e:
+            counters["retry_after"] += 1
+            self._next_edit = time.monotonic() + _retry_after_s(e)
+            return False
+        except BadRequest as e:
+            if "not modified" in str(e).lower():
+                self._shown = text
+                self._mark_first_text()
+                return True
+            counters["edit_errors"] += 1
+            self._disabled = True
+            return False
+        except TelegramError:
+            counters["edit_errors"] += 1
+            self._disabled = True
+            return False
+        counters["edits"] += 1
+        self._shown = text
+        self._next_edit = time.monotonic() + STREAM_EDIT_INTERVAL_S
+        self._mark_first_text()
+        return True
+
+    def _mark_first_text(self) -> None:
+        if self._first_text_at is None:
+            self._first_text_at = time.monotonic()
+            REPLY_TTFB.observe(self._first_text_at - self._started)
+
+    async def finish(self, text: str) -> None:
+        """Show the complete reply: edit the placeholder, or reply normally if there is none."""
+        counters["turns"] += 1
+        if self._pump is not None:
+            self._pump.cancel()
+            with suppress(asyncio.CancelledError):
+                await self._pump
+        if self._sent is None:
+            with metrics.span("telegram_send", op="reply"):
+                await self._message.reply_text(text)
+            self._mark_first_text()
+            return
+        counters["streamed"] += 1
+        if text == self._shown:
+            return
+        # The final edit isn't throttled: it's one more edit, and the user is waiting for it
+        self._disabled = False
+        if await self._edit(text):
+            return
+        if not self._disabled:
+            # Rate limited: wait it out once rather than send a second message into the flood
+            await asyncio.sleep(max(0.0, self._next_edit - time.monotonic()))
+            if await self._edit(text):
+                return
+        # Couldn't edit (deleted placeholder, too long, rate limited): send the reply on its own
+        with suppress(TelegramError):
+            await self._sent.delete()
+        with metrics.span("telegram_send", op="reply"):
+            await self._message.reply_text(text)
+        self._mark_first_text()
+
+
+class _TokenFeed(AsyncCallbackHandler):
+    """Feeds the text of the current chat model call to a ReplyStream.
+
+    Each agent step is a new chat model call; a step that ends in tool calls
+    usually has no text, and whatever it had is replaced by the next step's.
+    """
+
+    run_inline = True  # feed() only stores the text; skip the task LangChain would start per token
+
+    def __init__(self, stream: ReplyStream):
+        self._stream = stream
+        self._text = ""
+
+    async def on_chat_model_start(self, serialized: Dict[str, Any], messages: List[List[Any]], **kwargs: Any) -> None:
+        self._text = ""
+
+    async def on_llm_new_token(self, token: str, **kwargs: Any) -> None:
+        if token:
+            self._text += token
+            self._stream.feed(self._text)
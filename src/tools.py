@@ -1,5 +1,6 @@
 import os
 import json
+import asyncio
 from datetime import datetime, time, timedelta
 from zoneinfo import ZoneInfo
 from typing import Any, Dict, Optional
@@ -7,42 +8,77 @@ from typing import Any, Dict, Optional
 from dotenv import load_dotenv
 load_dotenv(dotenv_path=os.path.join(os.getcwd(), ".env"))
 
-from langchain_openai import OpenAIEmbeddings
-from langchain_chroma import Chroma
 from langchain_core.tools import tool
 
+from src import desert_pricing, metrics
+from src.booking_store import make_booking_store, saves_draft
+from src.embedding_cache import CachedEmbeddings, get_shared_embeddings
+from src.kb_cache import FixedQueryCache
+from src.kb_manifest import LiveCollection
+
 # ----------------------------
 # Env
 # ----------------------------
 CHROMA_DIR = os.getenv("CHROMA_DIR", "data/chroma_db")
 CHROMA_COLLECTION = os.getenv("CHROMA_COLLECTION", "jetset_kb")
 EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-3-small")
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL") or None
 TZ = os.getenv("TZ", "Asia/Dubai")
+# ISO datetime the date tool reports instead of the clock, so recorded eval runs replay (see test_cases.py)
+FROZEN_NOW = os.getenv("FROZEN_NOW") or None
 JETSET_LOCATION_REFERENCE = "Jetset Desert Camp, Dubai"
 
 # ----------------------------
 # Vector DB / Retriever
 # ----------------------------
-_embeddings = OpenAIEmbeddings(model=EMBEDDING_MODEL)
-_db = Chroma(
-    collection_name=CHROMA_COLLECTION,
-    persist_directory=CHROMA_DIR,
-    embedding_function=_embeddings,
-)
-
-def _search(query: str, k: int = 6) -> Dict[str, Any]:
-    docs = _db.similarity_search(query, k=k)
+def _embeddings() -> CachedEmbeddings:
+    # Query embeddings go through the shared on-disk cache (see src/embedding_cache.py)
+    return get_shared_embeddings(EMBEDDING_MODEL, OPENAI_BASE_URL)
+
+# Follows the manifest written by the ingest scripts (see src/kb_manifest.py); opened on first search
+_db = LiveCollection(CHROMA_DIR, CHROMA_COLLECTION, _embeddings)
+
+def open_kb() -> None:
+    """Open the Chroma collection and the embeddings client now instead of on the first search."""
+    _db.get()
+
+async def _asearch(query: str, k: int = 6) -> Dict[str, Any]:
+    # Embed over the async HTTP client, then run the local vector lookup off the event loop
+    with metrics.span("kb_embed", kb="desert"):
+        embedding = await _embeddings().aembed_query(query)
+    with metrics.span("kb_search", kb="desert"):
+        docs = await asyncio.to_thread(_db.get().similarity_search_by_vector, embedding, k=k)
     matches = [{"text": d.page_content, "meta": d.metadata} for d in docs]
     return {"query": query, "matches": matches}
 
+# Tools whose query never changes are served from memory until the KB is re-ingested
+_fixed_results = FixedQueryCache(_db, "desert")
+ABOUT_QUERY = "About Jetset Dubai desert tours company overview"
+LOCATION_QUERY = "Jetset Dubai location address contact phone map"
+PACKAGE_ACTIVITIES = ("buggy", "quad", "safari", "all")
+
+def _packages_query(activity: str) -> str:
+    return f"Packages prices durations for {activity} tours Jetset Dubai"
+
+async def _fixed_search_json(query: str, k: int) -> str:
+    async def compute() -> str:
+        return json.dumps(await _asearch(query, k=k))
+    return await _fixed_results.get(f"{k}:{query}", compute)
+
+async def warm_fixed_queries() -> None:
+    """Fill the fixed-query cache so the first booking turn doesn't pay for the searches."""
+    queries = [(ABOUT_QUERY, 6), (LOCATION_QUERY, 6)] + [(_packages_query(a), 8) for a in PACKAGE_ACTIVITIES]
+    await asyncio.gather(*(_fixed_search_json(q, k) for q, k in queries))
+
 # ----------------------------
-# Booking Store (replace later with DB/Redis)
+# Booking Store (in-memory or SQLite, see src/booking_store.py)
 # ----------------------------
-BOOKINGS: Dict[str, Dict[str, Any]] = {}
+BOOKINGS = make_booking_store("desert")
 
 def _get_or_create_booking(user_id: str) -> Dict[str, Any]:
-    if user_id not in BOOKINGS:
-        BOOKINGS[user_id] = {
+    draft = BOOKINGS.get(user_id)
+    if draft is None:
+        draft = {
             "status": "collecting",          # collecting | ready_to_confirm | confirmed
             "customer_name": None,
             "activity": None,                # buggy | quad | safari
@@ -58,9 +94,10 @@ def _get_or_create_booking(user_id: str) -> Dict[str, Any]:
             "items": [],                     # list of activity line items
             "notes": []
         }
+        BOOKINGS[user_id] = draft
     else:
-        BOOKINGS[user_id].setdefault("items", [])
-    return BOOKINGS[user_id]
+        draft.setdefault("items", [])
+    return draft
 
 def _normalize_bool(v: Any) -> Optional[bool]:
     if v is None:
@@ -124,54 +161,55 @@ def _within_open_hours_start_end(start_dt: datetime, duration_min: int) -> bool:
 @tool
 def current_datetime_tool(tz: str = "Asia/Dubai") -> str:
     """Return the current datetime (ISO string) in the given timezone. Used to resolve 'tomorrow', etc."""
-    now = datetime.now(ZoneInfo(tz))
+    now = datetime.fromisoformat(FROZEN_NOW).astimezone(ZoneInfo(tz)) if FROZEN_NOW else datetime.now(ZoneInfo(tz))
     return json.dumps({"tz": tz, "now_iso": now.isoformat()})
 
 
 @tool
-def retrieval_tool(query: str, k: int = 6) -> str:
+async def retrieval_tool(query: str, k: int = 6) -> str:
     """Search the Jetset knowledge base (Chroma) for factual answers and return top matching chunks."""
-    return json.dumps(_search(query=query, k=k))
+    return json.dumps(await _asearch(query=query, k=k))
 
 
 @tool
-def about_tool() -> str:
+async def about_tool() -> str:
     """Return 'About Jetset Dubai' information from the knowledge base."""
-    return json.dumps(_search("About Jetset Dubai desert tours company overview", k=6))
+    return await _fixed_search_json(ABOUT_QUERY, k=6)
 
 
 @tool
-def location_tool() -> str:
+async def location_tool() -> str:
     """Return Jetset Dubai location/contact/map details from the knowledge base."""
-    return json.dumps(_search("Jetset Dubai location address contact phone map", k=6))
+    return await _fixed_search_json(LOCATION_QUERY, k=6)
 
 
 @tool
-def packages_tool(activity: str = "all") -> str:
+async def packages_tool(activity: str = "all") -> str:
     """Return packages/prices/durations from the knowledge base for activity: buggy, quad, safari, or all."""
     activity = (activity or "all").lower().strip()
-    if activity not in {"buggy", "quad", "safari", "all"}:
+    if activity not in PACKAGE_ACTIVITIES:
         activity = "all"
-    q = f"Packages prices durations for {activity} tours Jetset Dubai"
-    return json.dumps(_search(q, k=8))
+    return await _fixed_search_json(_packages_query(activity), k=8)
 
 
 @tool
-def faq_tool(question: str = "") -> str:
+async def faq_tool(question: str = "") -> str:
     """Return policy/FAQ answers from the knowledge base (age limits, rules, refunds, safety, etc.)."""
     q = "Jetset Dubai FAQ policies rules"
     if question.strip():
         q = f"{q}. User question: {question}"
-    return json.dumps(_search(q, k=8))
+    return json.dumps(await _asearch(q, k=8))
 
 
 @tool
+@saves_draft(BOOKINGS)
 def booking_get_or_create(user_id: str) -> str:
     """Get or create a booking draft object for a given Telegram user_id."""
     draft = _get_or_create_booking(user_id)
     return json.dumps(draft)
 
 @tool
+@saves_draft(BOOKINGS)
 def booking_update(
     user_id: str,
     patch: Optional[dict] = None,
@@ -339,13 +377,8 @@ def booking_update(
     return json.dumps(draft)
 
 # ----------------------------
-# Pricing rules (placeholder until we map full doc tables)
+# Pricing (catalog extracted from the KB by src/ingest.py, see src/desert_pricing.py)
 # ----------------------------
-# Buggy pricing depends on vehicle_model (2-seat vs 4-seat), NOT on seats field.
-BUGGY_2_SEAT = {30: 400, 60: 750, 90: 1150, 120: 1500}
-BUGGY_4_SEAT = {30: 600, 60: 1150, 90: 1750, 120: 2300}
-
-PICKUP_FEE = 350
 CARD_VAT_MULTIPLIER = 1.05
 
 def _parse_start_dt(dt_value: str) -> Optional[datetime]:
@@ -370,29 +403,29 @@ def _validate_booking_time(dt_value: Optional[str], duration_min: Optional[int])
     
     return None
 
-def _is_buggy_4_seat(vehicle_model: Optional[str]) -> bool:
-    """Determine if buggy is 4-seat based on vehicle model. Defaults to 2-seat if ambiguous."""
-    if not vehicle_model:
-        return False
-    
-    s = str(vehicle_model).lower().strip()
-    
-    # Check for 4-seat explicitly
-    if "4" in s and ("seat" in s or "seater" in s):
-        return True
-    
-    # Check for 2-seat explicitly (priority: if 2-seat is mentioned, it's definitely 2-seat)
-    if "2" in s and ("seat" in s or "seater" in s):
-        return False
-    
-    # Default: if no seat info, assume 2-seat
-    return False
+def _quote_draft(draft: Dict[str, Any]) -> Dict[str, Any]:
+    """Itemized price for every line of the draft, plus pickup and card VAT."""
+    bookings = draft.get("items") or [draft]
+    lines = [
+        desert_pricing.price_item(
+            activity=booking.get("activity") or draft.get("activity"),
+            quantity=booking.get("quantity"),
+            vehicle_model=booking.get("vehicle_model") or draft.get("vehicle_model"),
+            duration_min=booking.get("duration_min"),
+            package=booking.get("package") or draft.get("package"),
+        )
+        for booking in bookings
+    ]
+    return desert_pricing.quote(lines, draft.get("pickup_required"), draft.get("payment_method"))
 
 @tool
+@saves_draft(BOOKINGS)
 def booking_compute_price(user_id: str) -> str:
     """
-    Compute total price deterministically:
-    - Buggy/Quad: price per vehicle
+    Compute total price deterministically from the desert catalog:
+    - Buggy/Quad: price per vehicle for the model and duration
+    - Safari: shared per passenger, private per car
+    - Mixed items are priced line by line
     - Pickup +350 AED if pickup_required
     - Card adds 5% VAT
     - Time must fit inside 9am–7pm INCLUDING duration
@@ -401,7 +434,6 @@ def booking_compute_price(user_id: str) -> str:
 
     dt_iso = draft.get("date_time_iso")
     dur = draft.get("duration_min")
-    qty = draft.get("quantity")
     items = draft.get("items") or []
 
     # Validate items or single booking
@@ -422,55 +454,26 @@ def booking_compute_price(user_id: str) -> str:
         if time_error:
             return json.dumps({"error": time_error, "draft": draft})
 
-    # Calculate price
-    base = 0.0
-    if items:
-        needs_kb = False
-        for item in items:
-            activity_val = (item.get("activity") or "").strip().lower()
-            if activity_val == "buggy":
-                if not item.get("quantity") or not item.get("duration_min"):
-                    return json.dumps({"error": "Missing quantity or duration for buggy booking.", "draft": draft})
-                table = BUGGY_4_SEAT if _is_buggy_4_seat(item.get("vehicle_model")) else BUGGY_2_SEAT
-                if int(item["duration_min"]) not in table:
-                    return json.dumps({"error": "Unsupported buggy duration. Please choose 30, 60, 90, or 120 minutes.", "draft": draft})
-                base += table[int(item["duration_min"])] * int(item["quantity"])
-            else:
-                needs_kb = True
-        if needs_kb:
-            return json.dumps({
-                "needs_pricing_from_kb": True,
-                "message": "Multi-activity pricing should be retrieved from the knowledge base.",
-                "draft": draft
-            })
-    else:
-        if draft.get("activity") == "buggy":
-            if not qty or not dur:
-                return json.dumps({"error": "Missing quantity or duration for buggy booking.", "draft": draft})
-            table = BUGGY_4_SEAT if _is_buggy_4_seat(draft.get("vehicle_model")) else BUGGY_2_SEAT
-            if int(dur) not in table:
-                return json.dumps({"error": "Unsupported buggy duration. Please choose 30, 60, 90, or 120 minutes.", "draft": draft})
-            base = table[int(dur)] * int(qty)
-        else:
-            # Fallback: quad, safari, or unknown activity pricing must be fetched from KB
-            return json.dumps({
-                "needs_pricing_from_kb": True,
-                "message": f"{(draft.get('activity') or 'Unknown').capitalize()} pricing should be retrieved from the knowledge base.",
-                "draft": draft
-            })
-
-    if draft.get("pickup_required") is True:
-        base += PICKUP_FEE
-
-    if (draft.get("payment_method") or "").lower() == "card":
-        base *= CARD_VAT_MULTIPLIER
-
-    draft["price_aed"] = round(base, 2)
+    try:
+        price_quote = _quote_draft(draft)
+    except FileNotFoundError:
+        # No extracted catalog yet (ingest.py not run): let the agent use the KB
+        return json.dumps({
+            "needs_pricing_from_kb": True,
+            "message": f"{(draft.get('activity') or 'Unknown').capitalize()} pricing should be retrieved from the knowledge base.",
+            "draft": draft
+        })
+    except desert_pricing.PricingError as e:
+        return json.dumps({"error": str(e), "draft": draft})
+
+    draft["price_aed_base"] = price_quote["subtotal"]
+    draft["price_aed"] = price_quote["total"]
     BOOKINGS[user_id] = draft
 
-    return json.dumps({"price_aed": draft["price_aed"], "draft": draft})
+    return json.dumps({"price_aed": draft["price_aed"], "quote": price_quote, "draft": draft})
 
 @tool
+@saves_draft(BOOKINGS)
 def booking_confirm(user_id: str) -> str:
     """Confirm a booking if the draft is complete and a price has been computed."""
     draft = _get_or_create_booking(user_id)
@@ -0,0 +1,266 @@
+"""
+Token and cost accounting.
+
+Every LLM call made for a turn reports its usage (prompt, cached prompt and
+completion tokens) to the `ACCOUNTANT` callback handler, which the bot passes in
+the config of each router / agent / general / summary call. Embedding calls that
+miss the cache in src/embedding_cache.py are counted by `record_embedding`.
+Usage is added up three ways:
+
+    per turn    `with usage.turn() as spent:` -- logged by the bot after each reply
+    per route   desert / water / general / router / summary (/ judge in test_cases.py)
+    per user    the USAGE_MAX_USERS most recently active users
+
+The route and user come from the task's context (`usage.route(...)` and the
+RequestContext), so tool calls in worker threads and background tasks are
+attributed to the turn that started them. Costs use PRICES (USD per 1M tokens);
+override or extend it with USAGE_PRICES_JSON='{"my-model": {"input": 1, "cached": 0.5, "output": 2}}'.
+ChatOpenAI only reports usage for streamed calls with stream_usage=True.
+"""
+import contextvars
+import json
+import os
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, Iterator, List, Optional
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+from src.request_context import current_user_id
+
+USAGE_MAX_USERS = int(os.getenv("USAGE_MAX_USERS", "10000"))
+
+# USD per 1M tokens; models are matched by longest prefix, so dated snapshots share a price
+PRICES: Dict[str, Dict[str, float]] = {
+    "gpt-4.1-mini": {"input": 0.40, "cached": 0.10, "output": 1.60},
+    "gpt-4.1-nano": {"input": 0.10, "cached": 0.025, "output": 0.40},
+    "gpt-4.1": {"input": 2.00, "cached": 0.50, "output": 8.00},
+    "gpt-4o-mini": {"input": 0.15, "cached": 0.075, "output": 0.60},
+    "gpt-4o": {"input": 2.50, "cached": 1.25, "output": 10.00},
+    "text-embedding-3-small": {"input": 0.02},
+    "text-embedding-3-large": {"input": 0.13},
+}
+PRICES.update(json.loads(os.getenv("USAGE_PRICES_JSON", "{}")))
+# What the embeddings API bills by (text-embedding-3-*, ada-002), not the chat model's o200k
+EMBEDDING_ENCODING = os.getenv("EMBEDDING_ENCODING", "cl100k_base")
+
+
+def price_of(model: str) -> Dict[str, float]:
+    """Price row for `model` (empty, i.e. free, if unknown)."""
+    matches = [name for name in PRICES if model.startswith(name)]
+    return PRICES[max(matches, key=len)] if matches else {}
+
+
+# ----------------------------
+# Usage totals
+# ----------------------------
+@dataclass
+class Usage:
+    llm_calls: int = 0
+    input_tokens: int = 0  # includes cached_tokens
+    cached_tokens: int = 0
+    output_tokens: int = 0
+    embedding_tokens: int = 0
+    cost_usd: float = 0.0
+
+    def add(self, other: "Usage") -> None:
+        self.llm_calls += other.llm_calls
+        self.input_tokens += other.input_tokens
+        self.cached_tokens += other.cached_tokens
+        self.output_tokens += other.output_tokens
+        self.embedding_tokens += other.embedding_tokens
+        self.cost_usd += other.cost_usd
+
+    def as_dict(self) -> Dict[str, Any]:
+        return dict(asdict(self), cost_usd=round(self.cost_usd, 6))
+
+    def __str__(self) -> str:
+        text = f"{self.llm_calls} LLM calls, {self.input_tokens} in ({self.cached_tokens} cached) / {self.output_tokens} out"
+        if self.embedding_tokens:
+            text += f", {self.embedding_tokens} embedding"
+        return f"{text}, ${self.cost_usd:.5f}"
+
+
+def llm_usage(model: str, input_tokens: int, output_tokens: int, cached_tokens: int = 0) -> Usage:
+    price = price_of(model)
+    uncached = input_tokens - cached_tokens
+    cost = (
+        uncached * price.get("input", 0.0)
+        + cached_tokens * price.get("cached", price.get("input", 0.0))
+        + output_tokens * price.get("output", 0.0)
+    ) / 1e6
+    return Usage(1, input_tokens, cached_tokens, output_tokens, 0, cost)
+
+
+def embedding_usage(model: str, tokens: int) -> Usage:
+    return Usage(embedding_tokens=tokens, cost_usd=tokens * price_of(model).get("input", 0.0) / 1e6)
+
+
+class UsageLedger:
+    """Running totals overall, per route and per (recently active) user. Thread-safe."""
+
+    def __init__(self, max_users: int = USAGE_MAX_USERS):
+        self.max_users = max_users
+        self.total = Usage()
+        self.by_route: Dict[str, Usage] = {}
+        self.by_user: "OrderedDict[str, Usage]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def record(self, route: str, user_id: Optional[str], usage: Usage) -> None:
+        with self._lock:
+            self.total.add(usage)
+            self.by_route.setdefault(route, Usage()).add(usage)
+            if user_id is not None:
+                if user_id not in self.by_user:
+                    self.by_user[user_id] = Usage()
+                self.by_user.move_to_end(user_id)
+                self.by_user[user_id].add(usage)
+                while len(self.by_user) > self.max_users:
+                    self.by_user.popitem(last=False)
+
+    def snapshot(self, top_users: int = 10) -> Dict[str, Any]:
+        """Totals, per route, and the `top_users` most expensive users."""
+        with self._lock:
+            users = sorted(self.by_user.items(), key=lambda kv: kv[1].cost_usd, reverse=True)[:top_users]
+            return {
+                "total": self.total.as_dict(),
+                "by_route": {route: u.as_dict() for route, u in sorted(self.by_route.items())},
+                "top_users": {user_id: u.as_dict() for user_id, u in users},
+                "users": len(self.by_user),
+            }
+
+    def user(self, user_id: str) -> Usage:
+        with self._lock:
+            found = self.by_user.get(user_id)
+            return Usage(**asdict(found)) if found else Usage()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.total = Usage()
+            self.by_route.clear()
+            self.by_user.clear()
+
+
+LEDGER = UsageLedger()
+
+
+# ----------------------------
+# Attribution
+# ----------------------------
+_route: contextvars.ContextVar[str] = contextvars.ContextVar("jetset_usage_route", default="other")
+_turn: contextvars.ContextVar[Optional[Usage]] = contextvars.ContextVar("jetset_usage_turn", default=None)
+
+
+@contextmanager
+def route(name: str, per_turn: bool = True) -> Iterator[None]:
+    """Attribute usage in the block to `name`. per_turn=False keeps it out of the enclosing turn's total."""
+    tokens = [_route.set(name)]
+    if not per_turn:
+        tokens.append(_turn.set(None))
+    try:
+        yield
+    finally:
+        for token in reversed(tokens):
+            token.var.reset(token)
+
+
+@contextmanager
+def turn() -> Iterator[Usage]:
+    """Collect the usage of everything called in the block (tasks started in it included)."""
+    spent = Usage()
+    token = _turn.set(spent)
+    try:
+        yield spent
+    finally:
+        _turn.reset(token)
+
+
+def record(usage: Usage) -> None:
+    """Add `usage` to the ledger and the current turn, under the current route and user."""
+    LEDGER.record(_route.get(), current_user_id(), usage)
+    spent = _turn.get()
+    if spent is not None:
+        spent.add(usage)
+
+
+_embedding_encoding: Any = None  # tiktoken.Encoding, or False once loading failed
+_embedding_encoding_lock = threading.Lock()
+
+
+def count_embedding_tokens(text: str) -> int:
+    """Tokens the embeddings API bills for `text` (chars/4 if the encoding can't be loaded)."""
+    global _embedding_encoding
+    if _embedding_encoding is None:
+        with _embedding_encoding_lock:
+            if _embedding_encoding is None:
+                try:
+                    import tiktoken
+
+                    _embedding_encoding = tiktoken.get_encoding(EMBEDDING_ENCODING)
+                except Exception:
+                    _embedding_encoding = False
+    if _embedding_encoding is False:
+        return (len(text) + 3) // 4
+    return len(_embedding_encoding.encode_ordinary(text))
+
+
+def record_embedding(model: str, texts: List[str]) -> None:
+    """Count texts sent to the embeddings API (the API reports no usage through LangChain)."""
+    record(embedding_usage(model, sum(count_embedding_tokens(t) for t in texts)))
+
+
+class UsageCallback(BaseCallbackHandler):
+    """Records the token usage every chat model call reports when it ends."""
+
+    run_inline = True  # must run in the caller's context to see its route and turn
+    # Only on_llm_end is used: don't dispatch the run tree's chain/tool events here, nor chat-model starts
+    # (which LangChain would stringify for on_llm_start)
+    ignore_chain = True
+    ignore_agent = True
+    ignore_retriever = True
+    ignore_chat_model = True
+    ignore_custom_event = True
+
+    def on_llm_end(self, response: Any, **kwargs: Any) -> None:
+        llm_output = response.llm_output or {}
+        for generations in response.generations:
+            for gen in generations:
+                message = getattr(gen, "message", None)
+                meta = getattr(message, "usage_metadata", None)
+                if not meta:
+                    continue
+                model = (
+                    (getattr(message, "response_metadata", None) or {}).get("model_name")
+                    or (gen.generation_info or {}).get("model_name")
+                    or llm_output.get("model_name")
+                    or ""
+                )
+                cached = (meta.get("input_token_details") or {}).get("cache_read") or 0
+                record(llm_usage(model, meta.get("input_tokens", 0), meta.get("output_tokens", 0), cached))
+
+
+ACCOUNTANT = UsageCallback()
+
+
+def callbacks() -> List[BaseCallbackHandler]:
+    return [ACCOUNTANT]
+
+
+def format_report(data: Dict[str, Any]) -> str:
+    """LEDGER.snapshot() as a short plain-text table (the /stats reply)."""
+    lines = [f"{'':<12} {'calls':>6} {'in':>9} {'cached':>8} {'out':>8} {'embed':>7} {'USD':>9}"]
+
+    def row(name: str, u: Dict[str, Any]) -> str:
+        return (f"{name[:12]:<12} {u['llm_calls']:>6} {u['input_tokens']:>9} {u['cached_tokens']:>8} "
+                f"{u['output_tokens']:>8} {u['embedding_tokens']:>7} {u['cost_usd']:>9.4f}")
+
+    lines.append(row("total", data["total"]))
+    for name, u in data["by_route"].items():
+        lines.append(row(name, u))
+    if data["top_users"]:
+        lines.append(f"\ntop users (of {data['users']}):")
+        for user_id, u in data["top_users"].items():
+            lines.append(row(user_id, u))
+    return "\n".join(lines)
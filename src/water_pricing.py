@@ -0,0 +1,227 @@
+"""
+Deterministic water pricing from the tables in the Water Jetset PDF.
+
+`src/ingest_water.py` extracts the Jet Ski (per tour and season, with morning and
+afternoon prices), Flyboard and Jet Car price lists into data/water_pricing.json.
+`quote()` prices a booking from that table in plain Python, so
+water_booking_compute_price can return an itemized total without a KB lookup.
+
+    python -m src.water_pricing extract "data/docs/Water JetSki Knowledge Base.pdf"
+"""
+import argparse
+import json
+import os
+import re
+import sys
+from datetime import datetime, time
+from typing import Any, Dict, List, Optional, Tuple
+
+# Allow running as a script: `python src/water_pricing.py`
+if __package__ is None and __name__ == "__main__":
+    sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+WATER_PRICING_PATH = os.getenv("WATER_PRICING_PATH", os.path.join("data", "water_pricing.json"))
+CARD_VAT_RATE = 0.05
+
+# Jet ski tours list a morning and an afternoon price next to the initial one. They only
+# apply when the customer asks for a discount: morning starts in this window, afternoon after it.
+MORNING_WINDOW = (time(9, 0), time(14, 0))
+
+_SEASON_KEYS = {"high season": "high_season", "low season": "low_season", "summer end season": "summer_end"}
+_ACTIVITY_KEYS = {"jetski": "jetski", "jet ski": "jetski", "flyboard": "flyboard", "jetcar": "jetcar", "jet car": "jetcar"}
+
+
+class PricingError(ValueError):
+    """Raised when a draft can't be priced from the table (unknown tour, bad duration, ...)."""
+
+
+# ----------------------------
+# Extraction (ingest time)
+# ----------------------------
+_SEASON_RE = re.compile(r"Jet Ski Packages of the (High Season|Low Season|Summer End Season)", re.I)
+_TOUR_RE = re.compile(
+    r"\d+\.\s*([A-Za-z ]+?)\s+(\d+)\s*minutes\s*Tour:\s*"
+    r"-\s*Initial price\s*:\s*(\d+)\s*AED"
+    r"(?:\s*-\s*Morning price\s*:\s*(\d+)\s*AED\s*-\s*Afternoon price\s*:\s*(\d+)\s*AED)?",
+    re.I,
+)
+_FIXED_RE = re.compile(r"(Flyboard|Jet Car) Packages All seasons(.*?)(?=●|Frequently Asked|$)", re.I)
+_FIXED_PRICE_RE = re.compile(r"Initial Price\s*:\s*(\d+)\s*AED for\s*(\d+)\s*minutes", re.I)
+
+
+def extract_price_tables(raw_text: str, source: str = "") -> Dict[str, Any]:
+    """Parse the package sections of the water KB text into a pricing table."""
+    text = re.sub(r"\s+", " ", raw_text)
+    jetski: Dict[str, Dict[str, Dict[str, int]]] = {}
+    seasons = list(_SEASON_RE.finditer(text))
+    for i, match in enumerate(seasons):
+        end = seasons[i + 1].start() if i + 1 < len(seasons) else len(text)
+        section = text[match.end():end].split("●")[0]
+        tours = {}
+        for name, duration, initial, morning, afternoon in _TOUR_RE.findall(section):
+            tours[name.strip().lower()] = {
+                "duration_min": int(duration),
+                "price": int(initial),
+                "morning": int(morning or initial),
+                "afternoon": int(afternoon or initial),
+            }
+        jetski[_SEASON_KEYS[match.group(1).lower()]] = tours
+
+    fixed: Dict[str, Dict[str, int]] = {}
+    for name, body in _FIXED_RE.findall(text):
+        key = _ACTIVITY_KEYS[name.lower()]
+        fixed[key] = {str(d): int(p) for p, d in _FIXED_PRICE_RE.findall(body)}
+
+    table = {"source": source, "currency": "AED", "jetski": jetski, **fixed}
+    missing = [k for k in ("jetski", "flyboard", "jetcar") if not table.get(k)]
+    if missing or set(jetski) != set(_SEASON_KEYS.values()):
+        raise PricingError(f"Could not find price tables for: {', '.join(missing) or 'some seasons'}")
+    return table
+
+
+def save_price_tables(table: Dict[str, Any], path: str = WATER_PRICING_PATH) -> None:
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(table, f, indent=2, ensure_ascii=False)
+        f.write("\n")
+    os.replace(tmp_path, path)
+
+
+_table: Optional[Dict[str, Any]] = None
+_table_key: Optional[Tuple[str, int]] = None  # (path, mtime) _table was read at
+
+
+def load_price_tables(path: str = WATER_PRICING_PATH) -> Dict[str, Any]:
+    """The pricing table, re-read when a re-ingest replaces the file. Raises FileNotFoundError if ingest never wrote it."""
+    global _table, _table_key
+    # One stat per quote, as LiveCollection does for the KB manifest; save_price_tables swaps the file atomically
+    key = (path, os.stat(path).st_mtime_ns)
+    if key != _table_key:
+        with open(path, encoding="utf-8") as f:
+            _table = json.load(f)
+        _table_key = key
+    return _table
+
+
+# ----------------------------
+# Pricing (request time)
+# ----------------------------
+def normalize_activity(activity: Optional[str]) -> Optional[str]:
+    return _ACTIVITY_KEYS.get((activity or "").strip().lower())
+
+
+def _match_tour(package: Optional[str], tours: Dict[str, Any]) -> Optional[str]:
+    cleaned = str(package or "").lower().replace("-", " ").replace("alarab", "al arab")
+    # Longest names first so "royal atlantis" wins over "atlantis"
+    for name in sorted(tours, key=len, reverse=True):
+        if name in cleaned:
+            return name
+    return None
+
+
+def split_duration(duration: int, bases: List[int]) -> Optional[List[Tuple[int, int]]]:
+    """Largest bases first, backtracking when a remainder can't be filled: 50 -> [(30, 1), (20, 1)]."""
+    bases = sorted(bases, reverse=True)
+
+    def solve(remaining: int, i: int) -> Optional[List[Tuple[int, int]]]:
+        if remaining == 0:
+            return []
+        if i == len(bases):
+            return None
+        base = bases[i]
+        for count in range(remaining // base, -1, -1):
+            rest = solve(remaining - count * base, i + 1)
+            if rest is not None:
+                return ([(base, count)] if count else []) + rest
+        return None
+
+    return solve(duration, 0) if duration > 0 else None
+
+
+def _day_part(start: Optional[datetime]) -> Optional[str]:
+    """"morning" or "afternoon" for a start time (the price tier keys); None if unknown or before opening."""
+    if start is None or start.time() < MORNING_WINDOW[0]:
+        return None
+    return "morning" if start.time() < MORNING_WINDOW[1] else "afternoon"
+
+
+def price_item(
+    activity: str,
+    package: Optional[str],
+    duration_min: int,
+    quantity: int,
+    season: str,
+    start: Optional[datetime] = None,
+    discount_requested: bool = False,
+    table: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
+    """Price one line item; unit_price is per vehicle for the whole duration."""
+    table = table or load_price_tables()
+    key = normalize_activity(activity)
+    if key is None:
+        raise PricingError(f"Unknown water activity: {activity}")
+    duration_min, quantity = int(duration_min), int(quantity)
+    line: Dict[str, Any] = {"activity": key, "duration_min": duration_min, "quantity": quantity}
+
+    if key == "jetski":
+        tours = table["jetski"].get(season) or {}
+        tour = _match_tour(package, tours)
+        if tour is None:
+            raise PricingError(f"Unknown jet ski tour: {package}")
+        row = tours[tour]
+        base = row["duration_min"]
+        if duration_min % base != 0:
+            raise PricingError(f"Invalid duration for {package}. Must be a multiple of {base} minutes.")
+        # The time-of-day price only counts when asked for, and only when it's below the initial one
+        day_part = _day_part(start) if discount_requested else None
+        block_price = min(row["price"], row.get(day_part, row["price"])) if day_part else row["price"]
+        discounted = block_price < row["price"]
+        blocks = [(base, duration_min // base)]
+        line.update(package=tour, season=season, discount_applied=discounted)
+        line["blocks"] = [{"minutes": base, "count": blocks[0][1], "price": block_price}]
+    else:
+        prices = {int(m): p for m, p in table[key].items()}
+        blocks = split_duration(duration_min, list(prices))
+        if blocks is None:
+            raise PricingError(f"Duration {duration_min} minutes is not available for {key}. Try a different duration.")
+        line["blocks"] = [{"minutes": m, "count": c, "price": prices[m]} for m, c in blocks]
+
+    line["unit_price"] = sum(b["count"] * b["price"] for b in line["blocks"])
+    line["subtotal"] = line["unit_price"] * quantity
+    return line
+
+
+def quote(lines: List[Dict[str, Any]], payment_method: Optional[str]) -> Dict[str, Any]:
+    """Sum priced lines and add card VAT."""
+    subtotal = sum(line["subtotal"] for line in lines)
+    vat = round(subtotal * CARD_VAT_RATE, 2) if (payment_method or "").lower() == "card" else 0.0
+    return {
+        "currency": "AED",
+        "items": lines,
+        "subtotal": subtotal,
+        "vat": vat,
+        "total": round(subtotal + vat, 2),
+        "payment_method": payment_method,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Extract the water price tables from the KB PDF.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    ex = sub.add_parser("extract")
+    ex.add_argument("pdf", nargs="?", default=os.getenv("WATER_DOC_PATH"))
+    ex.add_argument("--out", default=WATER_PRICING_PATH)
+    args = parser.parse_args()
+
+    from pypdf import PdfReader
+
+    reader = PdfReader(args.pdf)
+    raw_text = "\n".join((page.extract_text() or "") for page in reader.pages)
+    table = extract_price_tables(raw_text, source=os.path.basename(args.pdf))
+    save_price_tables(table, args.out)
+    print(f"✓ Wrote {args.out}")
+
+
+if __name__ == "__main__":
+    main()
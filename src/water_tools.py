@@ -1,5 +1,6 @@
 import os
 import json
+import asyncio
 from datetime import datetime, timedelta
 from zoneinfo import ZoneInfo
 from typing import Any, Dict, Optional
@@ -7,40 +8,74 @@ from typing import Any, Dict, Optional
 from dotenv import load_dotenv
 load_dotenv(dotenv_path=os.path.join(os.getcwd(), ".env"))
 
-from langchain_openai import OpenAIEmbeddings
-from langchain_chroma import Chroma
 from langchain_core.tools import tool
 
+from src import metrics
+from src.embedding_cache import CachedEmbeddings, get_shared_embeddings
+from src.kb_cache import FixedQueryCache
+from src.kb_manifest import LiveCollection
+from src.booking_store import make_booking_store, saves_draft
+from src.request_context import current_user_id
+from src.water_pricing import PricingError, price_item, quote
+
 # ----------------------------
 # Env
 # ----------------------------
 WATER_CHROMA_DIR = os.getenv("WATER_CHROMA_DIR", "data/water_chroma_db")
 WATER_CHROMA_COLLECTION = os.getenv("WATER_CHROMA_COLLECTION", "jetset_water_kb")
 EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-3-small")
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL") or None
 TZ = os.getenv("TZ", "Asia/Dubai")
+# ISO datetime the date tool reports instead of the clock, so recorded eval runs replay (see test_cases.py)
+FROZEN_NOW = os.getenv("FROZEN_NOW") or None
 
 # ----------------------------
 # Vector DB / Retriever
 # ----------------------------
-_embeddings = OpenAIEmbeddings(model=EMBEDDING_MODEL)
-_water_db = Chroma(
-    collection_name=WATER_CHROMA_COLLECTION,
-    persist_directory=WATER_CHROMA_DIR,
-    embedding_function=_embeddings,
-)
-
-def _water_search(query: str, k: int = 6) -> Dict[str, Any]:
-    docs = _water_db.similarity_search(query, k=k)
+def _embeddings() -> CachedEmbeddings:
+    # Query embeddings go through the shared on-disk cache (see src/embedding_cache.py)
+    return get_shared_embeddings(EMBEDDING_MODEL, OPENAI_BASE_URL)
+
+# Follows the manifest written by the ingest scripts (see src/kb_manifest.py); opened on first search
+_water_db = LiveCollection(WATER_CHROMA_DIR, WATER_CHROMA_COLLECTION, _embeddings)
+
+def open_water_kb() -> None:
+    """Open the Chroma collection and the embeddings client now instead of on the first search."""
+    _water_db.get()
+
+async def _awater_search(query: str, k: int = 6) -> Dict[str, Any]:
+    # Embed over the async HTTP client, then run the local vector lookup off the event loop
+    with metrics.span("kb_embed", kb="water"):
+        embedding = await _embeddings().aembed_query(query)
+    with metrics.span("kb_search", kb="water"):
+        docs = await asyncio.to_thread(_water_db.get().similarity_search_by_vector, embedding, k=k)
     matches = [{"text": d.page_content, "meta": d.metadata} for d in docs]
     return {"query": query, "matches": matches}
 
+# Tools whose query never changes are served from memory until the KB is re-ingested
+_fixed_water_results = FixedQueryCache(_water_db, "water")
+WATER_ABOUT_QUERY = "About Water Jetset company overview"
+WATER_LOCATION_QUERY = "Water Jetset location address contact phone map"
+
+async def _fixed_water_search_json(query: str, k: int) -> str:
+    async def compute() -> str:
+        return json.dumps(await _awater_search(query, k=k))
+    return await _fixed_water_results.get(f"{k}:{query}", compute)
+
+async def warm_fixed_water_queries() -> None:
+    """Fill the fixed-query cache so the first booking turn doesn't pay for the searches."""
+    await asyncio.gather(
+        _fixed_water_search_json(WATER_ABOUT_QUERY, 6),
+        _fixed_water_search_json(WATER_LOCATION_QUERY, 6),
+    )
+
 # ----------------------------
 # Tools (Water)
 # ----------------------------
 @tool
 def water_current_datetime_tool(tz: str = "Asia/Dubai") -> str:
     """Return the current datetime (ISO string) in the given timezone. Used to resolve 'tomorrow', etc."""
-    now = datetime.now(ZoneInfo(tz))
+    now = datetime.fromisoformat(FROZEN_NOW).astimezone(ZoneInfo(tz)) if FROZEN_NOW else datetime.now(ZoneInfo(tz))
     return json.dumps({"tz": tz, "now_iso": now.isoformat()})
 
 # ----------------------------
@@ -49,22 +84,17 @@ def water_current_datetime_tool(tz: str = "Asia/Dubai") -> str:
 CARD_VAT_MULTIPLIER = 1.05
 
 # ----------------------------
-# Booking Store (separate from desert)
+# Booking Store (separate from desert; in-memory or SQLite, see src/booking_store.py)
 # ----------------------------
-WATER_BOOKINGS: Dict[str, Dict[str, Any]] = {}
+WATER_BOOKINGS = make_booking_store("water")
 MAX_WATER_QUANTITY = 10
-_CURRENT_WATER_USER_ID: Optional[str] = None
-
-def set_current_water_user_id(user_id: Optional[str]) -> None:
-    """Set the current user id so tools can infer booking_date when missing."""
-    global _CURRENT_WATER_USER_ID
-    _CURRENT_WATER_USER_ID = user_id
 
 def _infer_booking_date_from_context() -> Optional[str]:
-    """Best-effort booking_date from current user's draft."""
-    if not _CURRENT_WATER_USER_ID:
+    """Best-effort booking_date from the current request's user draft."""
+    user_id = current_user_id()
+    if not user_id:
         return None
-    draft = WATER_BOOKINGS.get(_CURRENT_WATER_USER_ID, {})
+    draft = WATER_BOOKINGS.get(user_id, {})
     dt_value = draft.get("booking_date") or draft.get("date_time_iso")
     if not dt_value:
         return None
@@ -79,8 +109,9 @@ _JETSKI_BASE_DURATIONS = [
 ]
 
 def _get_or_create_water_booking(user_id: str) -> Dict[str, Any]:
-    if user_id not in WATER_BOOKINGS:
-        WATER_BOOKINGS[user_id] = {
+    draft = WATER_BOOKINGS.get(user_id)
+    if draft is None:
+        draft = {
             "status": "collecting",          # collecting | ready_to_confirm | confirmed
             "customer_name": None,
             "activity": None,                # jetski | flyboard | jetcar
@@ -92,12 +123,14 @@ def _get_or_create_water_booking(user_id: str) -> Dict[str, Any]:
             "payment_method": None,          # cash/card/crypto
             "price_aed": None,
             "price_aed_base": None,          # Base price before VAT (used for recalc when payment method changes)
+            "discount_requested": False,     # Customer asked for the morning (discounted) price
             "items": [],                     # list of activity line items
             "notes": []
         }
+        WATER_BOOKINGS[user_id] = draft
     else:
-        WATER_BOOKINGS[user_id].setdefault("items", [])
-    return WATER_BOOKINGS[user_id]
+        draft.setdefault("items", [])
+    return draft
 
 def _normalize_bool(v: Any) -> Optional[bool]:
     if v is None:
@@ -286,7 +319,7 @@ def _normalize_value(value: Any, key: str) -> Any:
     if value is None:
         return None
     
-    if key == "pickup_required":
+    if key in {"pickup_required", "discount_requested"}:
         return _normalize_bool(value)
     
     if key in {"activity", "payment_method"}:
@@ -307,12 +340,14 @@ def _normalize_value(value: Any, key: str) -> Any:
     return value
 
 @tool
+@saves_draft(WATER_BOOKINGS)
 def water_booking_get_or_create(user_id: str) -> str:
     """Get or create a water booking draft object for a given Telegram user_id."""
     draft = _get_or_create_water_booking(user_id)
     return json.dumps(draft)
 
 @tool
+@saves_draft(WATER_BOOKINGS)
 def water_booking_update(
     user_id: str,
     patch: Optional[dict] = None,
@@ -325,6 +360,7 @@ def water_booking_update(
     pickup_required: Optional[Any] = None,
     payment_method: Optional[str] = None,
     price_aed: Optional[float] = None,
+    discount_requested: Optional[Any] = None,
     add_item: Optional[Any] = None,
     notes: Optional[Any] = None,
 ) -> str:
@@ -349,6 +385,7 @@ def water_booking_update(
         "pickup_required": pickup_required,
         "payment_method": payment_method,
         "price_aed": price_aed,
+        "discount_requested": discount_requested,
         "add_item": add_item,
         "notes": notes,
     }
@@ -542,13 +579,18 @@ def water_booking_update(
     return json.dumps(draft)
 
 @tool
-def water_booking_compute_price(user_id: str) -> str:
+@saves_draft(WATER_BOOKINGS)
+def water_booking_compute_price(user_id: str, discount_requested: Optional[bool] = None) -> str:
     """
     Compute water booking price with precision handling.
     Always recalculates; never uses cached prices.
+    Returns an itemized quote (season, morning discount, card VAT) from the PDF price tables.
+    Pass discount_requested=true only if the user asked about discounts.
     """
     draft = _get_or_create_water_booking(user_id)
     draft["price_aed"] = None
+    if discount_requested is not None:
+        draft["discount_requested"] = bool(_normalize_bool(discount_requested))
 
     items = draft.get("items") or []
     
@@ -581,13 +623,75 @@ def water_booking_compute_price(user_id: str) -> str:
     if duration_error:
         return json.dumps({"error": duration_error, "draft": draft})
 
-    return json.dumps({
-        "needs_pricing_from_kb": True,
-        "message": "Water pricing should be retrieved from the knowledge base.",
-        "draft": draft
-    })
+    try:
+        price_quote = _quote_draft(draft)
+    except FileNotFoundError:
+        # No extracted price table yet (ingest_water.py not run): let the agent use the KB
+        return json.dumps({
+            "needs_pricing_from_kb": True,
+            "message": "Water pricing should be retrieved from the knowledge base.",
+            "draft": draft
+        })
+    except PricingError as e:
+        return json.dumps({"error": str(e), "draft": draft})
+
+    draft["price_aed_base"] = price_quote["subtotal"]
+    draft["price_aed"] = price_quote["total"]
+    WATER_BOOKINGS[user_id] = draft
+    return json.dumps({"price_aed": price_quote["total"], "quote": price_quote, "draft": draft})
+
+def _quote_draft(draft: Dict[str, Any]) -> Dict[str, Any]:
+    """Itemized price for every line of the draft from the extracted PDF tables."""
+    bookings = draft.get("items") or [draft]
+    lines = []
+    for booking in bookings:
+        dt_value = booking.get("date_time_iso") or draft.get("date_time_iso")
+        start_dt = _parse_start_dt(str(dt_value)) if dt_value else None
+        season = _get_season_for_date(str(dt_value).split("T")[0]) if dt_value else "high_season"
+        lines.append(price_item(
+            activity=booking.get("activity") or draft.get("activity"),
+            package=booking.get("package") or draft.get("package"),
+            duration_min=booking["duration_min"],
+            quantity=booking["quantity"],
+            season=season,
+            start=start_dt,
+            discount_requested=bool(draft.get("discount_requested")),
+        ))
+    return quote(lines, draft.get("payment_method"))
+
+@tool
+def water_price_quote_tool(
+    activity: str,
+    duration_min: int,
+    package: Optional[str] = None,
+    quantity: int = 1,
+    date_time_iso: Optional[str] = None,
+    payment_method: Optional[str] = None,
+    discount_requested: bool = False,
+) -> str:
+    """Price a water activity without a booking (price inquiries).
+
+    Uses the seasonal price for the date (high season if no date), the morning price only
+    when discount_requested is true and the start time is 9:00-14:00, and adds 5% VAT for card.
+    """
+    draft = {
+        "activity": _normalize_value(activity, "activity"),
+        "package": package,
+        "duration_min": _normalize_value(duration_min, "duration_min"),
+        "quantity": _normalize_value(quantity, "quantity"),
+        "date_time_iso": date_time_iso,
+        "payment_method": _normalize_value(payment_method, "payment_method"),
+        "discount_requested": bool(_normalize_bool(discount_requested)),
+    }
+    try:
+        return json.dumps(_quote_draft(draft))
+    except FileNotFoundError:
+        return json.dumps({"needs_pricing_from_kb": True, "message": "Water pricing should be retrieved from the knowledge base."})
+    except (PricingError, ValueError, TypeError) as e:
+        return json.dumps({"error": str(e)})
 
 @tool
+@saves_draft(WATER_BOOKINGS)
 def water_booking_confirm(user_id: str, final_price_aed: Optional[float] = None) -> str:
     """Confirm a water booking if the draft is complete and a price has been computed.
     
@@ -619,22 +723,22 @@ def water_booking_confirm(user_id: str, final_price_aed: Optional[float] = None)
     })
 # ----------------------------
 @tool
-def water_retrieval_tool(query: str, k: int = 6) -> str:
+async def water_retrieval_tool(query: str, k: int = 6) -> str:
     """Search the Water Jetset knowledge base (Chroma) for factual answers and return top matching chunks."""
-    return json.dumps(_water_search(query=query, k=k))
+    return json.dumps(await _awater_search(query=query, k=k))
 
 @tool
-def water_about_tool() -> str:
+async def water_about_tool() -> str:
     """Return 'About Water Jetset' information from the knowledge base."""
-    return json.dumps(_water_search("About Water Jetset company overview", k=6))
+    return await _fixed_water_search_json(WATER_ABOUT_QUERY, k=6)
 
 @tool
-def water_location_tool() -> str:
+async def water_location_tool() -> str:
     """Return Water Jetset location/contact/map details from the knowledge base."""
-    return json.dumps(_water_search("Water Jetset location address contact phone map", k=6))
+    return await _fixed_water_search_json(WATER_LOCATION_QUERY, k=6)
 
 @tool
-def water_packages_tool(activity: str = "all", booking_date: Optional[str] = None) -> str:
+async def water_packages_tool(activity: str = "all", booking_date: Optional[str] = None) -> str:
     """Return packages/prices/durations from the knowledge base for water activities.
     
     Args:
@@ -651,10 +755,10 @@ def water_packages_tool(activity: str = "all", booking_date: Optional[str] = Non
     if booking_date:
         date_str = booking_date.split("T")[0] if "T" in booking_date else booking_date
         q += f" on {date_str}"
-    return json.dumps(_water_search(q, k=8))
+    return json.dumps(await _awater_search(q, k=8))
 
 @tool
-def water_faq_tool(question: str = "") -> str:
+async def water_faq_tool(question: str = "") -> str:
     """Return policy/FAQ answers from the knowledge base (age limits, rules, refunds, safety, etc.)."""
     # Expand question with common FAQ keywords for better semantic matching
     faq_keywords = [
@@ -674,11 +778,11 @@ def water_faq_tool(question: str = "") -> str:
     else:
         q = f"Water Jetset FAQ policies rules {question_lower}" if question_lower else "Water Jetset FAQ policies rules"
     
-    results = _water_search(q, k=10)  # Increased k for better coverage
+    results = await _awater_search(q, k=10)  # Increased k for better coverage
     
     # If no good matches, try a broader search
     if not results.get("matches") or len(results["matches"]) < 3:
-        results = _water_search("Water Jetset policies FAQ refunds age payment safety rules", k=10)
+        results = await _awater_search("Water Jetset policies FAQ refunds age payment safety rules", k=10)
     
     return json.dumps(results)
 
@@ -693,6 +797,7 @@ def water_tools():
         water_booking_get_or_create,
         water_booking_update,
         water_booking_compute_price,
+        water_price_quote_tool,
         water_booking_confirm,
     ]
 
@@ -1,8 +1,15 @@
 import argparse
+import asyncio
+import bisect
+import hashlib
 import json
 import re
 import os
-from typing import Dict, List
+import tempfile
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+from zoneinfo import ZoneInfo
 
 from dotenv import load_dotenv
 
@@ -12,11 +19,16 @@ from langchain_openai import ChatOpenAI
 from langchain_core.messages import SystemMessage, HumanMessage
 
 import src.bot as bot
-from src.tools import BOOKINGS
-from src.water_tools import WATER_BOOKINGS, water_booking_update
+from src import embedding_cache, tools, usage, water_tools
+from src.request_context import request_context
+from src.tools import BOOKINGS, booking_compute_price
+from src.water_tools import WATER_BOOKINGS, water_booking_compute_price, water_booking_update
 
 EVAL_MODEL = os.getenv("EVAL_MODEL", os.getenv("CHAT_MODEL", "gpt-4.1-mini"))
-EVAL_LLM = ChatOpenAI(model=EVAL_MODEL, temperature=0)
+# OPENAI_BASE_URL points the bot and the judge at another endpoint (e.g. benchmarks/openai_stub_server.py);
+# EVAL_BASE_URL moves only the judge
+EVAL_BASE_URL = os.getenv("EVAL_BASE_URL") or os.getenv("OPENAI_BASE_URL") or None
+EVAL_LLM = ChatOpenAI(model=EVAL_MODEL, temperature=0, base_url=EVAL_BASE_URL)
 
 SCORE_RUBRIC = {
     "accuracy": [
@@ -69,6 +81,20 @@ SCORE_RUBRIC = {
         ("Poor (Unsatisfactory)", "Above 0.10 USD"),
     ],
 }
+# speed_latency and cost_efficiency are measured, not judged: the p95 of a case's per-turn send() wall time
+# and its total LLM + embedding cost in USD (src/usage.py), scored at the middle of the matching band;
+# the upper bounds below mirror the rubric rows.
+LATENCY_BANDS_S = (4.0, 5.0, 6.0, 7.0)
+COST_BANDS_USD = (0.01, 0.02, 0.05, 0.10)
+BAND_SCORES = (95, 85, 75, 65, 50)
+CASSETTE_PATH = os.getenv("CASSETTE_PATH", "data/cassettes/test_cases.jsonl")
+# Where this run's OpenAI answers came from, for the saved report (set by use_cassette)
+CASSETTE_SOURCE = ""
+# False once any OpenAI answer can come from a cassette: send() times are then local round-trips, not latency
+LATENCY_MEASURED = True
+# Verdicts by hash of (judge model, judge prompt, transcript): an unchanged transcript is never re-graded.
+# Empty disables the cache (--no-judge-cache).
+JUDGE_CACHE_PATH = os.getenv("JUDGE_CACHE_PATH", "data/judge_cache.json")
 
 TEST_CASES: List[Dict[str, object]] = [
     {
@@ -502,6 +528,81 @@ TEST_CASES: List[Dict[str, object]] = [
     },
 ]
 
+# Offline price regression table (python test_cases.py --check-pricing).
+# Expected totals come straight from the KB documents, not from the extracted catalogs.
+# Desert: (activity, vehicle_model/package, duration_min, quantity, pickup, payment, expected_total)
+DESERT_PRICING_CASES = [
+    ("buggy", "2-seater", 30, 1, False, "cash", 400),
+    ("buggy", "2-seater", 60, 1, False, "cash", 750),
+    ("buggy", "2-seater", 90, 1, False, "cash", 1150),
+    ("buggy", "2-seater", 120, 1, False, "cash", 1500),
+    ("buggy", "4-seater", 30, 1, False, "cash", 600),
+    ("buggy", "4-seater", 60, 1, False, "cash", 1150),
+    ("buggy", "4-seater", 90, 1, False, "cash", 1750),
+    ("buggy", "4-seater", 120, 1, False, "cash", 2300),
+    ("quad", "Aon Cobra 400cc", 30, 1, False, "cash", 150),
+    ("quad", "Aon Cobra 400cc", 60, 1, False, "cash", 250),
+    ("quad", "Aon Cobra 400cc", 90, 1, False, "cash", 400),
+    ("quad", "Aon Cobra 400cc", 120, 1, False, "cash", 500),
+    ("quad", "Polaris Sportsman 570cc", 30, 1, False, "cash", 300),
+    ("quad", "Polaris Sportsman 570cc", 60, 1, False, "cash", 450),
+    ("quad", "Polaris Sportsman 570cc", 90, 1, False, "cash", 500),
+    ("quad", "Polaris Sportsman 570cc", 120, 1, False, "cash", 650),
+    ("quad", "Yamaha Raptor 700cc", 30, 1, False, "cash", 300),
+    ("quad", "Yamaha Raptor 700cc", 60, 1, False, "cash", 600),
+    ("quad", "Yamaha Raptor 700cc", 90, 1, False, "cash", 850),
+    ("quad", "Yamaha Raptor 700cc", 120, 1, False, "cash", 1150),
+    ("safari", "shared", None, 1, False, "cash", 199),
+    ("safari", "private", None, 1, False, "cash", 900),
+    ("buggy", "4-seater", 60, 3, True, "card", 3990),      # (3×1150 + 350) × 1.05
+    ("quad", "raptor", 90, 2, False, "card", 1785),        # 2×850 × 1.05
+    ("safari", "shared", None, 4, True, "cash", 1146),     # 4×199 + 350
+    ("safari", "private", None, 2, False, "crypto", 1800),
+]
+# Mixed desert booking: (items, pickup, payment, expected_total)
+DESERT_MIXED_PRICING_CASES = [
+    (
+        [
+            {"activity": "buggy", "vehicle_model": "2-seater", "duration_min": 60, "quantity": 1},
+            {"activity": "quad", "vehicle_model": "Aon Cobra 400cc", "duration_min": 30, "quantity": 2},
+            {"activity": "safari", "package": "private", "quantity": 1},
+        ],
+        True, "card", 2415,                                  # (750 + 2×150 + 900 + 350) × 1.05
+    ),
+]
+# Water: (activity, package, duration_min, quantity, date_time_iso, payment, discount, expected_total)
+WATER_PRICING_CASES = [
+    ("jet ski", "Burj Khalifa", 20, 1, "2026-01-20T16:00:00+04:00", "cash", False, 250),
+    ("jet ski", "Burj Al Arab", 30, 1, "2026-01-20T16:00:00+04:00", "cash", False, 350),
+    ("jet ski", "Royal Atlantis", 60, 1, "2026-01-20T16:00:00+04:00", "cash", False, 600),
+    ("jet ski", "Atlantis", 90, 1, "2026-01-20T16:00:00+04:00", "cash", False, 770),
+    ("jet ski", "JBR", 120, 1, "2026-01-20T16:00:00+04:00", "cash", False, 895),
+    ("jet ski", "Burj Khalifa", 20, 1, "2026-05-20T16:00:00+04:00", "cash", False, 250),
+    ("jet ski", "Burj Al Arab", 30, 1, "2026-05-20T16:00:00+04:00", "cash", False, 300),
+    ("jet ski", "Royal Atlantis", 60, 1, "2026-05-20T16:00:00+04:00", "cash", False, 500),
+    ("jet ski", "Atlantis", 90, 1, "2026-05-20T16:00:00+04:00", "cash", False, 770),
+    ("jet ski", "JBR", 120, 1, "2026-05-20T16:00:00+04:00", "cash", False, 895),
+    ("jet ski", "Burj Khalifa", 20, 1, "2026-10-20T16:00:00+04:00", "cash", False, 200),
+    ("jet ski", "Burj Al Arab", 30, 1, "2026-10-20T16:00:00+04:00", "cash", False, 250),
+    ("jet ski", "Royal Atlantis", 60, 1, "2026-10-20T16:00:00+04:00", "cash", False, 450),
+    ("jet ski", "Atlantis", 90, 1, "2026-10-20T16:00:00+04:00", "cash", False, 770),
+    ("jet ski", "JBR", 120, 1, "2026-10-20T16:00:00+04:00", "cash", False, 895),
+    ("jet ski", "Burj Khalifa", 20, 1, "2026-01-20T10:00:00+04:00", "cash", True, 200),
+    ("jet ski", "Burj Al Arab", 30, 1, "2026-01-20T10:00:00+04:00", "cash", True, 250),
+    ("jet ski", "Royal Atlantis", 60, 1, "2026-05-20T10:00:00+04:00", "cash", True, 450),
+    ("jet ski", "Royal Atlantis", 60, 1, "2026-01-20T15:00:00+04:00", "cash", True, 600),   # afternoon price = initial
+    ("jet ski", "Burj Al Arab", 30, 1, "2026-05-20T16:00:00+04:00", "cash", True, 300),     # afternoon price = initial
+    ("jet ski", "Burj Khalifa", 20, 1, "2026-01-20T10:00:00+04:00", "cash", False, 250),    # discount not asked
+    ("jet ski", "Burj Khalifa", 40, 2, "2026-01-20T16:00:00+04:00", "card", False, 1050),   # 2×(2×250) × 1.05
+    ("flyboard", None, 20, 1, "2026-01-20T16:00:00+04:00", "cash", False, 290),
+    ("flyboard", None, 30, 1, "2026-01-20T16:00:00+04:00", "cash", False, 350),
+    ("flyboard", None, 50, 1, "2026-01-20T16:00:00+04:00", "cash", False, 640),
+    ("jet car", None, 20, 1, "2026-01-20T16:00:00+04:00", "cash", False, 600),
+    ("jet car", None, 30, 1, "2026-01-20T16:00:00+04:00", "cash", False, 800),
+    ("jet car", None, 60, 1, "2026-01-20T16:00:00+04:00", "cash", False, 1500),
+    ("jet car", None, 150, 1, "2026-01-20T16:00:00+04:00", "card", False, 3990),            # (2×1500 + 800) × 1.05
+]
+
 EVAL_SYSTEM_PROMPT = """You are a strict evaluator for a Jetset Dubai assistant.
 Score the assistant against the scenario and expectation.
 Return ONLY JSON with this schema:
@@ -521,40 +622,91 @@ Return ONLY JSON with this schema:
 Do not include any extra keys or text. Set speed_latency and cost_efficiency to null if not measurable."""
 
 
+# ----------------------------
+# Cassettes
+# ----------------------------
+# A cassette is the JSONL benchmarks/openai_stub_server.py records: one line per OpenAI request (chat or
+# embeddings) keyed by a hash of the normalized request, after a first line with the clock the date tools
+# reported while recording. Replaying it reproduces the run offline, judge scores included.
+def _cassette_clock(path: str) -> Optional[str]:
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                return json.loads(line).get("clock")
+    return None
+
+
+def use_cassette(path: str, record: bool):
+    """Send the bot's, the KBs' and the judge's OpenAI calls through a local server that replays `path`.
+
+    record=True forwards requests the cassette lacks to OPENAI_BASE_URL (default api.openai.com) and appends
+    them; otherwise they fail with a 404 and nothing reaches OpenAI. Returns the server's StubState.
+    """
+    global EVAL_LLM, CASSETTE_SOURCE, LATENCY_MEASURED
+    from benchmarks.openai_stub_server import build_parser, start_server
+
+    clock = _cassette_clock(path)
+    if clock is None:
+        if not record or os.path.exists(path):
+            raise SystemExit(f"{path} is not a recorded cassette; record one with --record {path}")
+        clock = datetime.now(ZoneInfo(tools.TZ)).replace(microsecond=0).isoformat()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(json.dumps({"clock": clock}) + "\n")
+    # "Tomorrow" must mean the same day it meant when the cassette was recorded
+    tools.FROZEN_NOW = water_tools.FROZEN_NOW = clock
+
+    upstream = (os.getenv("OPENAI_BASE_URL") or "https://api.openai.com/v1").rstrip("/")
+    argv = ["--port", "0", "--strict"] + (["--record", path, "--upstream", upstream] if record else ["--replay", path])
+    server, state = start_server(build_parser().parse_args(argv))
+    base_url = f"http://127.0.0.1:{server.server_address[1]}/v1"
+    bot.OPENAI_BASE_URL = tools.OPENAI_BASE_URL = water_tools.OPENAI_BASE_URL = base_url
+    # Every embedding goes through the server (and into the cassette), not the on-disk cache
+    embedding_cache.EMBEDDING_CACHE_PATH = os.path.join(tempfile.mkdtemp(prefix="cassette_"), "embeddings.sqlite3")
+    EVAL_LLM = ChatOpenAI(model=EVAL_MODEL, temperature=0, base_url=base_url)
+    CASSETTE_SOURCE = f"{'recorded to' if record else 'replayed from'} {path} (clock {clock})"
+    LATENCY_MEASURED = record and not state.replay
+    print(f"Cassette {path}: {len(state.replay)} recorded responses, clock {clock}"
+          f"{f', recording misses from {upstream}' if record else ''}")
+    return state
+
+
 def reset_user_state(user_id: str) -> None:
-    for key in list(bot.memory_store.keys()):
-        if key.startswith(f"{user_id}:"):
-            bot.memory_store.pop(key, None)
-    bot.router_state.pop(user_id, None)
-    BOOKINGS.pop(user_id, None)
-    WATER_BOOKINGS.pop(user_id, None)
+    bot.reset_session(user_id)
+
 
+async def send(user_id: str, text: str) -> str:
+    with request_context(user_id), bot.sessions.hold(user_id) as session:
+        return await _send(session, text)
 
-def send(user_id: str, text: str) -> str:
+
+async def _send(session, text: str) -> str:
+    user_id = session.user_id
     if bot._WATER_KEYWORDS.search(text) and bot._DESERT_KEYWORDS.search(text):
         return "We can't combine desert and water activities in one booking. Please choose one to book first."
     payment_method = bot._extract_payment_method(text)
     if payment_method and bot.has_active_water_booking(user_id):
         try:
-            water_booking_update(user_id=user_id, payment_method=payment_method)
+            await water_booking_update.ainvoke({"user_id": user_id, "payment_method": payment_method})
         except Exception:
             pass
     if bot._wants_both_packages(text):
-        desert_executor = bot.make_desert_executor(user_id)
-        water_executor = bot.make_water_executor(user_id)
-        desert_result = desert_executor.invoke({"input": f"[user_id={user_id}] List buggy, quad, and safari packages with prices."})
-        water_result = water_executor.invoke({"input": f"[user_id={user_id}] Show all water packages."})
+        desert_result = await bot.run_agent(
+            session, "desert", f"[user_id={user_id}] List buggy, quad, and safari packages with prices."
+        )
+        water_result = await bot.run_agent(session, "water", f"[user_id={user_id}] Show all water packages.")
         desert_reply = bot._enforce_single_question((desert_result.get("output") or "").strip())
         water_reply = bot._enforce_single_question((water_result.get("output") or "").strip())
         return f"Desert packages:\n{desert_reply}\n\nWater packages:\n{water_reply}"
 
-    route = bot.route_agent(user_id, text)
+    route = await bot.route_agent(session, text)
     if route == "desert":
         agent_input = f"[user_id={user_id}] {text}"
-        executor = bot.make_desert_executor(user_id)
-        result = executor.invoke({"input": agent_input})
+        result = await bot.run_agent(session, "desert", agent_input)
         reply = bot._enforce_single_question((result.get("output") or "").strip())
-        bot._set_last_agent(user_id, "desert")
+        bot._set_last_agent(session, "desert")
     elif route == "water":
         hinted_text = text
         if bot._is_price_inquiry(text):
@@ -565,16 +717,15 @@ def send(user_id: str, text: str) -> str:
                     hints.append(f"use base duration {base} minutes")
             hinted_text = f"{text} ({'; '.join(hints)})"
         agent_input = f"[user_id={user_id}] {hinted_text}"
-        executor = bot.make_water_executor(user_id)
-        result = executor.invoke({"input": agent_input})
+        result = await bot.run_agent(session, "water", agent_input)
         reply = bot._enforce_single_question((result.get("output") or "").strip())
         if bot._is_price_inquiry(text):
             reply = bot._strip_payment_questions(reply)
-        bot._set_last_agent(user_id, "water")
+        bot._set_last_agent(session, "water")
     elif route == "clarify":
         reply = "Do you mean desert activities (buggy/quad/safari) or water activities (jet ski/flyboard/jet car)?"
     else:
-        reply = bot.run_general_agent(user_id, text)
+        reply = await bot.run_general_agent(session, text)
     return reply
 
 
@@ -582,6 +733,63 @@ def list_cases() -> None:
     for case in TEST_CASES:
         print(f"{case['id']}: {case['title']} - {case['scenario']}")
 
+def _check_price(label: str, draft_store: Dict[str, Dict[str, object]], compute, draft: Dict[str, object],
+                 expected: float) -> bool:
+    user_id = "pricing-check"
+    draft_store[user_id] = {"status": "collecting", "notes": [], **draft}
+    try:
+        out = json.loads(compute.invoke({"user_id": user_id}))
+    finally:
+        draft_store.pop(user_id, None)
+    got = out.get("price_aed")
+    ok = got is not None and abs(float(got) - expected) < 0.01
+    print(f"{'✓' if ok else '✗'} {label}: expected {expected}, got {got if got is not None else out.get('error') or out}")
+    return ok
+
+
+def check_pricing() -> bool:
+    """Run the offline price regression table through both compute_price tools."""
+    results = []
+    for activity, model, duration, qty, pickup, payment, expected in DESERT_PRICING_CASES:
+        draft = {
+            "activity": activity,
+            "vehicle_model": model if activity != "safari" else None,
+            "package": model if activity == "safari" else None,
+            "duration_min": duration,
+            "quantity": qty,
+            "date_time_iso": "2026-01-20T10:00:00+04:00",
+            "pickup_required": pickup,
+            "payment_method": payment,
+            "items": [],
+        }
+        label = f"desert {activity} {model} {duration or '-'}min x{qty} pickup={pickup} {payment}"
+        results.append(_check_price(label, BOOKINGS, booking_compute_price, draft, expected))
+    for items, pickup, payment, expected in DESERT_MIXED_PRICING_CASES:
+        draft = {
+            "items": [dict(item, date_time_iso="2026-01-20T10:00:00+04:00") for item in items],
+            "pickup_required": pickup,
+            "payment_method": payment,
+        }
+        label = f"desert mixed {'+'.join(i['activity'] for i in items)} pickup={pickup} {payment}"
+        results.append(_check_price(label, BOOKINGS, booking_compute_price, draft, expected))
+    for activity, package, duration, qty, dt_iso, payment, discount, expected in WATER_PRICING_CASES:
+        draft = {
+            "activity": activity,
+            "package": package,
+            "duration_min": duration,
+            "quantity": qty,
+            "date_time_iso": dt_iso,
+            "payment_method": payment,
+            "discount_requested": discount,
+            "items": [],
+        }
+        label = f"water {activity} {package or ''} {duration}min x{qty} {dt_iso[:16]} {payment} discount={discount}"
+        results.append(_check_price(label, WATER_BOOKINGS, water_booking_compute_price, draft, expected))
+    passed = sum(results)
+    print(f"\n{passed}/{len(results)} pricing cases passed")
+    return passed == len(results)
+
+
 def _extract_json(text: str) -> Dict[str, object]:
     match = re.search(r"\{.*\}", text, re.DOTALL)
     if not match:
@@ -591,7 +799,34 @@ def _extract_json(text: str) -> Dict[str, object]:
     except json.JSONDecodeError:
         return {}
 
-def llm_evaluate_case(case: Dict[str, object], replies: List[str]) -> Dict[str, object]:
+_judge_cache: Optional[Dict[str, Dict[str, object]]] = None
+judge_stats = {"graded": 0, "cached": 0}
+
+
+def _load_judge_cache() -> Dict[str, Dict[str, object]]:
+    global _judge_cache
+    if _judge_cache is None:
+        _judge_cache = {}
+        if JUDGE_CACHE_PATH and os.path.exists(JUDGE_CACHE_PATH):
+            try:
+                with open(JUDGE_CACHE_PATH, encoding="utf-8") as f:
+                    _judge_cache = json.load(f)
+            except (OSError, ValueError):
+                pass  # a broken cache only costs a re-grade
+    return _judge_cache
+
+
+def _save_judge_cache() -> None:
+    if not JUDGE_CACHE_PATH:
+        return
+    os.makedirs(os.path.dirname(JUDGE_CACHE_PATH) or ".", exist_ok=True)
+    tmp_path = f"{JUDGE_CACHE_PATH}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(_judge_cache, f, indent=1)
+    os.replace(tmp_path, JUDGE_CACHE_PATH)
+
+
+async def llm_evaluate_case(case: Dict[str, object], replies: List[str]) -> Dict[str, object]:
     transcript_lines = []
     for idx, (user_text, bot_text) in enumerate(zip(case["turns"], replies), 1):
         transcript_lines.append(f"User {idx}: {user_text}")
@@ -603,53 +838,171 @@ def llm_evaluate_case(case: Dict[str, object], replies: List[str]) -> Dict[str,
         f"Expectation: {case['expectation']}\n"
         f"Transcript:\n{transcript}"
     )
+    key = hashlib.sha256(json.dumps([EVAL_MODEL, EVAL_SYSTEM_PROMPT, user_prompt]).encode("utf-8")).hexdigest()
+    cache = _load_judge_cache()
+    if key in cache:
+        judge_stats["cached"] += 1
+        return json.loads(json.dumps(cache[key]))  # a copy: callers add measured scores
     messages = [
         SystemMessage(content=EVAL_SYSTEM_PROMPT),
         HumanMessage(content=user_prompt),
     ]
-    response = EVAL_LLM.invoke(messages)
+    # The judge's tokens are ours too, but not the bot's: kept out of the case's usage
+    with usage.route("judge", per_turn=False):
+        response = await EVAL_LLM.ainvoke(messages, config={"callbacks": usage.callbacks()})
     data = _extract_json(response.content or "")
+    judge_stats["graded"] += 1
+    if data:  # an unparseable verdict is asked for again next run
+        cache[key] = json.loads(json.dumps(data))
+        _save_judge_cache()
     return data
 
+def cost_efficiency_score(cost_usd: float) -> int:
+    return BAND_SCORES[bisect.bisect_right(COST_BANDS_USD, cost_usd)]
+
+def speed_latency_score(p95_s: float) -> int:
+    return BAND_SCORES[bisect.bisect_right(LATENCY_BANDS_S, p95_s)]
+
+def _percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))] if ordered else 0.0
+
+def _latency_stats(seconds: List[float]) -> Dict[str, float]:
+    return {"p50": _percentile(seconds, 0.50), "p95": _percentile(seconds, 0.95), "max": max(seconds, default=0.0)}
+
 def _average_score(scores: Dict[str, object]) -> int:
     numeric = [v for v in scores.values() if isinstance(v, (int, float))]
     if not numeric:
         return 0
     return int(round(sum(numeric) / len(numeric)))
 
-def run_cases(case_ids: List[str], llm_eval: bool) -> None:
+async def run_case(case: Dict[str, object], llm_eval: bool) -> Dict[str, object]:
+    """Play one case from a fresh session of its own user; replies, per-turn time and usage, measured scores
+    and (llm_eval) the judge's verdict."""
+    user_id = case["id"]
+    reset_user_state(user_id)
+    replies: List[str] = []
+    seconds: List[float] = []
+    turn_usage: List[usage.Usage] = []
+    spent = usage.Usage()
+    for text in case["turns"]:
+        with usage.turn() as turn_spent:
+            start = time.perf_counter()
+            replies.append(await send(user_id, text))
+            seconds.append(time.perf_counter() - start)
+        turn_usage.append(turn_spent)
+        spent.add(turn_spent)
+    latency = _latency_stats(seconds)
+    measured = {"cost_efficiency": cost_efficiency_score(spent.cost_usd)}
+    if LATENCY_MEASURED:
+        measured["speed_latency"] = speed_latency_score(latency["p95"])
+    result: Dict[str, object] = {
+        "replies": replies, "seconds": seconds, "turn_usage": turn_usage, "usage": spent,
+        "latency": latency, "measured": measured,
+    }
+    if llm_eval:
+        eval_result = await llm_evaluate_case(case, replies)
+        scores = eval_result.get("scores", {}) if isinstance(eval_result, dict) else {}
+        if isinstance(scores, dict):
+            scores.update(measured)
+        overall = eval_result.get("overall_score")
+        if not isinstance(overall, (int, float)):
+            overall = _average_score(scores if isinstance(scores, dict) else {})
+        result.update(scores=scores, overall=int(overall), notes=eval_result.get("notes"))
+    return result
+
+
+def start_cases(cases: List[Dict[str, object]], llm_eval: bool, jobs: int) -> List["asyncio.Task[Dict[str, object]]"]:
+    """Run the cases, at most `jobs` at a time (each has its own user); await the tasks in order for the report."""
+    slots = asyncio.Semaphore(max(1, jobs))
+
+    async def run(case: Dict[str, object]) -> Dict[str, object]:
+        async with slots:
+            return await run_case(case, llm_eval)
+
+    return [asyncio.create_task(run(case)) for case in cases]
+
+
+def latency_table(cases: List[Dict[str, object]], results: List[Dict[str, object]]) -> str:
+    """Markdown table of the measured per-turn latency and cost, per case and over all turns.
+
+    Without LATENCY_MEASURED (answers replayed from a cassette) the latency columns are left out.
+    """
+    if not LATENCY_MEASURED:
+        return _cost_table(cases, results)
+    lines = [
+        "| Case | Turns | p50 s | p95 s | max s | USD | speed_latency | cost_efficiency |",
+        "|---|---:|---:|---:|---:|---:|---:|---:|",
+    ]
+    for case, result in zip(cases, results):
+        lat, measured = result["latency"], result["measured"]
+        lines.append(f"| {case['id']} | {len(result['seconds'])} | {lat['p50']:.2f} | {lat['p95']:.2f} | "
+                     f"{lat['max']:.2f} | {result['usage'].cost_usd:.4f} | {measured['speed_latency']} | "
+                     f"{measured['cost_efficiency']} |")
+    seconds = [s for result in results for s in result["seconds"]]
+    if results:
+        lat = _latency_stats(seconds)
+        cost = sum(result["usage"].cost_usd for result in results)
+        lines.append(f"| **all** | {len(seconds)} | {lat['p50']:.2f} | {lat['p95']:.2f} | {lat['max']:.2f} | "
+                     f"{cost:.4f} | {speed_latency_score(lat['p95'])} | {cost_efficiency_score(cost / len(results))} |")
+    return "\n".join(lines)
+
+
+def _cost_table(cases: List[Dict[str, object]], results: List[Dict[str, object]]) -> str:
+    lines = ["| Case | Turns | USD | cost_efficiency |", "|---|---:|---:|---:|"]
+    for case, result in zip(cases, results):
+        lines.append(f"| {case['id']} | {len(result['seconds'])} | {result['usage'].cost_usd:.4f} | "
+                     f"{result['measured']['cost_efficiency']} |")
+    if results:
+        turns = sum(len(result["seconds"]) for result in results)
+        cost = sum(result["usage"].cost_usd for result in results)
+        lines.append(f"| **all** | {turns} | {cost:.4f} | {cost_efficiency_score(cost / len(results))} |")
+    return "\n".join(lines)
+
+
+def _latency_heading() -> str:
+    if LATENCY_MEASURED:
+        return "Latency per turn"
+    return "Cost per turn (latency not measured: OpenAI calls were replayed from a cassette)"
+
+
+def _judge_summary() -> str:
+    return f"Judge: {judge_stats['graded']} graded, {judge_stats['cached']} from cache"
+
+
+async def run_cases(case_ids: List[str], llm_eval: bool, jobs: int = 1) -> None:
     overall_scores: List[int] = []
-    for case in TEST_CASES:
-        if case_ids and case["id"] not in case_ids:
-            continue
-        user_id = case["id"]
-        reset_user_state(user_id)
+    results: List[Dict[str, object]] = []
+    cases = [case for case in TEST_CASES if not case_ids or case["id"] in case_ids]
+    for case, task in zip(cases, start_cases(cases, llm_eval, jobs)):
+        result = await task
+        results.append(result)
         print("\n" + "=" * 80)
         print(f"Case: {case['id']} - {case['title']}")
         print(f"Scenario: {case['scenario']}")
         print(f"Expectation: {case['expectation']}")
-        replies: List[str] = []
-        for i, text in enumerate(case["turns"], 1):
-            reply = send(user_id, text)
-            replies.append(reply)
+        turns = zip(case["turns"], result["replies"], result["seconds"], result["turn_usage"])
+        for i, (text, reply, seconds, spent) in enumerate(turns, 1):
             print(f"User {i}: {text}")
             print(f"Bot  {i}: {reply}")
+            print(f"       {f'{seconds:.2f}s, ' if LATENCY_MEASURED else ''}{spent}")
+        lat = result["latency"]
+        print(f"Usage: {result['usage']}")
+        if LATENCY_MEASURED:
+            print(f"Latency: p50 {lat['p50']:.2f}s, p95 {lat['p95']:.2f}s, max {lat['max']:.2f}s")
         if llm_eval:
-            eval_result = llm_evaluate_case(case, replies)
-            scores = eval_result.get("scores", {}) if isinstance(eval_result, dict) else {}
-            overall = eval_result.get("overall_score")
-            if not isinstance(overall, (int, float)):
-                overall = _average_score(scores if isinstance(scores, dict) else {})
-            overall_scores.append(int(overall))
-            print(f"LLM scores: {scores}")
-            print(f"LLM overall: {int(overall)}")
-            notes = eval_result.get("notes")
-            if notes:
-                print(f"LLM notes: {notes}")
+            overall_scores.append(result["overall"])
+            print(f"LLM scores: {result['scores']}")
+            print(f"LLM overall: {result['overall']}")
+            if result["notes"]:
+                print(f"LLM notes: {result['notes']}")
+    print("\n" + "=" * 80)
+    print(usage.format_report(usage.LEDGER.snapshot(top_users=0)))
+    print(f"\n{_latency_heading()} ({jobs} case(s) at a time):\n{latency_table(cases, results)}")
     if llm_eval and overall_scores:
         avg = int(round(sum(overall_scores) / len(overall_scores)))
-        print("\n" + "=" * 80)
         print(f"Average LLM overall: {avg}")
+        print(_judge_summary())
 
 
 def show_rubric() -> None:
@@ -660,7 +1013,8 @@ def show_rubric() -> None:
             print(f"  - {label}: {range_text}")
 
 
-def save_test_output(case_ids: List[str], llm_eval: bool, output_filename: str = "test_output.md") -> None:
+async def save_test_output(case_ids: List[str], llm_eval: bool, output_filename: str = "test_output.md",
+                           jobs: int = 1) -> None:
     """Save complete test output to a markdown file in docs directory."""
     import time
     import sys
@@ -669,18 +1023,24 @@ def save_test_output(case_ids: List[str], llm_eval: bool, output_filename: str =
     
     output_lines.append("# Test Case Results\n")
     output_lines.append(f"Generated: {time.strftime('%Y-%m-%d %H:%M:%S')}\n")
+    if CASSETTE_SOURCE:
+        output_lines.append(f"OpenAI calls: {CASSETTE_SOURCE}\n")
     output_lines.append("---\n")
     
     # Filter cases to run
     cases_to_run = [case for case in TEST_CASES if not case_ids or case["id"] in case_ids]
     total_cases = len(cases_to_run)
     
-    for idx, case in enumerate(cases_to_run, 1):
-        user_id = case["id"]
-        reset_user_state(user_id)
+    # Cases run up to `jobs` at a time, but are written in TEST_CASES order
+    results: List[Dict[str, object]] = []
+    tasks = start_cases(cases_to_run, llm_eval, jobs)
+    for idx, (case, task) in enumerate(zip(cases_to_run, tasks), 1):
+        result = await task
+        results.append(result)
         
         # Progress indicator
-        print(f"\n[{idx}/{total_cases}] Processing: {case['id']} - {case['title']}")
+        score = f" Score: {result['overall']}/100" if llm_eval else ""
+        print(f"[{idx}/{total_cases}] Done: {case['id']} - {case['title']}.{score}")
         sys.stdout.flush()
         
         output_lines.append(f"\n## {case['id']}: {case['title']}\n")
@@ -688,38 +1048,43 @@ def save_test_output(case_ids: List[str], llm_eval: bool, output_filename: str =
         output_lines.append(f"**Expectation:** {case['expectation']}\n")
         output_lines.append("\n### Transcript\n")
         
-        replies: List[str] = []
-        for i, text in enumerate(case["turns"], 1):
-            reply = send(user_id, text)
-            replies.append(reply)
+        turns = zip(case["turns"], result["replies"], result["seconds"], result["turn_usage"])
+        for i, (text, reply, seconds, spent) in enumerate(turns, 1):
             output_lines.append(f"\n**User {i}:** {text}\n")
             output_lines.append(f"**Bot {i}:** {reply}\n")
+            output_lines.append(f"*{f'{seconds:.2f}s, ' if LATENCY_MEASURED else ''}{spent}*\n")
+        lat = result["latency"]
+        output_lines.append(f"\n**Usage:** {result['usage']}\n")
+        if LATENCY_MEASURED:
+            output_lines.append(f"**Latency:** p50 {lat['p50']:.2f}s, p95 {lat['p95']:.2f}s, max {lat['max']:.2f}s\n")
         
         if llm_eval:
-            print(f"  Evaluating with LLM...", end="", flush=True)
-            eval_result = llm_evaluate_case(case, replies)
-            scores = eval_result.get("scores", {}) if isinstance(eval_result, dict) else {}
-            overall = eval_result.get("overall_score")
-            if not isinstance(overall, (int, float)):
-                overall = _average_score(scores if isinstance(scores, dict) else {})
-            overall_scores.append(int(overall))
-            print(f" Done! Score: {int(overall)}/100")
+            scores = result["scores"]
+            overall_scores.append(result["overall"])
             
             output_lines.append(f"\n### Evaluation Results\n")
-            output_lines.append(f"**Overall Score:** {int(overall)}/100\n")
+            output_lines.append(f"**Overall Score:** {result['overall']}/100\n")
             if isinstance(scores, dict):
                 output_lines.append(f"\n**Scores:**\n")
                 for key, value in scores.items():
                     output_lines.append(f"- {key}: {value}\n")
-            notes = eval_result.get("notes")
-            if notes:
-                output_lines.append(f"\n**Notes:** {notes}\n")
+            if result["notes"]:
+                output_lines.append(f"\n**Notes:** {result['notes']}\n")
     
+    output_lines.append(f"\n---\n")
+    output_lines.append(f"## Summary\n")
     if llm_eval and overall_scores:
         avg = int(round(sum(overall_scores) / len(overall_scores)))
-        output_lines.append(f"\n---\n")
-        output_lines.append(f"## Summary\n")
         output_lines.append(f"**Average LLM Overall Score:** {avg}/100\n")
+        print(_judge_summary())
+    if LATENCY_MEASURED:
+        output_lines.append(f"\n**Latency per turn** (send() wall time, {jobs} case(s) at a time; scores per "
+                            f"SCORE_RUBRIC from the p95 and the case's cost):\n")
+    else:
+        output_lines.append(f"\n**{_latency_heading()}**:\n")
+    output_lines.append(f"\n{latency_table(cases_to_run, results)}\n")
+    output_lines.append(f"\n**Token usage** (judge = the evaluator's own calls):\n")
+    output_lines.append(f"\n```\n{usage.format_report(usage.LEDGER.snapshot(top_users=0))}\n```\n")
     
     # Create docs directory if it doesn't exist
     docs_dir = os.path.join(os.getcwd(), "docs")
@@ -735,26 +1100,50 @@ def save_test_output(case_ids: List[str], llm_eval: bool, output_filename: str =
 
 
 def main() -> None:
+    global JUDGE_CACHE_PATH
     parser = argparse.ArgumentParser(description="Run Jetset chatbot test cases.")
     parser.add_argument("--list", action="store_true", help="List available test cases.")
     parser.add_argument("--only", nargs="*", default=[], help="Run only specific case IDs.")
     parser.add_argument("--llm-eval", action="store_true", help="Evaluate test cases with the LLM.")
     parser.add_argument("--show-rubric", action="store_true", help="Print the scoring rubric.")
     parser.add_argument("--save", type=str, nargs="?", const="test_output.md", help="Save test output to docs file.")
+    parser.add_argument("--check-pricing", action="store_true", help="Run the offline price regression table and exit.")
+    cassette = parser.add_mutually_exclusive_group()
+    cassette.add_argument("--record", nargs="?", const=CASSETTE_PATH, metavar="CASSETTE",
+                          help=f"Record OpenAI calls the cassette lacks (default {CASSETTE_PATH}).")
+    cassette.add_argument("--replay", nargs="?", const=CASSETTE_PATH, metavar="CASSETTE",
+                          help="Serve every OpenAI call from the cassette; offline, a missing call fails.")
+    parser.add_argument("--jobs", type=int, default=1, help="Run up to N cases concurrently (report order is kept).")
+    parser.add_argument("--no-judge-cache", action="store_true", help="Re-grade every transcript with the judge.")
     args = parser.parse_args()
 
     if args.list:
         list_cases()
         return
 
+    if args.check_pricing:
+        raise SystemExit(0 if check_pricing() else 1)
+
+    if args.no_judge_cache:
+        JUDGE_CACHE_PATH = ""
+    state = use_cassette(args.record or args.replay, record=bool(args.record)) if args.record or args.replay else None
+
+    start = time.perf_counter()
     if args.save:
-        save_test_output(args.only, args.llm_eval, args.save)
+        asyncio.run(save_test_output(args.only, args.llm_eval, args.save, args.jobs))
     else:
-        run_cases(args.only, args.llm_eval)
+        asyncio.run(run_cases(args.only, args.llm_eval, args.jobs))
+    print(f"\nFinished in {time.perf_counter() - start:.2f}s")
     
     if args.show_rubric:
         show_rubric()
 
+    if state is not None:
+        totals = state.totals
+        print(f"Cassette: {totals['replayed']} replayed, {totals['forwarded']} recorded, {totals['missed']} missing")
+        if totals["missed"]:
+            raise SystemExit(f"{totals['missed']} calls are not in the cassette; re-record it with --record")
+
 
 if __name__ == "__main__":
     main()